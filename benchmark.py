@@ -0,0 +1,408 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import subprocess
+import statistics
+import tempfile
+import configs
+import fact_store
+import facts_to_add
+import helper_functions
+import llm_scheduler
+import mock_llm_server
+import mock_sheets
+import sheets_session
+
+# ru_maxrss is only available on Unix; without it peak memory is not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(REPO_DIR, "outputs", "benchmarks", "results.jsonl")
+# Read-only inputs the pipeline opens relative to the working directory
+LINKED_DIRS = ["KS_facts", "grading_prompts", "fact_generator_prompts"]
+STAGES = ["main", "fact_inputs", "consolidation", "finalize"]
+# A "- id: statement" line as used in the fact list prompts
+FACT_LINE = re.compile(r"^-?\s*([A-Za-z]_\w+):\s*(.+)$", re.MULTILINE)
+
+def get_prompt_text(request):
+    """Text of the last user message of a messages or chat completion request."""
+    content = request.get("messages", [{}])[-1].get("content", "")
+    if isinstance(content, list):
+        content = "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content
+
+def benchmark_text_responder(request):
+    """
+    Plain-text answers for the mock server shaped like the real ones, so the text-parsing paths
+    (redundancy verdicts, consolidation and refined_facts extraction) do real work in a benchmark.
+    """
+    prompt = get_prompt_text(request)
+    if '"verdicts"' in prompt:
+        new_facts = prompt.split("NEW FACTS (ID: statement):", 1)[-1].split("\n\n", 1)[0]
+        verdicts = [
+            {"fact_id": fact_id, "is_redundant": False, "reasoning": "Adds distinct information."}
+            for fact_id, _ in FACT_LINE.findall(new_facts)
+        ]
+        return json.dumps({"verdicts": verdicts})
+    if '"is_redundant"' in prompt:
+        return json.dumps({"is_redundant": False, "reasoning": "Adds distinct information."})
+
+    if "OUTPUT STRUCTURE:\n<refined_facts>" in prompt:
+        # Consolidation prompt 2: every evaluated fact is kept as its own consolidated fact
+        consolidated = [
+            {"statement": statement, "source_ids": [fact_id]}
+            for fact_id, statement in FACT_LINE.findall(prompt.rsplit("<fact_list>", 1)[-1])
+        ]
+        return f"<refined_facts>\n{json.dumps(consolidated)}\n</refined_facts>\n<explanations>\n{{}}\n</explanations>"
+
+    facts = [(fact_id, statement.lstrip(": ")) for fact_id, statement in FACT_LINE.findall(prompt)]
+    consolidated = facts_to_add.parse_consolidated_facts(prompt)
+    if consolidated:
+        facts = [(fact["source_ids"][0] if fact["source_ids"] else "r_0", fact["statement"]) for fact in consolidated]
+    if '"refined_facts"' in prompt:
+        # Keep about four in five facts, as a refinement pass that drops redundancies would
+        refined = [{"id": fact_id, "fact": statement} for index, (fact_id, statement) in enumerate(facts) if index % 5]
+        return json.dumps({
+            "fact_analysis": "Benchmark analysis.",
+            "refined_facts": refined,
+            "change_explanation": "Dropped every fifth fact."
+        })
+    if facts:
+        return "\n".join(f"{fact_id}: {statement}" for fact_id, statement in facts)
+    return None
+
+def percentile_summary(values):
+    """(p50, p95) of a list of numbers, or (None, None) if it is empty."""
+    if not values:
+        return None, None
+    if len(values) == 1:
+        return values[0], values[0]
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return quantiles[49], quantiles[94]
+
+def get_peak_rss_mb():
+    """Peak resident memory of this process in MB (None where the resource module is unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def sample_statements(store, units, rng, count):
+    """count random fact statements drawn from the given units."""
+    facts = [fact for unit in units for fact in store.get_unit_facts(str(unit))]
+    return [fact["statement"] for fact in rng.sample(facts, min(count, len(facts)))]
+
+def seed_main(spreadsheet, store, units, rng, options):
+    """Inputs sheet with options['questions'] questions cycling through SAQs, LEQs and DBQs."""
+    rows = [["ID", "Question Type", "Units", "Formatted FRQ"]]
+    question_types = ["SAQs", "LEQs", "DBQs"]
+    for index in range(options["questions"]):
+        question_type = question_types[index % len(question_types)]
+        question_units = sorted(rng.sample(units, 1 if question_type == "SAQs" else min(2, len(units))))
+        statements = sample_statements(store, question_units, rng, 2)
+        question = "Explain the historical significance of the following. " + " ".join(statements)
+        rows.append([f"bench-{index:05d}", question_type, "".join(str(unit) for unit in question_units), question])
+    spreadsheet.seed(configs.event["google_sheet"]["input_sheet_name"], rows)
+    for sheet_name in [configs.event["google_sheet"]["frq_output_sheet_name"]] + [
+        helper_functions.get_grading_sheet_name(question_type) for question_type in configs.grading_outputs
+    ]:
+        spreadsheet.seed(sheet_name)
+    return options["questions"]
+
+def seed_fact_inputs(spreadsheet, store, units, rng, options):
+    """Fact Inputs sheet with options['fact_inputs'] passages built from KS_facts statements."""
+    rows = [["Topic", "Text", "Curriculum"]]
+    for index in range(options["fact_inputs"]):
+        unit = rng.choice(units)
+        rows.append([f"Topic {index}", " ".join(sample_statements(store, [unit], rng, 6)), f"Unit {unit}"])
+    spreadsheet.seed("Fact Inputs", rows)
+    spreadsheet.seed("Fact Outputs")
+    return options["fact_inputs"]
+
+def seed_consolidation(spreadsheet, store, units, rng, options):
+    """Fact Outputs sheet with options['facts'] extracted facts spread over a few curricula."""
+    rows = [["Topic", "Text", "Fact ID", "Fact Statement", "Curriculum"]]
+    curricula = [f"Unit {unit}" for unit in units[:3]]
+    for index in range(options["facts"]):
+        curriculum = curricula[index % len(curricula)]
+        statement = sample_statements(store, [curriculum.split()[-1]], rng, 1)[0]
+        rows.append([f"Topic {index // 10}", "", f"a_b{index:05d}", statement, curriculum])
+    spreadsheet.seed("Fact Outputs", rows)
+    for sheet_name in ["Refined Facts", "Processed Fact IDs", "Consolidation Process"]:
+        spreadsheet.seed(sheet_name)
+    return options["facts"]
+
+def seed_finalize(spreadsheet, store, units, rng, options):
+    """
+    Refined Facts sheet with options['facts'] facts: a third are copies of existing KS_facts
+    statements (decided by the local prefilter), the rest splice two statements together so they
+    need a model verdict.
+    """
+    rows = [["Fact ID", "Curriculum", "Refined Fact Statement", "Unit"]]
+    for index in range(options["facts"]):
+        unit = rng.choice(units)
+        statement, other = sample_statements(store, [unit], rng, 2)
+        if index % 3:
+            words, other_words = statement.split(), other.split()
+            statement = " ".join(words[:len(words) // 2] + other_words[len(other_words) // 2:])
+        rows.append([f"a_b{index:05d}", f"Unit {unit}", statement, unit])
+    spreadsheet.seed("Refined Facts", rows)
+    return options["facts"]
+
+def count_rows(spreadsheet, sheet_names):
+    """Data rows (excluding the header) per worksheet, for checking that a stage produced output."""
+    counts = {}
+    for sheet_name in sheet_names:
+        worksheet = spreadsheet.worksheets.get(sheet_name)
+        counts[sheet_name] = max(0, len(worksheet.get_all_values()) - 1) if worksheet else 0
+    return counts
+
+def run_worker(stage, options, result_path):
+    """
+    Run one stage in this process against the mock servers and write its measurements to result_path.
+    The stage modules are imported here, after the parent has pointed the SDKs at the mock server.
+    """
+    configs.event["output_file"] = "benchmark_output.csv"
+    configs.event["resume"] = False
+    configs.event["pipeline_mode"] = options["pipeline_mode"]
+    configs.event["batch_mode"] = dict(configs.event.get("batch_mode", {}), enabled=options["batch_mode"], poll_interval=1)
+    if options.get("shard_tokens"):
+        configs.event["consolidation_sharding"] = dict(
+            configs.event.get("consolidation_sharding", {}), enabled=True, shard_tokens=options["shard_tokens"]
+        )
+
+    session = mock_sheets.InMemorySheetsSession(options["sheets_latency"])
+    for credentials_file in {configs.event["google_sheet"]["credentials_file"], "service_account.json"}:
+        sheets_session.register_session(credentials_file, session)
+    spreadsheet = session.spreadsheet(configs.event["google_sheet"]["spreadsheet_id"])
+
+    store = fact_store.get_fact_store()
+    store.refresh()
+    units = sorted(unit for unit, facts in store.facts_by_unit.items() if facts)
+    rng = random.Random(options["seed"])
+
+    if stage == "main":
+        import main
+        items = seed_main(spreadsheet, store, units, rng, options)
+        run = main.main
+        output_sheets = [configs.event["google_sheet"]["frq_output_sheet_name"]] + [
+            helper_functions.get_grading_sheet_name(question_type) for question_type in configs.grading_outputs
+        ]
+    elif stage == "fact_inputs":
+        items = seed_fact_inputs(spreadsheet, store, units, rng, options)
+        run = facts_to_add.process_fact_inputs
+        output_sheets = ["Fact Outputs"]
+    elif stage == "consolidation":
+        items = seed_consolidation(spreadsheet, store, units, rng, options)
+        run = facts_to_add.process_fact_consolidation
+        output_sheets = ["Refined Facts", "Processed Fact IDs"]
+    else:
+        import finalize_facts
+        items = seed_finalize(spreadsheet, store, units, rng, options)
+        run = finalize_facts.process_facts
+        output_sheets = ["Final Facts"]
+
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+
+    latencies = [
+        latency for stats in llm_scheduler.scheduler.call_stats.values() for latency in stats["latencies"]
+    ]
+    p50, p95 = percentile_summary(latencies)
+    llm_calls = sum(stats["calls"] for stats in llm_scheduler.scheduler.call_stats.values())
+    result = {
+        "stage": stage,
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(items / seconds, 3) if seconds else None,
+        "llm_calls": llm_calls,
+        "llm_calls_per_item": round(llm_calls / items, 3) if items else None,
+        "latency_p50": p50,
+        "latency_p95": p95,
+        "models": llm_scheduler.scheduler.call_report(),
+        "sheets_api_calls": session.api_calls(),
+        "peak_rss_mb": get_peak_rss_mb(),
+        "outputs": count_rows(spreadsheet, output_sheets)
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+def prepare_workdir():
+    """Temporary working directory with the read-only inputs linked in, so outputs never touch the repo's."""
+    workdir = tempfile.mkdtemp(prefix="ks-benchmark-")
+    for name in LINKED_DIRS:
+        os.symlink(os.path.join(REPO_DIR, name), os.path.join(workdir, name), target_is_directory=True)
+    return workdir
+
+def get_commit():
+    """Current git commit (with a '+dirty' suffix for uncommitted changes), or None outside a checkout."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return f"{commit}+dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_stage(stage, options, server, workdir):
+    """Run one stage in a fresh interpreter (so peak memory and module state are per stage) and collect its results."""
+    host, port = server.server_address[:2]
+    env = dict(
+        os.environ,
+        ANTHROPIC_BASE_URL=f"http://{host}:{port}",
+        OPENAI_BASE_URL=f"http://{host}:{port}/v1",
+        ANTHROPIC_API_KEY="benchmark",
+        OPENAI_API_KEY="benchmark"
+    )
+    result_path = os.path.join(workdir, f"{stage}.result.json")
+    log_path = os.path.join(workdir, f"{stage}.log")
+    before = server.state.snapshot()
+    with open(log_path, "w", encoding="utf-8") as log:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", stage, "--options", json.dumps(options), "--result", result_path],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT, check=True
+        )
+    after = server.state.snapshot()
+
+    with open(result_path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    requests = {name: after[name] - before.get(name, 0) for name in after if after[name] != before.get(name, 0)}
+    result["http_requests"] = sum(count for name, count in requests.items() if name.startswith("POST") and not name.endswith("429"))
+    result["rate_limited"] = sum(count for name, count in requests.items() if name.endswith("429"))
+    result["log"] = log_path
+    return result
+
+def load_previous(params):
+    """The most recent saved benchmark run with the same parameters, or None."""
+    if not os.path.exists(RESULTS_PATH):
+        return None
+    previous = None
+    with open(RESULTS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("params") == params:
+                previous = record
+    return previous
+
+def format_change(value, previous_value):
+    if value is None or not previous_value:
+        return ""
+    return f" ({(value - previous_value) / previous_value:+.1%})"
+
+def report(record, previous):
+    """Log each stage's numbers, with the change from the previous run with the same parameters."""
+    if previous:
+        logging.info(f"Comparing with run {previous['commit']} from {previous['timestamp']}")
+    for stage, result in record["stages"].items():
+        before = (previous or {}).get("stages", {}).get(stage, {})
+        p50 = result["latency_p50"]
+        p95 = result["latency_p95"]
+        logging.info(
+            f"{stage}: {result['items']} items in {result['seconds']:.2f}s, "
+            f"{result['items_per_second']:.2f} items/s{format_change(result['items_per_second'], before.get('items_per_second'))}, "
+            f"LLM latency p50 {p50 or 0:.3f}s{format_change(p50, before.get('latency_p50'))} "
+            f"p95 {p95 or 0:.3f}s{format_change(p95, before.get('latency_p95'))}, "
+            f"{result['llm_calls_per_item']} LLM calls/item{format_change(result['llm_calls_per_item'], before.get('llm_calls_per_item'))}, "
+            f"{result['rate_limited']} rate limited, {result['sheets_api_calls']} Sheets calls, "
+            f"peak RSS {result['peak_rss_mb']} MB{format_change(result['peak_rss_mb'], before.get('peak_rss_mb'))}, "
+            f"outputs {result['outputs']}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against local LLM and Sheets stand-ins")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--questions", type=int, default=60, help="Questions for the main stage")
+    parser.add_argument("--fact-inputs", type=int, default=20, help="Passages for the fact_inputs stage")
+    parser.add_argument("--facts", type=int, default=120, help="Facts for the consolidation and finalize stages")
+    parser.add_argument("--latency-median", type=float, default=0.2, help="Median LLM response latency in seconds")
+    parser.add_argument("--latency-p95", type=float, default=0.8, help="95th percentile LLM response latency in seconds")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.02, help="Share of LLM requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="retry-after of injected 429s in seconds")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="Latency of each Sheets API call in seconds")
+    parser.add_argument("--pipeline-mode", default=None, help="Override configs.event['pipeline_mode'] for the main stage")
+    parser.add_argument("--shard-tokens", type=int, default=None, help="Enable consolidation sharding with this shard size in tokens")
+    parser.add_argument("--batch-mode", action="store_true", help="Use the batch APIs (answered after --batch-delay)")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="Seconds until a mock batch ends")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--label", default="", help="Free-form note stored with the results")
+    parser.add_argument("--no-save", action="store_true", help=f"Do not append the results to {RESULTS_PATH}")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--options", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        logging.getLogger().setLevel(logging.WARNING)
+        run_worker(args.worker, json.loads(args.options), args.result)
+        return
+
+    options = {
+        "questions": args.questions,
+        "fact_inputs": args.fact_inputs,
+        "facts": args.facts,
+        "latency_median": args.latency_median,
+        "latency_p95": args.latency_p95,
+        "rate_limit_ratio": args.rate_limit_ratio,
+        "sheets_latency": args.sheets_latency,
+        "pipeline_mode": args.pipeline_mode or configs.event.get("pipeline_mode", "staged"),
+        "batch_mode": args.batch_mode,
+        "shard_tokens": args.shard_tokens,
+        "seed": args.seed
+    }
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    server = mock_llm_server.start_server(
+        batch_delay=args.batch_delay,
+        latency=mock_llm_server.LatencyModel(args.latency_median, args.latency_p95, seed=args.seed),
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        text_responder=benchmark_text_responder,
+        seed=args.seed
+    )
+    workdir = prepare_workdir()
+    logging.info(f"Benchmarking {', '.join(stages)} in {workdir}")
+
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": get_commit(),
+        "label": args.label,
+        "params": options,
+        "stages": {}
+    }
+    try:
+        for stage in stages:
+            logging.info(f"Running {stage}")
+            record["stages"][stage] = run_stage(stage, options, server, workdir)
+    finally:
+        server.shutdown()
+
+    report(record, load_previous(options))
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        logging.info(f"Results appended to {RESULTS_PATH}")
+
+if __name__ == "__main__":
+    main()
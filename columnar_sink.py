@@ -0,0 +1,184 @@
+import os
+import csv
+import time
+import logging
+import itertools
+import configs
+
+# pyarrow is optional; without it the columnar output is skipped and only the CSVs are written
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Low-cardinality columns stored as dictionaries (one small index per row instead of the string)
+DICTIONARY_COLUMNS = {"Question Type", "Unit"}
+
+def build_schema(headers):
+    """
+    Arrow schema for a CSV header list: every '... Score' column is int16, Question Type and Unit
+    are dictionary-encoded, and everything else (including Raw JSON) is a plain string column.
+    """
+    fields = []
+    for header in headers:
+        if header in DICTIONARY_COLUMNS:
+            field_type = pa.dictionary(pa.int32(), pa.string())
+        elif header.endswith("Score"):
+            field_type = pa.int16()
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(header, field_type))
+    return pa.schema(fields)
+
+def to_int(value):
+    """Scores as integers; anything unparseable is stored as null rather than failing the row."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Distinguishes part files created by one process within the same second (e.g. a rebuild and the run's own part)
+_part_numbers = itertools.count()
+
+class ParquetMirror:
+    """
+    Parquet copy of one output CSV.
+    Registered on the CSV sink, so it receives the same rows on the same writer thread. Rows are
+    buffered per column and written as row groups of row_group_rows; every run writes its own
+    part file into the output's directory, which pyarrow reads back as one dataset.
+    The file's footer is written on close, so the part is written as part-*.parquet.tmp and only
+    renamed to its final name once it is complete; a crashed run leaves just the .tmp file.
+    """
+    def __init__(self, directory, headers, row_group_rows=10000):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(
+            directory, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_part_numbers)}.parquet"
+        )
+        self.temp_path = self.path + ".tmp"
+        self.schema = build_schema(headers)
+        self.row_group_rows = row_group_rows
+        self.columns = [[] for _ in headers]
+        self.rows = 0
+        self.writer = None
+
+    def append(self, row):
+        for column, field, value in zip(self.columns, self.schema, row):
+            if pa.types.is_integer(field.type):
+                column.append(to_int(value))
+            else:
+                column.append(None if value is None else str(value))
+        self.rows += 1
+        if self.rows >= self.row_group_rows:
+            self.write_row_group()
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        arrays = []
+        for column, field in zip(self.columns, self.schema):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(column, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(column, type=field.type))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.temp_path, self.schema, compression="zstd")
+        self.writer.write_table(table)
+        self.columns = [[] for _ in self.columns]
+        self.rows = 0
+
+    def close(self):
+        self.write_row_group()
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.temp_path, self.path)
+            logging.info(f"Wrote Parquet output {self.path}")
+
+def count_csv_rows(path):
+    """Number of data rows in a CSV (0 if it does not exist)."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return sum(1 for row in reader if row)
+
+def list_parts(directory, suffix=".parquet"):
+    """Paths of a columnar output directory's part files with the given suffix."""
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+        if filename.startswith("part-") and filename.endswith(suffix)
+    ]
+
+def clear_parts(directory, suffix=".parquet"):
+    """Remove the part files (or, with suffix='.parquet.tmp', the unfinished ones) of a columnar output directory."""
+    paths = list_parts(directory, suffix)
+    for path in paths:
+        os.remove(path)
+    if paths:
+        logging.info(f"Removed {len(paths)} {suffix} part files from {directory}")
+
+def count_part_rows(directory):
+    """Rows in a directory's finished part files, or None if one of them cannot be read."""
+    try:
+        return sum(pq.read_metadata(path).num_rows for path in list_parts(directory))
+    except Exception as e:
+        logging.warning(f"Could not read Parquet part metadata in {directory}: {str(e)}")
+        return None
+
+def rebuild_from_csv(path, directory, headers, row_group_rows=10000):
+    """Replace a directory's part files with one part holding every row of the CSV."""
+    clear_parts(directory)
+    mirror = ParquetMirror(directory, headers, row_group_rows)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if row:
+                mirror.append(row)
+    mirror.close()
+
+def attach_to_sink(sink, outputs):
+    """
+    Mirror CSV outputs to Parquet when configs.event["columnar_output"] is enabled.
+    outputs maps each CSV path to its header list; each gets a directory named after the CSV,
+    e.g. outputs/parquet/saq_graded/. Call it after setup_output_files so the mirror starts in step
+    with each CSV: unfinished parts of crashed runs are removed, a CSV that was just (re)created has
+    its earlier parts removed, and a kept CSV (resume) whose row count differs from its parts has
+    the parts rebuilt from it.
+    """
+    settings = configs.event.get("columnar_output", {})
+    if not settings.get("enabled", False):
+        return
+    if pa is None:
+        logging.warning("Columnar output is enabled but pyarrow is not installed; writing CSV only")
+        return
+
+    for path, headers in outputs.items():
+        stem = os.path.splitext(os.path.basename(path))[0]
+        directory = os.path.join(settings.get("directory", os.path.join("outputs", "parquet")), stem)
+        row_group_rows = settings.get("row_group_rows", 10000)
+        clear_parts(directory, ".parquet.tmp")
+        csv_rows = count_csv_rows(path)
+        if not csv_rows:
+            clear_parts(directory)
+        else:
+            part_rows = count_part_rows(directory)
+            if part_rows != csv_rows:
+                logging.warning(f"Parquet mirror of {path} has {part_rows} rows but the CSV has {csv_rows}; rebuilding it")
+                rebuild_from_csv(path, directory, headers, row_group_rows)
+        sink.add_mirror(path, ParquetMirror(directory, headers, row_group_rows))
+        logging.info(f"Mirroring {path} to Parquet in {directory}")
+
+def read_results(directory, columns=None):
+    """Read every finished part file of a columnar output directory as one Arrow table."""
+    if pq is None:
+        raise ImportError("pyarrow is required to read columnar output")
+    paths = list_parts(directory)
+    if not paths:
+        raise FileNotFoundError(f"No Parquet part files in {directory}")
+    return pq.ParquetDataset(paths).read(columns=columns)
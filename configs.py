@@ -8,6 +8,91 @@ event = {
     "openai_api_key": os.getenv("OPENAI_API_KEY"),
     "anthropic_api_key": os.getenv("ANTHROPIC_API_KEY"),
     "output_file": "test_output.csv",
+    # Resume from the run journal instead of starting over (skips generated/graded/synced work)
+    "resume": False,
+    # "staged": generate everything, sync, then grade; "streaming" (opt-in): grade each response as soon
+    # as it is generated, sync sheets in the background and grade from the local CSV
+    "pipeline_mode": "staged",
+    "sheet_sync_interval": 30,
+    "finalize_concurrency": 8,
+    # Fact Inputs passages sent to Claude at once by facts_to_add.process_fact_inputs
+    "fact_extraction_concurrency": 8,
+    # Curricula whose consolidation chains (three o1 calls each) run at once
+    "consolidation_concurrency": 4,
+    # Map-reduce consolidation for large curricula: fact lists over shard_tokens are split into
+    # shards consolidated in parallel, then merged with cross-shard near-duplicates folded together.
+    # Opt-in (set enabled to True), since it changes the Refined Facts of curricula over shard_tokens
+    "consolidation_sharding": {
+        "enabled": False,
+        "shard_tokens": 20000,
+        "shard_concurrency": 4,
+        "duplicate_threshold": 0.9,
+    },
+    # Background log of the fact pipeline's prompt inputs/outputs (Consolidation Process sheet);
+    # values over spill_chars are gzipped to directory and the cell links to the file
+    "process_log": {
+        "sheet_name": "Consolidation Process",
+        "directory": "outputs/process_log",
+        "spill_chars": 20000,
+        "flush_rows": 50,
+        "flush_interval": 10,
+    },
+    # New facts from the same unit judged per redundancy request (1 = one request per fact, the
+    # original path). Larger batches change the o1 prompt, so raise it only once batched verdicts
+    # have been shown to match per-fact ones
+    "redundancy_batch_size": 1,
+    # Local TF-IDF prefilter for redundancy checks: only the top_k most similar facts are sent to the
+    # model, and matches at or above duplicate_threshold are marked redundant without an LLM call.
+    # Off until its verdicts have been validated against the o1 ones, since it changes Final Facts
+    "redundancy_prefilter": {
+        "enabled": False,
+        "top_k": 25,
+        "duplicate_threshold": 0.95,
+    },
+    # Retrieval-scoped fact context for FRQ generation: facts of the question's units are ranked
+    # against the question text and only the best ones within the type's token budget are sent.
+    # Off by default: it changes which facts answers can cite, so check write_recall_report first
+    "fact_retrieval": {
+        "enabled": False,
+        "token_budget": {
+            "SAQs": 4000,
+            "LEQs": 8000,
+            "DBQs": 8000,
+            "default": 8000,
+        },
+    },
+    # Offline batch mode: grading and fact metadata go through the providers' batch APIs
+    # (half price, results within 24h) instead of online requests; forces the staged pipeline
+    "batch_mode": {
+        "enabled": False,
+        "poll_interval": 60,
+        "max_requests_per_batch": 10000,
+    },
+    # Parquet copy of the FRQ and grading CSVs (typed scores, dictionary-encoded type/unit);
+    # needs the optional pyarrow package
+    "columnar_output": {
+        "enabled": False,
+        "directory": "outputs/parquet",
+        "row_group_rows": 10000,
+    },
+    "frq_concurrency": 32,
+    "grading_concurrency": 16,
+    "rate_limit_headroom": 0.9,
+    # On-disk LLM response cache; set bypass (or LLM_CACHE_BYPASS=1) to force fresh calls
+    "llm_cache": {
+        "path": "outputs/llm_cache.sqlite3",
+        "max_bytes": 512 * 1024 * 1024,
+        "bypass": False,
+    },
+    # New fact IDs are checked against KS_facts, these sheets and the ledger of every ID handed out;
+    # IDs grow a character once the length's ID space would be more than max_load full
+    "fact_ids": {
+        "ledger": "outputs/fact_ids.txt",
+        "prefix": "a_",
+        "length": 4,
+        "max_load": 0.5,
+        "sheets": ["Fact Outputs", "Refined Facts", "Final Facts"],
+    },
     "google_sheet": {
         "credentials_file": "service_account.json",
         "spreadsheet_id": "1-a03Sr4BCTGh3aotYqvN_rrJt_gZYZNhaY5lMLHZDPw",
@@ -19,6 +104,14 @@ event = {
     },
 }
 
+# Provider quotas per model; set these to the limits of your account tier.
+# The scheduler in llm_scheduler.py keeps usage at rate_limit_headroom of these values.
+rate_limits = {
+    "o3-mini": {"requests_per_minute": 5000, "tokens_per_minute": 4000000},
+    "o1": {"requests_per_minute": 500, "tokens_per_minute": 800000},
+    "claude-3-5-sonnet-20241022": {"requests_per_minute": 4000, "tokens_per_minute": 400000},
+    "default": {"requests_per_minute": 500, "tokens_per_minute": 200000},
+}
 
 openai_tools = {
     "SAQs": {
@@ -205,6 +298,7 @@ anthropic_tools = {
                         "properties": {
                             "id": {
                                 "type": "string",
+                                "enum": ["a", "b", "c"],
                                 "description": "The identifier for the part, e.g., 'a', 'b', or 'c'.",
                             },
                             "name": {
@@ -269,6 +363,15 @@ anthropic_tools = {
                             },
                             "name": {
                                 "type": "string",
+                                "enum": [
+                                    "Thesis Construction",
+                                    "Contextualization",
+                                    "Document Use",
+                                    "DBQ Outside Evidence",
+                                    "Document Analysis",
+                                    "Historical Reasoning",
+                                    "DBQ Complexity",
+                                ],
                                 "description": "The skill assessed by this part.",
                             },
                             "score": {
@@ -320,6 +423,13 @@ anthropic_tools = {
                             },
                             "name": {
                                 "type": "string",
+                                "enum": [
+                                    "Thesis Construction",
+                                    "Contextualization",
+                                    "LEQ Outside Evidence",
+                                    "Historical Reasoning",
+                                    "LEQ Complexity",
+                                ],
                                 "description": "The skill assessed by this part. Must be either 'Thesis Construction', 'Contextualization', 'LEQ Outside Evidence', 'Historical Reasoning', or 'LEQ Complexity'.",
                             },
                             "score": {
@@ -343,3 +453,40 @@ anthropic_tools = {
         },
     },
 }
+
+# Grading output layout per question type: the CSV file and the score and evaluation column names of
+# each graded part. The parts themselves (and their column order) come from the enum of the subPart
+# id/name field in anthropic_tools; grade_writer refuses to start if the two disagree. A new question
+# type only needs entries here, in anthropic_tools and a grading prompt.
+grading_outputs = {
+    "SAQs": {
+        "file": "outputs/grading/saq_graded.csv",
+        "columns": {
+            "a": ["Part A Score", "Part A Evaluation"],
+            "b": ["Part B Score", "Part B Evaluation"],
+            "c": ["Part C Score", "Part C Evaluation"],
+        },
+    },
+    "LEQs": {
+        "file": "outputs/grading/leq_graded.csv",
+        "columns": {
+            "Thesis Construction": ["Thesis Construction Score", "Thesis Response Evaluation"],
+            "Contextualization": ["Contextualization Score", "Contextualization Response Evaluation"],
+            "LEQ Outside Evidence": ["LEQ Outside Evidence Score", "LEQ Outside Evidence Response Evaluation"],
+            "Historical Reasoning": ["Historical Reasoning Score", "Historical Reasoning Response Evaluation"],
+            "LEQ Complexity": ["LEQ Complexity Score", "LEQ Complexity Response Evaluation"],
+        },
+    },
+    "DBQs": {
+        "file": "outputs/grading/dbq_graded.csv",
+        "columns": {
+            "Thesis Construction": ["Thesis Construction Score", "Thesis Response Evaluation"],
+            "Contextualization": ["Contextualization Score", "Contextualization Response Evaluation"],
+            "Document Use": ["Document Use Score", "Document Use Response Evaluation"],
+            "DBQ Outside Evidence": ["DBQ Outside Evidence Score", "DBQ Outside Evidence Response Evaluation"],
+            "Document Analysis": ["Document Analysis Score", "Document Analysis Response Evaluation"],
+            "Historical Reasoning": ["Historical Reasoning Score", "Historical Reasoning Response Evaluation"],
+            "DBQ Complexity": ["DBQ Complexity Score", "DBQ Complexity Response Evaluation"],
+        },
+    },
+}
@@ -0,0 +1,148 @@
+import io
+import os
+import csv
+import time
+import queue
+import logging
+import threading
+
+class CSVSink:
+    """
+    Single writer thread that owns every output CSV.
+    Callers enqueue rows from any thread or coroutine; the writer keeps each file open, writes every
+    row with one write call (rows from different producers can never interleave), and flushes and
+    fsyncs a batch at a time. A row's on_commit callback runs only after its batch is on disk, so
+    run-journal marks never get ahead of the data.
+    Mirrors (e.g. columnar_sink.ParquetMirror) registered for a path receive the same rows on the
+    writer thread and are closed with the sink.
+    """
+    def __init__(self, flush_rows=200, flush_interval=1.0):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.files = {}
+        self.mirrors = {}
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="csv-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, path, row, on_commit=None):
+        """Queue a row for a CSV file; on_commit (optional) is called once the row is on disk."""
+        if self.closed:
+            raise RuntimeError("CSV sink is closed")
+        self.queue.put(("row", path, row, on_commit))
+
+    def add_mirror(self, path, mirror):
+        """Also hand every row written to path to mirror.append(row); mirror.close() runs on close."""
+        self.queue.put(("mirror", path, mirror))
+
+    def flush(self):
+        """Block until every row queued so far is on disk and its callbacks have run."""
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+
+    def close(self):
+        """Flush everything, close the files and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        done = threading.Event()
+        self.queue.put(("close", done))
+        done.wait()
+        self.thread.join()
+
+    def _file(self, path):
+        if path not in self.files:
+            self.files[path] = open(path, "a", newline="", encoding="utf-8")
+        return self.files[path]
+
+    def _write_row(self, path, row):
+        # Serialize first so the row reaches the file in a single write
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(row)
+        self._file(path).write(buffer.getvalue())
+
+    def _commit(self, dirty, callbacks):
+        """Flush and fsync the files written since the last commit, then run their callbacks."""
+        for path in dirty:
+            f = self.files[path]
+            f.flush()
+            os.fsync(f.fileno())
+        dirty.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"CSV sink commit callback failed: {str(e)}")
+        callbacks.clear()
+
+    def _run(self):
+        dirty = set()
+        callbacks = []
+        pending_rows = 0
+        last_commit = time.monotonic()
+        while True:
+            timeout = None
+            if dirty:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_commit))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ("tick",)
+
+            if item[0] == "row":
+                _, path, row, on_commit = item
+                try:
+                    self._write_row(path, row)
+                    dirty.add(path)
+                    pending_rows += 1
+                    if on_commit is not None:
+                        callbacks.append(on_commit)
+                    # Mirrors only get rows that reached the CSV
+                    for mirror in self.mirrors.get(path, []):
+                        try:
+                            mirror.append(row)
+                        except Exception as e:
+                            logging.error(f"Failed to mirror row for {path}: {str(e)}")
+                except Exception as e:
+                    # The row is lost, so its callback (e.g. a journal mark) must not run
+                    logging.error(f"Failed to write row to {path}: {str(e)}")
+            elif item[0] == "mirror":
+                self.mirrors.setdefault(item[1], []).append(item[2])
+
+            # Commit when the batch is full, the interval has passed, or a caller is waiting
+            due = pending_rows >= self.flush_rows or time.monotonic() - last_commit >= self.flush_interval
+            if item[0] in ("flush", "close") or (due and (dirty or callbacks)):
+                try:
+                    self._commit(dirty, callbacks)
+                except Exception as e:
+                    logging.error(f"Failed to flush CSV output: {str(e)}")
+                pending_rows = 0
+                last_commit = time.monotonic()
+
+            if item[0] == "flush":
+                item[1].set()
+            elif item[0] == "close":
+                for f in self.files.values():
+                    f.close()
+                self.files.clear()
+                for mirror in [mirror for mirrors in self.mirrors.values() for mirror in mirrors]:
+                    try:
+                        mirror.close()
+                    except Exception as e:
+                        logging.error(f"Failed to close output mirror: {str(e)}")
+                self.mirrors.clear()
+                item[1].set()
+                return
+
+_default_sink = None
+_default_sink_lock = threading.Lock()
+
+def get_sink():
+    """Return the process-wide CSVSink, starting its writer thread on first use."""
+    global _default_sink
+    with _default_sink_lock:
+        if _default_sink is None or _default_sink.closed:
+            _default_sink = CSVSink()
+        return _default_sink
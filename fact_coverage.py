@@ -0,0 +1,152 @@
+import os
+import sys
+import csv
+import json
+import logging
+import threading
+import configs
+import fact_store
+import helper_functions
+
+class FactCoverageIndex:
+    """
+    Incremental inverted index from KS_facts IDs to the questions whose responses cited them.
+    Every recorded response is appended to a JSONL log, so a later run (or a query from the command
+    line) loads the index from the log instead of rescanning the FRQ output. Recording a question
+    again replaces its earlier citations. Cited IDs that are not in KS_facts are tracked as
+    hallucinated, and re-checked whenever the FactStore reloads.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.citations = {}
+        self.question_facts = {}
+        self.question_units = {}
+        self.unknown_ids = set()
+        self.store_version = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        """Replay the log; the last entry for a question wins."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Ignoring unreadable line in fact coverage log {self.path}")
+                    continue
+                self._apply(entry["question_id"], entry["unit"], entry["fact_ids"])
+        logging.info(f"Loaded fact coverage for {len(self.question_facts)} questions from {self.path}")
+
+    def _apply(self, question_id, unit, fact_ids):
+        for fact_id in self.question_facts.get(question_id, ()):
+            cited_by = self.citations.get(fact_id)
+            if cited_by is not None:
+                cited_by.discard(question_id)
+                if not cited_by:
+                    del self.citations[fact_id]
+        self.question_facts[question_id] = set(fact_ids)
+        self.question_units[question_id] = unit
+        for fact_id in fact_ids:
+            self.citations.setdefault(fact_id, set()).add(question_id)
+        # Checked against KS_facts lazily in _refresh_unknown
+        self.store_version = None
+
+    def record(self, question_id, unit, fact_ids):
+        """Add (or replace) the facts cited by one question's response."""
+        question_id = str(question_id)
+        unit = str(unit)
+        fact_ids = sorted(set(fact_ids))
+        with self.lock:
+            self._apply(question_id, unit, fact_ids)
+            self.file.write(json.dumps({"question_id": question_id, "unit": unit, "fact_ids": fact_ids}) + "\n")
+            self.file.flush()
+
+    def _refresh_unknown(self):
+        """Recompute the hallucinated IDs if anything was recorded or KS_facts changed since the last check."""
+        store = fact_store.get_fact_store()
+        known_ids = store.all_fact_ids()
+        if self.store_version != store.version:
+            self.unknown_ids = set(self.citations) - known_ids
+            self.store_version = store.version
+
+    def cited_by(self, fact_id):
+        """Question IDs whose responses cited a fact."""
+        with self.lock:
+            return set(self.citations.get(fact_id, ()))
+
+    def usage_counts(self):
+        """{fact ID: number of questions citing it}."""
+        with self.lock:
+            return {fact_id: len(questions) for fact_id, questions in self.citations.items()}
+
+    def hallucinated(self):
+        """{unknown fact ID: question IDs that cited it} for IDs that are not in KS_facts."""
+        with self.lock:
+            self._refresh_unknown()
+            return {fact_id: set(self.citations[fact_id]) for fact_id in self.unknown_ids}
+
+    def unused_facts(self, unit_string):
+        """KS_facts IDs of one or more units (e.g. '5', '589') that no recorded response has cited."""
+        facts = fact_store.get_fact_store().get_unit_facts(unit_string)
+        with self.lock:
+            return [fact["id"] for fact in facts if fact["id"] not in self.citations]
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def get_coverage_path(output_file):
+    """Coverage log path for a given FRQ output file name, e.g. outputs/test_output.fact_coverage.jsonl."""
+    stem = os.path.splitext(os.path.basename(output_file))[0]
+    return os.path.join("outputs", f"{stem}.fact_coverage.jsonl")
+
+def build_from_output(index, frq_output_path):
+    """Seed an empty index from an existing FRQ output CSV (e.g. one written before the index existed)."""
+    with open(frq_output_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            index.record(row["Question ID"], row["Unit"], helper_functions.parse_facts_referenced(row["Facts Referenced"]))
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(output_file):
+    """Return the process-wide FactCoverageIndex for an FRQ output file."""
+    path = get_coverage_path(output_file)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = FactCoverageIndex(path)
+        return _indexes[path]
+
+if __name__ == "__main__":
+    # Usage: python fact_coverage.py unused <units> | hallucinated | cited <fact id> | rebuild
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    output_file = configs.event["output_file"]
+    command = sys.argv[1] if len(sys.argv) > 1 else "hallucinated"
+
+    if command == "rebuild":
+        path = get_coverage_path(output_file)
+        if os.path.exists(path):
+            os.remove(path)
+        index = get_index(output_file)
+        build_from_output(index, os.path.join("outputs", output_file))
+        logging.info(f"Rebuilt fact coverage for {len(index.question_facts)} questions")
+    elif command == "unused":
+        unused = get_index(output_file).unused_facts(sys.argv[2])
+        print(f"{len(unused)} facts in unit {sys.argv[2]} have never been cited")
+        print("\n".join(unused))
+    elif command == "cited":
+        print("\n".join(sorted(get_index(output_file).cited_by(sys.argv[2]))))
+    else:
+        for fact_id, questions in sorted(get_index(output_file).hallucinated().items()):
+            print(f"{fact_id}: {', '.join(sorted(questions))}")
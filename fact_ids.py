@@ -0,0 +1,132 @@
+import os
+import string
+import random
+import logging
+import threading
+import configs
+import fact_store
+import sheets_session
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: allocations are still unique within a process, but not across processes
+    fcntl = None
+
+ID_CHARACTERS = string.ascii_lowercase + string.ascii_uppercase + string.digits
+
+class FactIdAllocator:
+    """
+    Hands out fact IDs (e.g. 'a_67fI') that are guaranteed not to clash with any existing fact.
+    Known IDs are loaded once from KS_facts and the Fact ID column of the output sheets. Every
+    allocated ID is appended to a ledger file under an exclusive file lock, and each allocation
+    first reads what other processes appended since, so concurrent threads and processes never
+    hand out the same ID. IDs get one character longer whenever the current length's space
+    would be more than max_load full.
+    """
+    def __init__(self, ledger_path, prefix="a_", length=4, max_load=0.5, sheet_names=()):
+        self.ledger_path = ledger_path
+        self.prefix = prefix
+        self.length = length
+        self.max_load = max_load
+        self.sheet_names = list(sheet_names)
+        self.known = set()
+        self.loaded = False
+        self.ledger_offset = 0
+        self.random = random.SystemRandom()
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(ledger_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _load_sheet_ids(self):
+        """Fact IDs already written to the output sheets (sheets that are missing or unreadable are skipped)."""
+        google_sheet_info = configs.event.get("google_sheet")
+        if not google_sheet_info or not self.sheet_names:
+            return set()
+
+        session = sheets_session.get_session(google_sheet_info["credentials_file"])
+        ids = set()
+        for sheet_name in self.sheet_names:
+            try:
+                worksheet = session.worksheet(google_sheet_info["spreadsheet_id"], sheet_name)
+                headers = worksheet.row_values(1)
+                if "Fact ID" not in headers:
+                    continue
+                values = worksheet.col_values(headers.index("Fact ID") + 1)[1:]
+                ids.update(value.strip() for value in values if value.strip())
+            except Exception as e:
+                logging.warning(f"Could not read fact IDs from the {sheet_name} sheet: {str(e)}")
+        return ids
+
+    def _load(self):
+        self.known.update(fact_store.get_fact_store().all_fact_ids())
+        self.known.update(self._load_sheet_ids())
+        self.loaded = True
+        logging.info(f"Loaded {len(self.known)} known fact IDs")
+
+    def _read_ledger(self, f):
+        """Add the IDs appended to the ledger since the last read (by any process)."""
+        f.seek(self.ledger_offset)
+        for line in f:
+            line = line.strip()
+            if line:
+                self.known.add(line)
+        self.ledger_offset = f.tell()
+
+    def _id_length(self, count):
+        """Shortest length (at least self.length) whose ID space stays under max_load after count more IDs."""
+        length = self.length
+        while len(self.known) + count > self.max_load * len(ID_CHARACTERS) ** length:
+            length += 1
+        return length
+
+    def allocate(self, count=1):
+        """Reserve and return `count` new, unique fact IDs."""
+        if count <= 0:
+            return []
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            with open(self.ledger_path, "a+", encoding="utf-8") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    self._read_ledger(f)
+                    length = self._id_length(count)
+                    ids = []
+                    while len(ids) < count:
+                        fact_id = self.prefix + "".join(self.random.choice(ID_CHARACTERS) for _ in range(length))
+                        if fact_id not in self.known:
+                            self.known.add(fact_id)
+                            ids.append(fact_id)
+                    f.write("".join(f"{fact_id}\n" for fact_id in ids))
+                    f.flush()
+                    self.ledger_offset = f.tell()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            return ids
+
+_default_allocator = None
+_default_allocator_lock = threading.Lock()
+
+def get_allocator():
+    """Return the process-wide FactIdAllocator (configs.event["fact_ids"])."""
+    global _default_allocator
+    with _default_allocator_lock:
+        if _default_allocator is None:
+            settings = configs.event.get("fact_ids", {})
+            _default_allocator = FactIdAllocator(
+                settings.get("ledger", os.path.join("outputs", "fact_ids.txt")),
+                prefix=settings.get("prefix", "a_"),
+                length=settings.get("length", 4),
+                max_load=settings.get("max_load", 0.5),
+                sheet_names=settings.get("sheets", ["Fact Outputs", "Refined Facts", "Final Facts"])
+            )
+        return _default_allocator
+
+def allocate_fact_ids(count):
+    """Reserve `count` new fact IDs from the process-wide allocator."""
+    return get_allocator().allocate(count)
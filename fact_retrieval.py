@@ -0,0 +1,113 @@
+import os
+import csv
+import json
+import logging
+import configs
+import fact_similarity
+import llm_scheduler
+import helper_functions
+
+def get_token_budget(question_type):
+    """Fact context token budget for a question type (falls back to the 'default' entry)."""
+    budgets = configs.event.get("fact_retrieval", {}).get("token_budget", {})
+    return budgets.get(question_type, budgets.get("default", 8000))
+
+def retrieve_facts(question, question_type, unit_string):
+    """
+    Rank the facts of the question's units against the question text and keep the best ones that fit
+    the question type's token budget.
+    Returns the kept fact dicts in file order, so the prompt reads like the whole-unit dump minus the
+    facts that did not make the cut.
+    """
+    index = fact_similarity.get_unit_index(unit_string)
+    budget = get_token_budget(question_type)
+
+    kept = []
+    used_tokens = 0
+    for position, score in index.rank(question):
+        # Each fact is one line of "ID, Node Statement"
+        fact_tokens = llm_scheduler.estimate_tokens(index.facts[position]["text"]) + 1
+        if used_tokens + fact_tokens > budget:
+            break
+        kept.append(position)
+        used_tokens += fact_tokens
+
+    return [index.facts[position] for position in sorted(kept)]
+
+def get_fact_context(question, question_type, unit_string):
+    """
+    Fact block for the FRQ generation prompt.
+    With configs.event["fact_retrieval"] disabled this is the whole-unit dump, as before.
+    """
+    if not configs.event.get("fact_retrieval", {}).get("enabled", False):
+        return helper_functions.get_facts_for_unit(unit_string)
+
+    facts = retrieve_facts(question, question_type, unit_string)
+    if not facts:
+        raise FileNotFoundError(f"No facts found for any unit in {unit_string}")
+    return "\n".join(fact["text"] for fact in facts)
+
+def get_referenced_fact_ids(raw_json, question_type):
+    """Fact IDs cited in a generation tool call (the Raw JSON column of the FRQ output)."""
+    return helper_functions.get_cited_fact_ids(json.loads(raw_json), question_type)
+
+def write_recall_report(frq_output_path, report_path=None):
+    """
+    Recall report: for every response in an FRQ output CSV, which of its cited fact IDs the retrieval
+    stage would have kept. Run it against output generated from whole-unit context to see what the
+    token budgets would cost. Writes one row per question and logs recall per question type.
+    """
+    if report_path is None:
+        stem = os.path.splitext(os.path.basename(frq_output_path))[0]
+        report_path = os.path.join("outputs", f"{stem}.retrieval_recall.csv")
+
+    totals = {}
+    report_rows = []
+    with open(frq_output_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            question_type = row["Question Type"]
+            try:
+                referenced = set(get_referenced_fact_ids(row["Raw JSON"], question_type))
+            except (json.JSONDecodeError, AttributeError) as e:
+                logging.error(f"Skipping question ID {row['Question ID']}: unreadable Raw JSON ({str(e)})")
+                continue
+
+            kept_facts = retrieve_facts(row["Question"], question_type, row["Unit"])
+            kept_ids = {fact["id"] for fact in kept_facts}
+            hits = referenced & kept_ids
+            missed = referenced - kept_ids
+
+            report_rows.append([
+                row["Question ID"],
+                question_type,
+                row["Unit"],
+                len(kept_facts),
+                len(referenced),
+                len(hits),
+                f"{len(hits) / len(referenced):.3f}" if referenced else "",
+                ", ".join(sorted(missed))
+            ])
+            type_totals = totals.setdefault(question_type, [0, 0])
+            type_totals[0] += len(hits)
+            type_totals[1] += len(referenced)
+
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "Question ID", "Question Type", "Unit", "Facts Kept",
+            "Facts Referenced", "Referenced Facts Kept", "Recall", "Missed Fact IDs"
+        ])
+        writer.writerows(report_rows)
+
+    for question_type, (hits, referenced) in sorted(totals.items()):
+        recall = hits / referenced if referenced else 0.0
+        logging.info(
+            f"{question_type}: retrieval kept {hits}/{referenced} referenced facts "
+            f"(recall {recall:.1%}, budget {get_token_budget(question_type)} tokens)"
+        )
+    logging.info(f"Wrote retrieval recall report for {len(report_rows)} questions to {report_path}")
+    return report_path
+
+if __name__ == "__main__":
+    write_recall_report(os.path.join("outputs", configs.event["output_file"]))
@@ -0,0 +1,143 @@
+import re
+import threading
+import numpy as np
+import fact_store
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it", "its",
+    "of", "on", "or", "that", "the", "their", "this", "to", "was", "were", "which", "with"
+}
+
+def tokenize(text):
+    """Lowercase unigrams and bigrams of a statement, with stopwords removed."""
+    words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+class FactIndex:
+    """
+    Local TF-IDF index over fact statements.
+    Rows are L2-normalized and stored sparsely (CSR arrays: indptr, indices, data), so memory grows with
+    the number of tokens rather than facts x vocabulary. Scoring a query against every fact is one
+    gather and one bincount.
+    """
+    def __init__(self, facts):
+        self.facts = facts
+        documents = [tokenize(fact["statement"]) for fact in facts]
+
+        self.vocabulary = {}
+        rows = []
+        for tokens in documents:
+            columns = [self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens]
+            rows.append(np.unique(np.asarray(columns, dtype=np.int64), return_counts=True))
+
+        lengths = np.array([len(columns) for columns, _ in rows], dtype=np.int64)
+        self.indptr = np.concatenate(([0], np.cumsum(lengths)))
+        self.indices = np.concatenate([columns for columns, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate([row_counts for _, row_counts in rows]).astype(np.float32) if rows else np.zeros(0, dtype=np.float32)
+        self.row_ids = np.repeat(np.arange(len(facts)), lengths)
+
+        self.document_frequency = np.bincount(self.indices, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + len(facts)) / (1 + self.document_frequency)) + 1).astype(np.float32)
+        self.data = self._weight(counts, self.indices, self.row_ids, len(facts))
+
+    def _weight(self, counts, columns, row_ids, row_count):
+        """Sublinear TF times IDF, L2-normalized per row (rows given by row_ids)."""
+        weighted = ((1 + np.log(counts)) * self.idf[columns]).astype(np.float32)
+        norms = np.sqrt(np.bincount(row_ids, weights=weighted * weighted, minlength=row_count))
+        norms[norms == 0] = 1
+        return (weighted / norms[row_ids]).astype(np.float32)
+
+    def vectorize(self, text):
+        """Dense TF-IDF vector of a query in this index's vocabulary (unknown terms are ignored)."""
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        columns = [self.vocabulary[token] for token in tokenize(text) if token in self.vocabulary]
+        if columns:
+            columns, counts = np.unique(np.asarray(columns, dtype=np.int64), return_counts=True)
+            vector[columns] = self._weight(counts.astype(np.float32), columns, np.zeros(len(columns), dtype=np.int64), 1)
+        return vector
+
+    def scores(self, text):
+        """Cosine similarity of a query against every fact."""
+        vector = self.vectorize(text)
+        return np.bincount(self.row_ids, weights=self.data * vector[self.indices], minlength=len(self.facts))
+
+    def rank(self, text):
+        """Return (position, cosine similarity) for every fact, most similar first (ties keep file order)."""
+        if not self.facts:
+            return []
+        scores = self.scores(text)
+        order = np.argsort(-scores, kind="stable")
+        return [(int(i), float(scores[i])) for i in order]
+
+    def query(self, text, top_k=25):
+        """Return up to top_k (fact, cosine similarity) pairs, most similar first."""
+        if not self.facts:
+            return []
+        scores = self.scores(text)
+        top_k = min(top_k, len(self.facts))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.facts[i], float(scores[i])) for i in candidates]
+
+def find_near_duplicates(statements, threshold, groups=None):
+    """
+    For each statement, the position of the first earlier statement it nearly duplicates (cosine
+    similarity >= threshold) that is not itself a duplicate, or -1. With groups (one label per
+    statement), only statements from different groups are compared.
+    Works on the sparse index with prefix filtering: a statement is only compared with earlier ones
+    that share one of its rarest terms, taken until its remaining terms' norm is below threshold (a
+    pair sharing none of them cannot reach it). Memory grows with the number of tokens.
+    """
+    index = FactIndex([{"statement": statement} for statement in statements])
+    labels = list(groups) if groups is not None else list(range(len(statements)))
+    duplicate_of = [-1] * len(statements)
+    postings = {}
+    for position in range(len(statements)):
+        start, end = index.indptr[position], index.indptr[position + 1]
+        columns = index.indices[start:end]
+        weights = index.data[start:end]
+
+        # Rarest terms first; the prefix ends once the rest cannot add up to the threshold
+        order = np.argsort(index.document_frequency[columns], kind="stable")
+        remaining = np.sqrt(np.maximum(np.cumsum((weights[order] ** 2)[::-1])[::-1], 0))
+        prefix = order[:int(np.count_nonzero(remaining >= threshold))]
+
+        candidates = set()
+        for column in columns[prefix]:
+            candidates.update(postings.get(int(column), ()))
+        row = dict(zip(columns.tolist(), weights.tolist()))
+        for candidate in sorted(candidates):
+            if duplicate_of[candidate] >= 0 or labels[candidate] == labels[position]:
+                continue
+            other_start, other_end = index.indptr[candidate], index.indptr[candidate + 1]
+            similarity = sum(
+                weight * row.get(column, 0.0)
+                for column, weight in zip(index.indices[other_start:other_end].tolist(), index.data[other_start:other_end].tolist())
+            )
+            if similarity >= threshold:
+                duplicate_of[position] = candidate
+                break
+
+        # Only statements that are not duplicates can be folded into
+        if duplicate_of[position] < 0:
+            for column in columns.tolist():
+                postings.setdefault(column, []).append(position)
+    return duplicate_of
+
+_unit_indexes = {}
+_unit_indexes_lock = threading.Lock()
+
+def get_unit_index(unit_string):
+    """Return the FactIndex for one or more units, rebuilt whenever the FactStore reloads."""
+    store = fact_store.get_fact_store()
+    facts = store.get_unit_facts(unit_string)
+    key = (str(unit_string), store.version)
+    with _unit_indexes_lock:
+        if key not in _unit_indexes:
+            # Drop indexes built from an older version of the facts
+            for stale_key in [k for k in _unit_indexes if k[1] != store.version]:
+                del _unit_indexes[stale_key]
+            _unit_indexes[key] = FactIndex(facts)
+        return _unit_indexes[key]
@@ -0,0 +1,154 @@
+import os
+import re
+import csv
+import logging
+import threading
+
+UNIT_FILE_PATTERN = re.compile(r"^unit(\d+).*\.csv$")
+
+class FactStore:
+    """
+    In-memory index over the KS_facts/unit*.csv files.
+    Facts are indexed by ID and by unit, per-unit text blocks are pre-joined, and
+    multi-unit combinations (e.g. '589') are memoized. Files are only re-parsed when
+    their mtime changes.
+    """
+    def __init__(self, facts_dir="KS_facts"):
+        self.facts_dir = facts_dir
+        self.facts_by_id = {}
+        self.facts_by_unit = {}
+        self.unit_text = {}
+        self.file_mtimes = {}
+        self.combined_cache = {}
+        # Bumped on every reload so derived indexes know when to rebuild
+        self.version = 0
+        self.lock = threading.RLock()
+
+    def _scan_unit_files(self):
+        """Return {unit_number: (path, mtime)} for every unit CSV on disk."""
+        unit_files = {}
+        for filename in sorted(os.listdir(self.facts_dir)):
+            match = UNIT_FILE_PATTERN.match(filename)
+            if not match:
+                continue
+            unit_number = int(match.group(1))
+            # Keep the first file per unit, like the old directory scan did
+            if unit_number in unit_files:
+                continue
+            path = os.path.join(self.facts_dir, filename)
+            unit_files[unit_number] = (path, os.path.getmtime(path))
+        return unit_files
+
+    def _load_unit(self, unit_number, path):
+        """Parse one unit CSV and index its facts."""
+        facts = []
+        with open(path, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # Skip header row
+            for row in reader:
+                if not row or len(row) <= 2:
+                    continue
+                facts.append({
+                    "id": row[0].strip(),
+                    "statement": row[1],
+                    "text": row[2],  # Column C: "ID, Node Statement"
+                    "unit": unit_number
+                })
+
+        for fact in self.facts_by_unit.get(unit_number, []):
+            self.facts_by_id.pop(fact["id"], None)
+        self.facts_by_unit[unit_number] = facts
+        self.unit_text[unit_number] = "\n".join(fact["text"] for fact in facts)
+        for fact in facts:
+            self.facts_by_id[fact["id"]] = fact
+        logging.info(f"Loaded {len(facts)} facts for unit {unit_number} from {path}")
+
+    def refresh(self):
+        """Reload any unit file whose mtime changed (or that appeared/disappeared) since the last load."""
+        with self.lock:
+            unit_files = self._scan_unit_files()
+            changed = False
+
+            for unit_number, (path, mtime) in unit_files.items():
+                if self.file_mtimes.get(unit_number) != (path, mtime):
+                    self._load_unit(unit_number, path)
+                    self.file_mtimes[unit_number] = (path, mtime)
+                    changed = True
+
+            for unit_number in list(self.file_mtimes):
+                if unit_number not in unit_files:
+                    for fact in self.facts_by_unit.pop(unit_number, []):
+                        self.facts_by_id.pop(fact["id"], None)
+                    self.unit_text.pop(unit_number, None)
+                    del self.file_mtimes[unit_number]
+                    changed = True
+
+            if changed:
+                self.combined_cache.clear()
+                self.version += 1
+
+    def get_unit_text(self, unit_string, line_prefix=""):
+        """
+        Return the facts for one or more units (e.g. '12', '589') as a single text block.
+        Each line can be given a prefix (e.g. '- '). Results are memoized per unit string.
+        """
+        self.refresh()
+        key = (str(unit_string), line_prefix)
+        with self.lock:
+            if key in self.combined_cache:
+                return self.combined_cache[key]
+
+            blocks = []
+            for unit_number in parse_units(unit_string):
+                if unit_number not in self.unit_text:
+                    logging.warning(f"No facts file found for unit {unit_number}")
+                    continue
+                if not self.facts_by_unit[unit_number]:
+                    continue
+                if line_prefix:
+                    blocks.append("\n".join(f"{line_prefix}{fact['text']}" for fact in self.facts_by_unit[unit_number]))
+                else:
+                    blocks.append(self.unit_text[unit_number])
+
+            if not blocks:
+                raise FileNotFoundError(f"No facts files found for any unit in {unit_string}")
+
+            text = "\n".join(blocks)
+            self.combined_cache[key] = text
+            return text
+
+    def get_unit_facts(self, unit_string):
+        """Return the fact dicts for one or more units, in file order."""
+        self.refresh()
+        with self.lock:
+            facts = []
+            for unit_number in parse_units(unit_string):
+                facts.extend(self.facts_by_unit.get(unit_number, []))
+            return facts
+
+    def get_fact(self, fact_id):
+        """Return the fact dict for an ID, or None if it is unknown."""
+        self.refresh()
+        with self.lock:
+            return self.facts_by_id.get(fact_id)
+
+    def all_fact_ids(self):
+        """Return the set of every known fact ID."""
+        self.refresh()
+        with self.lock:
+            return set(self.facts_by_id)
+
+def parse_units(unit_string):
+    """Split a unit string like '589' into unit numbers [5, 8, 9]."""
+    return [int(digit) for digit in str(unit_string)]
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_fact_store(facts_dir="KS_facts"):
+    """Return the process-wide FactStore, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None or _default_store.facts_dir != facts_dir:
+            _default_store = FactStore(facts_dir)
+        return _default_store
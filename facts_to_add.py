@@ -1,37 +1,50 @@
-import string
-import random
 import logging
+import re
 import json
-from anthropic import Anthropic
+import datetime
+import concurrent.futures
 import configs
+import fact_ids
+import fact_similarity
 import helper_functions
-from openai import OpenAI
-
-def generate_uuid(length=4):
-    """Generate a unique ID with mixed case and numbers"""
-    characters = string.ascii_lowercase + string.ascii_uppercase + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+import llm_cache
+import llm_clients
+import llm_scheduler
+import process_log
+import sheets_writer
 
 def get_facts_from_claude(text):
     """Process text through Claude API and extract facts"""
-    client = Anthropic(api_key=configs.event["anthropic_api_key"])
+    client = llm_clients.get_anthropic_client()
     
     prompt = create_prompt(text)
     schema = get_prompt_schema()
     
-    try:
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4000,
-            temperature=0,
-            messages=[{"role": "user", "content": prompt}],
-            tools=[schema]
+    request = {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 4000,
+        "temperature": 0,
+        "messages": [{"role": "user", "content": prompt}],
+        "tools": [schema]
+    }
+    
+    def request_facts():
+        message = llm_scheduler.scheduler.call(
+            "claude-3-5-sonnet-20241022",
+            lambda: client.messages.create(**request),
+            request
         )
         
         # Extract tool use from response
         for content in message.content:
             if content.type == 'tool_use':
                 return content.input
+        return None
+    
+    try:
+        result = llm_cache.get_cache().cached(request, request_facts)
+        if result is not None:
+            return result
                 
         logging.error("No tool_use found in Claude response")
         return None
@@ -41,58 +54,39 @@ def get_facts_from_claude(text):
         return None
 
 def write_to_process_sheet(sheet_type, curriculum, input_data, output_data):
-    """Write prompt input and output to Process sheet for debugging"""
-    logging.info(f"Writing {sheet_type} data to Process sheet")
-    
+    """
+    Log a prompt's input and output to the Consolidation Process sheet for debugging.
+    The record is queued on the background process log (process_log.get_sink()), so this never
+    waits on Google Sheets.
+    """
     google_sheet_info = configs.event.get("google_sheet")
     if not google_sheet_info:
         logging.error("No Google Sheet information provided")
         return
     
-    try:
-        # Setup process sheet
-        process_sheet = helper_functions.setup_google_sheet(
-            google_sheet_info["credentials_file"],
-            google_sheet_info["spreadsheet_id"],
-            "Consolidation Process"
-        )
-        
-        # Ensure sheet has headers
-        existing_values = process_sheet.get_all_values()
-        if not existing_values:
-            process_sheet.update("A1", [["Timestamp", "Process Step", "Curriculum", "Input", "Output"]])
-            existing_values = [["Timestamp", "Process Step", "Curriculum", "Input", "Output"]]
-        
-        # Add new row
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        next_row = len(existing_values) + 1
-        process_sheet.update(f"A{next_row}", [[
-            timestamp,
-            sheet_type,
-            curriculum,
-            input_data,
-            output_data
-        ]])
-        
-        logging.info(f"Successfully wrote {sheet_type} data to Process sheet")
-        
-    except Exception as e:
-        logging.error(f"Error writing to Process sheet: {str(e)}")
+    process_log.get_sink().record(sheet_type, curriculum, input_data, output_data)
+    logging.info(f"Queued {sheet_type} data for Process sheet")
 
 def process_openai_call(prompt, model="o1"):
     """Make a call to OpenAI API with given prompt"""
-    client = OpenAI(api_key=configs.event["openai_api_key"])
+    client = llm_clients.get_openai_client()
     
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            reasoning_effort="medium"
+    request = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "reasoning_effort": "medium"
+    }
+    
+    def request_content():
+        response = llm_scheduler.scheduler.call(
+            model,
+            lambda: client.chat.completions.create(**request),
+            request
         )
-        
-        content = response.choices[0].message.content
+        return response.choices[0].message.content
+    
+    try:
+        content = llm_cache.get_cache().cached(request, request_content)
         logging.info("Received response from OpenAI")
         
         return content
@@ -100,13 +94,17 @@ def process_openai_call(prompt, model="o1"):
         logging.error(f"Error calling OpenAI API: {str(e)}")
         return None
 
+def format_fact_line(fact):
+    """A fact as listed in consolidation prompt 1: [ID]: [sources]: [statement]."""
+    return f"{fact['id']}: {fact['sources']}: {fact['statement']}"
+
 def apply_consolidation_prompt_1(curriculum, facts_list):
     """Apply the first consolidation prompt to the facts list"""
     with open('fact_generator_prompts/consolidation_prompt_1.txt', 'r', encoding='utf-8') as file:
         prompt_template = file.read()
     
     # Format facts list for the prompt
-    formatted_facts = "\n".join([f"{fact['id']}: {fact['sources']}: {fact['statement']}" for fact in facts_list])
+    formatted_facts = "\n".join([format_fact_line(fact) for fact in facts_list])
     
     prompt = prompt_template.format(curriculum=curriculum, full_list=formatted_facts)
     
@@ -211,8 +209,186 @@ def extract_refined_facts(response_text):
         
         return []
 
-def process_fact_consolidation():
-    """Process facts from Fact Outputs sheet through consolidation and refinement pipeline"""
+# The JSON array inside the <refined_facts> tags of a consolidation prompt 2 answer
+CONSOLIDATED_FACTS_PATTERN = re.compile(r"<refined_facts>\s*(\[.*?\])\s*</refined_facts>", re.DOTALL)
+
+def split_into_shards(facts_list, shard_tokens):
+    """
+    Split a fact list, keeping its order (facts from one topic stay together), into shards whose
+    prompt lines fit in shard_tokens estimated tokens. A single larger fact gets a shard of its own.
+    """
+    shards = []
+    current = []
+    current_tokens = 0
+    for fact in facts_list:
+        tokens = llm_scheduler.estimate_tokens(format_fact_line(fact))
+        if current and current_tokens + tokens > shard_tokens:
+            shards.append(current)
+            current = []
+            current_tokens = 0
+        current.append(fact)
+        current_tokens += tokens
+    if current:
+        shards.append(current)
+    return shards
+
+def parse_consolidated_facts(response_text):
+    """
+    Parse the <refined_facts> array of a consolidation prompt 2 answer into
+    [{"statement": ..., "source_ids": [...]}], or None if the answer does not contain a readable one.
+    """
+    match = CONSOLIDATED_FACTS_PATTERN.search(response_text)
+    if not match:
+        return None
+    try:
+        facts = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+    return [
+        {"statement": fact["statement"], "source_ids": list(fact.get("source_ids", []))}
+        for fact in facts
+        if isinstance(fact, dict) and fact.get("statement")
+    ]
+
+def consolidate_shard(curriculum, facts_list, label=""):
+    """Steps 1 and 2 of the chain (evaluation, then consolidation) for one list of facts."""
+    # Step 1: Apply consolidation prompt 1
+    facts_evaluation = apply_consolidation_prompt_1(curriculum, facts_list)
+    if not facts_evaluation:
+        logging.error(f"Failed to get facts evaluation for curriculum {curriculum[:50]}{label}")
+        return None
+        
+    # Step 2: Apply consolidation prompt 2
+    consolidated_facts = apply_consolidation_prompt_2(curriculum, facts_evaluation)
+    if not consolidated_facts:
+        logging.error(f"Failed to get consolidated facts for curriculum {curriculum[:50]}{label}")
+        return None
+    return consolidated_facts
+
+def merge_consolidated_shards(curriculum, shard_results, duplicate_threshold):
+    """
+    Reduce step: concatenate the shards' consolidated facts, folding a fact into an earlier one from
+    another shard when their statements are near-duplicates (their source_ids are combined). Facts
+    within a shard are left alone, since the model already decided to keep them apart.
+    Returns the merged list in the <refined_facts> format of consolidation prompt 2; shard answers
+    that could not be parsed are passed on as they are.
+    """
+    merged = []
+    shard_numbers = []
+    unparsed = []
+    for shard_number, response_text in enumerate(shard_results):
+        facts = parse_consolidated_facts(response_text)
+        if facts is None:
+            logging.warning(f"Could not parse consolidated facts of shard {shard_number + 1} for curriculum {curriculum[:50]}")
+            unparsed.append(response_text)
+            continue
+        merged.extend(facts)
+        shard_numbers.extend([shard_number] * len(facts))
+    
+    duplicate_of = fact_similarity.find_near_duplicates(
+        [fact["statement"] for fact in merged], duplicate_threshold, shard_numbers
+    ) if merged else []
+    for fact, target in zip(merged, duplicate_of):
+        if target >= 0:
+            source_ids = merged[target]["source_ids"]
+            source_ids.extend(source_id for source_id in fact["source_ids"] if source_id not in source_ids)
+    kept = [fact for fact, target in zip(merged, duplicate_of) if target < 0]
+    logging.info(f"Merged {len(shard_results)} shards for curriculum {curriculum[:50]}: {len(merged)} facts, {len(merged) - len(kept)} cross-shard duplicates folded")
+    
+    merged_text = "<refined_facts>\n" + json.dumps(kept, indent=2, ensure_ascii=False) + "\n</refined_facts>"
+    if unparsed:
+        merged_text += "\n\n" + "\n\n".join(unparsed)
+    write_to_process_sheet(
+        "Consolidation Reduce",
+        curriculum,
+        f"{len(shard_results)} shards, {len(merged)} consolidated facts",
+        merged_text
+    )
+    return merged_text
+
+def consolidate_facts(curriculum, facts_list):
+    """
+    Steps 1 and 2 for a curriculum. Fact lists that fit in one shard go through the prompts once;
+    larger ones are split into token-bounded shards (configs.event["consolidation_sharding"]) that are
+    consolidated in parallel and then merged. Returns the consolidated facts text, or None if any
+    shard failed (finished shards are in the LLM cache, so a rerun only repeats the failed ones).
+    """
+    sharding = configs.event.get("consolidation_sharding", {})
+    if not sharding.get("enabled", False):
+        return consolidate_shard(curriculum, facts_list)
+    
+    shards = split_into_shards(facts_list, sharding.get("shard_tokens", 20000))
+    if len(shards) == 1:
+        return consolidate_shard(curriculum, facts_list)
+    
+    logging.info(f"Consolidating {len(facts_list)} facts for curriculum {curriculum[:50]} in {len(shards)} shards")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(shards), sharding.get("shard_concurrency", 4))) as executor:
+        shard_results = list(executor.map(
+            lambda numbered: consolidate_shard(curriculum, numbered[1], f" (shard {numbered[0] + 1} of {len(shards)})"),
+            enumerate(shards)
+        ))
+    
+    failed = sum(1 for result in shard_results if not result)
+    if failed:
+        logging.error(f"{failed} of {len(shards)} shards failed for curriculum {curriculum[:50]}")
+        return None
+    return merge_consolidated_shards(curriculum, shard_results, sharding.get("duplicate_threshold", 0.9))
+
+def consolidate_curriculum(curriculum, facts_list):
+    """
+    Run one curriculum's chain (consolidation prompt 1 -> prompt 2 -> refinement) and build its
+    Refined Facts rows with new fact IDs. Returns None if any step failed.
+    Large curricula are consolidated in shards and merged before the refinement (see consolidate_facts);
+    the refinement itself still gets the whole merged list in one prompt.
+    """
+    logging.info(f"Curriculum: {curriculum[:50]}")    
+    logging.info(f"Number of facts to process: {len(facts_list)}")
+    logging.info(f"First few fact IDs: {[fact['id'] for fact in facts_list[:5]]}")
+    
+    # Steps 1 and 2: evaluate and consolidate (sharded for large curricula)
+    consolidated_facts = consolidate_facts(curriculum, facts_list)
+    if not consolidated_facts:
+        return None
+        
+    # Step 3: Apply fact refinement prompt
+    refined_result = apply_fact_refinement(curriculum, consolidated_facts)
+    if not refined_result:
+        logging.error(f"Failed to get refined facts for curriculum {curriculum[:50]}")
+        return None
+        
+    # Extract refined facts from the response
+    refined_facts = extract_refined_facts(refined_result)
+    if not refined_facts:
+        logging.error(f"Failed to extract refined facts for curriculum {curriculum[:50]}")
+        return None
+        
+    # Add curriculum to refined facts and generate new IDs
+    output_rows = []
+    new_fact_ids = fact_ids.allocate_fact_ids(len(refined_facts))
+    for fact, new_fact_id in zip(refined_facts, new_fact_ids):
+        fact_statement = fact.get("statement", "")  # Try statement field first
+        if not fact_statement:
+            fact_statement = fact.get("fact", "")   # Try fact field as backup
+        
+        logging.info(f"Refined fact: {new_fact_id} - {fact_statement[:100]}...")
+        
+        output_rows.append([
+            new_fact_id,
+            curriculum,
+            fact_statement
+        ])
+    return output_rows
+
+def process_fact_consolidation(max_workers=None):
+    """
+    Process facts from Fact Outputs sheet through consolidation and refinement pipeline.
+    Curricula are independent, so their chains run concurrently on a bounded thread pool
+    (configs.event["consolidation_concurrency"]); each curriculum's refined facts and processed IDs
+    are written as soon as its chain finishes.
+    """
+    if max_workers is None:
+        max_workers = configs.event.get("consolidation_concurrency", 4)
+    
     logging.info("Starting fact consolidation process")
     
     # Setup Google Sheets
@@ -229,37 +405,20 @@ def process_fact_consolidation():
             "Fact Outputs"
         )
         
-        # Setup refined facts sheet to write to
-        refined_facts_sheet = helper_functions.setup_google_sheet(
-            google_sheet_info["credentials_file"],
-            google_sheet_info["spreadsheet_id"],
-            "Refined Facts"
+        # Setup refined facts writer (headers are written if the sheet is empty)
+        refined_facts_writer = sheets_writer.open_writer(
+            "Refined Facts",
+            ["Fact ID", "Curriculum", "Refined Fact Statement"]
         )
         
-        # Setup processed fact IDs sheet to track which facts have been processed
-        processed_ids_sheet = helper_functions.setup_google_sheet(
-            google_sheet_info["credentials_file"],
-            google_sheet_info["spreadsheet_id"],
-            "Processed Fact IDs"
+        # Setup processed fact IDs writer to track which facts have been processed
+        processed_ids_writer = sheets_writer.open_writer(
+            "Processed Fact IDs",
+            ["Original Fact ID", "Curriculum", "Processed Date"]
         )
         
-        # Ensure processed fact IDs sheet has headers
-        processed_ids_values = processed_ids_sheet.get_all_values()
-        if not processed_ids_values:
-            processed_ids_sheet.update("A1", [["Original Fact ID", "Curriculum", "Processed Date"]])
-            processed_ids_values = [["Original Fact ID", "Curriculum", "Processed Date"]]
-        
-        # Get already processed original fact IDs
-        processed_original_fact_ids = set()
-        for row in processed_ids_values[1:]:  # Skip header
-            if len(row) >= 1:  # Ensure the row has at least the fact ID
-                processed_original_fact_ids.add(row[0])
-        
-        # Ensure refined facts sheet has headers
-        existing_refined_values = refined_facts_sheet.get_all_values()
-        if not existing_refined_values:
-            refined_facts_sheet.update("A1", [["Fact ID", "Curriculum", "Refined Fact Statement"]])
-            existing_refined_values = [["Fact ID", "Curriculum", "Refined Fact Statement"]]
+        # Get already processed original fact IDs (only column A is downloaded)
+        processed_original_fact_ids = set(processed_ids_writer.worksheet.col_values(1)[1:])  # Skip header
         
         # Get all values from fact outputs sheet
         output_values = fact_output_sheet.get_all_values()
@@ -318,89 +477,90 @@ def process_fact_consolidation():
             # Track original fact ID to mark as processed later
             original_ids_by_curriculum[curriculum].append(fact_id)
         
-        # Process each curriculum group
-        all_refined_facts = []
-        processed_ids_to_add = []
-        import datetime
-        
-        for curriculum, facts_list in facts_by_curriculum.items():
-            if not facts_list:
-                continue
+        # Run each curriculum's chain on a bounded pool and commit each one as soon as it finishes
+        logging.info(f"Consolidating {len(facts_by_curriculum)} curricula with up to {max_workers} workers")
+        refined_count = 0
+        processed_count = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_curriculum = {
+                executor.submit(consolidate_curriculum, curriculum, facts_list): curriculum
+                for curriculum, facts_list in facts_by_curriculum.items()
+                if facts_list
+            }
             
-            logging.info(f"Curriculum: {curriculum[:50]}")    
-            logging.info(f"Number of facts to process: {len(facts_list)}")
-            logging.info(f"First few fact IDs: {[fact['id'] for fact in facts_list[:5]]}")
-            
-            # Step 1: Apply consolidation prompt 1
-            facts_evaluation = apply_consolidation_prompt_1(curriculum, facts_list)
-            if not facts_evaluation:
-                logging.error(f"Failed to get facts evaluation for curriculum {curriculum[:50]}")
-                continue
+            for future in concurrent.futures.as_completed(future_to_curriculum):
+                curriculum = future_to_curriculum[future]
+                try:
+                    output_rows = future.result()
+                except Exception as e:
+                    logging.error(f"Error consolidating curriculum {curriculum[:50]}: {str(e)}")
+                    continue
+                if output_rows is None:
+                    continue
                 
-            # Step 2: Apply consolidation prompt 2
-            consolidated_facts = apply_consolidation_prompt_2(curriculum, facts_evaluation)
-            if not consolidated_facts:
-                logging.error(f"Failed to get consolidated facts for curriculum {curriculum[:50]}")
-                continue
-                
-            # Step 3: Apply fact refinement prompt
-            refined_result = apply_fact_refinement(curriculum, consolidated_facts)
-            if not refined_result:
-                logging.error(f"Failed to get refined facts for curriculum {curriculum[:50]}")
-                continue
-                
-            # Extract refined facts from the response
-            refined_facts = extract_refined_facts(refined_result)
-            if not refined_facts:
-                logging.error(f"Failed to extract refined facts for curriculum {curriculum[:50]}")
-                continue
-                
-            # Add curriculum to refined facts and generate new IDs
-            output_rows = []
-            for fact in refined_facts:
-                new_fact_id = f"a_{generate_uuid()}"
-                fact_statement = fact.get("statement", "")  # Try statement field first
-                if not fact_statement:
-                    fact_statement = fact.get("fact", "")   # Try fact field as backup
+                # Refined facts first: if the process dies in between, the curriculum is redone rather than lost
+                refined_facts_writer.append_rows(output_rows)
+                refined_facts_writer.flush()
                 
-                logging.info(f"Refined fact: {new_fact_id} - {fact_statement[:100]}...")
-                
-                output_rows.append([
-                    new_fact_id,
-                    curriculum,
-                    fact_statement
+                # Mark original fact IDs as processed
+                current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+                processed_ids_writer.append_rows([
+                    [original_id, curriculum, current_date]
+                    for original_id in original_ids_by_curriculum[curriculum]
                 ])
+                processed_ids_writer.flush()
                 
-            all_refined_facts.extend(output_rows)
-            
-            # Mark original fact IDs as processed
-            current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-            for original_id in original_ids_by_curriculum[curriculum]:
-                processed_ids_to_add.append([
-                    original_id,
-                    curriculum,
-                    current_date
-                ])
+                refined_count += len(output_rows)
+                processed_count += len(original_ids_by_curriculum[curriculum])
+                logging.info(f"Committed {len(output_rows)} refined facts for curriculum {curriculum[:50]}")
         
-        # Write all refined facts to the sheet
-        if all_refined_facts:
-            next_row = len(existing_refined_values) + 1
-            refined_facts_sheet.update(f"A{next_row}", all_refined_facts)
-            logging.info(f"Added {len(all_refined_facts)} refined facts to Refined Facts sheet")
+        if refined_count:
+            logging.info(f"Added {refined_count} refined facts to Refined Facts sheet")
         else:
             logging.info("No new refined facts were generated")
-            
-        # Write processed original fact IDs to the tracking sheet
-        if processed_ids_to_add:
-            next_row = len(processed_ids_values) + 1
-            processed_ids_sheet.update(f"A{next_row}", processed_ids_to_add)
-            logging.info(f"Added {len(processed_ids_to_add)} fact IDs to Processed Fact IDs sheet")
+        if processed_count:
+            logging.info(f"Added {processed_count} fact IDs to Processed Fact IDs sheet")
             
     except Exception as e:
         logging.error(f"Error processing fact consolidation: {str(e)}")
 
-def process_fact_inputs():
-    """Read from Fact Inputs sheet, process through Claude, and write to Fact Outputs sheet"""
+def extract_fact_rows(topic, text, curriculum, with_curriculum):
+    """
+    Extract the facts of one Fact Inputs passage and build its Fact Outputs rows.
+    Returns the rows (empty if Claude found no facts), or None if the request failed.
+    """
+    logging.info(f"Processing text for topic: {topic}")
+    result = get_facts_from_claude(text)
+    if not result:
+        return None
+    
+    # Extract statements from required_concepts
+    concepts = [concept for concept in result.get("required_concepts", []) if "statement" in concept]
+    new_fact_ids = fact_ids.allocate_fact_ids(len(concepts))
+    rows = []
+    for concept, new_fact_id in zip(concepts, new_fact_ids):
+        fact_row = [
+            topic,
+            text,
+            new_fact_id,
+            concept["statement"]
+        ]
+        # Add curriculum if it exists
+        if with_curriculum:
+            fact_row.append(curriculum)
+        rows.append(fact_row)
+    return rows
+
+def process_fact_inputs(max_workers=None):
+    """
+    Read from Fact Inputs sheet, process through Claude, and write to Fact Outputs sheet.
+    Passages are sent to Claude by a bounded thread pool (configs.event["fact_extraction_concurrency"])
+    sharing one client. Rows are appended in input order and flushed to the sheet in periodic batches,
+    so a crash only loses the passages still in flight; they are picked up again on the next run.
+    """
+    if max_workers is None:
+        max_workers = configs.event.get("fact_extraction_concurrency", 8)
+    
     logging.info("Starting fact generation process")
     
     # Setup Google Sheets
@@ -459,9 +619,8 @@ def process_fact_inputs():
             if len(row) >= 2:  # Ensure the row has at least topic and text
                 processed_combinations.add((row[0], row[1]))
         
-        # Process each row
-        output_rows = []
-        
+        # Collect the passages to extract, skipping processed ones and duplicates within this run
+        pending = []
         for row in data_rows:
             if len(row) <= max(topic_index, text_index):
                 logging.warning(f"Skipping row with insufficient columns: {row}")
@@ -479,44 +638,44 @@ def process_fact_inputs():
             if not text:
                 logging.warning(f"Skipping row with empty text for topic {topic}")
                 continue
-                
-            logging.info(f"Processing text for topic: {topic}")
             
-            # Get facts from Claude
-            result = get_facts_from_claude(text)
-            if not result:
-                logging.error(f"Failed to get facts for topic {topic}")
-                continue
-                
-            # Extract statements from required_concepts
-            facts_added = False
-            if "required_concepts" in result:
-                for concept in result["required_concepts"]:
-                    if "statement" in concept:
-                        fact_id = f"a_{generate_uuid()}"
-                        fact_row = [
-                            topic,
-                            text,
-                            fact_id,
-                            concept["statement"]
-                        ]
-                        # Add curriculum if it exists
-                        if curriculum_index is not None:
-                            fact_row.append(curriculum)
-                        output_rows.append(fact_row)
-                        facts_added = True
-            
-            # Mark this combination as processed (even if no facts were added)
             processed_combinations.add((topic, text))
-            
-            if not facts_added:
-                logging.warning(f"No facts were generated for topic {topic}")
-        
-        # Append all rows to output sheet
-        if output_rows:
-            next_row = len(existing_values) + 1
-            output_sheet.update(f"A{next_row}", output_rows)
-            logging.info(f"Added {len(output_rows)} facts to Fact Outputs sheet")
+            pending.append((topic, text, curriculum))
+        
+        logging.info(f"Extracting facts from {len(pending)} passages with up to {max_workers} workers")
+        
+        # Buffer output rows and append them in batches; each flush makes the finished passages durable
+        output_writer = sheets_writer.SheetAppendWriter(output_sheet, chunk_rows=200, flush_interval=30.0)
+        facts_written = 0
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(extract_fact_rows, topic, text, curriculum, curriculum_index is not None)
+                    for topic, text, curriculum in pending
+                ]
+                
+                # Consume results in input order so the output order is deterministic
+                for (topic, _, _), future in zip(pending, futures):
+                    try:
+                        fact_rows = future.result()
+                    except Exception as e:
+                        logging.error(f"Error extracting facts for topic {topic}: {str(e)}")
+                        continue
+                    if fact_rows is None:
+                        logging.error(f"Failed to get facts for topic {topic}")
+                        continue
+                    if not fact_rows:
+                        logging.warning(f"No facts were generated for topic {topic}")
+                        continue
+                    
+                    output_writer.append_rows(fact_rows)
+                    facts_written += len(fact_rows)
+        finally:
+            # Push whatever is still buffered, even if processing stopped early
+            output_writer.flush()
+        
+        if facts_written:
+            logging.info(f"Added {facts_written} facts to Fact Outputs sheet")
         else:
             logging.info("No new facts were generated")
             
@@ -572,4 +731,6 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     process_fact_inputs()
     # After generating facts, run the consolidation pipeline
-    process_fact_consolidation()
\ No newline at end of file
+    process_fact_consolidation()
+    # Write out the remaining process log records
+    process_log.get_sink().close()
\ No newline at end of file
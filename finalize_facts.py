@@ -1,11 +1,17 @@
 import logging
 import json
+import concurrent.futures
 import gspread
-from google.oauth2.service_account import Credentials
-from openai import OpenAI
-from anthropic import Anthropic
 import configs
 import helper_functions as hf
+import fact_similarity
+import fact_store
+import llm_batch
+import llm_cache
+import llm_clients
+import llm_scheduler
+import sheets_session
+import sheets_writer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -26,12 +32,9 @@ def setup_sheets():
         output_sheet = hf.setup_google_sheet(credentials_file, spreadsheet_id, output_sheet_name)
     except gspread.exceptions.WorksheetNotFound:
         # Create the worksheet if it doesn't exist
-        client = gspread.authorize(Credentials.from_service_account_file(
-            credentials_file, 
-            scopes=["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        ))
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        output_sheet = spreadsheet.add_worksheet(title=output_sheet_name, rows=1000, cols=11)  # Added more columns for metadata
+        output_sheet = sheets_session.get_session(credentials_file).add_worksheet(
+            spreadsheet_id, output_sheet_name, rows=1000, cols=11  # Added more columns for metadata
+        )
         
         # Add header row with metadata columns
         output_sheet.update('A1:K1', [['Unit', 'Fact ID', 'Fact Statement', 'Redundant', 'Reasoning', 
@@ -44,8 +47,7 @@ def check_redundancy(fact_id, fact_statement, unit, existing_facts):
     Checks if a fact is redundant with existing facts from the same unit.
     Returns a tuple (is_redundant, reasoning).
     """
-    # Setup OpenAI client
-    client = OpenAI(api_key=configs.event["openai_api_key"])
+    client = llm_clients.get_openai_client()
     
     # Create prompt
     prompt = f"""
@@ -73,74 +75,170 @@ Format your response as a JSON object:
 }}
 """
 
-    try:
-        response = client.chat.completions.create(
-            model="o1",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
+    request = {
+        "model": "o1",
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": {"type": "json_object"}
+    }
+
+    def request_content():
+        response = llm_scheduler.scheduler.call(
+            "o1",
+            lambda: client.chat.completions.create(**request),
+            request
         )
-        
-        content = response.choices[0].message.content
+        return response.choices[0].message.content
+
+    try:
+        # A response that does not parse raises before it is cached
+        content = llm_cache.get_cache().cached(request, request_content, parse_redundancy_verdict)
         logging.info(f"Received redundancy check response for fact {fact_id}")
-        
-        # Parse JSON response
-        result = json.loads(content)
-        return result["is_redundant"], result["reasoning"]
+        return parse_redundancy_verdict(content)
     except Exception as e:
         logging.error(f"Error checking redundancy for fact {fact_id}: {str(e)}")
         return None, f"Error: {str(e)}"
 
-def generate_metadata(fact_statement, curriculum):
+def parse_redundancy_verdict(content):
+    """Parse a single redundancy check response into (is_redundant, reasoning); raises if it is malformed."""
+    result = json.loads(content)
+    return result["is_redundant"], result["reasoning"]
+
+def parse_batch_verdicts(content):
     """
-    Generate metadata for a fact using the Anthropic API with the get_fact_metadata tool.
-    Returns a dictionary with metadata fields.
+    Parse a batch redundancy check response into {fact_id: (is_redundant, reasoning)}, skipping
+    malformed verdicts. Raises if the response is not a JSON object with a verdicts list.
+    """
+    verdicts = json.loads(content)["verdicts"]
+    if not isinstance(verdicts, list):
+        raise ValueError("verdicts is not a list")
+    parsed = {}
+    for verdict in verdicts:
+        if isinstance(verdict, dict) and isinstance(verdict.get("is_redundant"), bool):
+            parsed[str(verdict.get("fact_id", ""))] = (verdict["is_redundant"], verdict.get("reasoning", ""))
+    return parsed
+
+def check_redundancy_batch(unit, new_facts, existing_facts):
+    """
+    Checks several new facts from the same unit against the unit's existing facts in one request.
+    new_facts is a list of (fact_id, fact_statement) tuples.
+    Returns a dict of fact_id -> (is_redundant, reasoning); facts without a usable verdict are left out.
     """
-    # Setup Anthropic client
-    client = Anthropic(api_key=configs.event["anthropic_api_key"])
+    client = llm_clients.get_openai_client()
     
+    new_facts_text = "\n".join(f"- {fact_id}: {fact_statement}" for fact_id, fact_statement in new_facts)
     
-    # Define the metadata generation tool
-    get_fact_metadata_tool = {
-        "name": "get_fact_metadata",
-        "description": "Get metadata attributes for a historical fact",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "classification": {
-                    "type": "string",
-                    "enum": ["Essential", "Supporting"],
-                    "description": "Whether this is an essential or supporting fact"
-                },
-                "definition": {
-                    "type": "boolean",
-                    "description": "Whether this fact represents a definition"
-                },
-                "date": {
-                    "type": "string",
-                    "description": "The relevant date or time period"
-                },
-                "theme": {
-                    "type": "string",
-                    "enum": ["TEC", "ENV", "ECN", "GOV", "SIO", "CDI"],
-                    "description": "The primary historical theme"
-                },
-                "cluster": {
-                    "type": "string",
-                    "description": "The cluster"
-                },
-                "learning_objective": {
-                    "type": "string",
-                    "description": "The learning objective"
-                },
-                "reasoning": {
-                    "type": "string",
-                    "description": "The reasoning for each element of the metadata that was created"
-                }
+    # Create prompt (the shared unit context comes first so it is sent once for the whole batch)
+    prompt = f"""
+You are analyzing facts for a history curriculum. Your job is to determine, for each new fact, whether it is redundant with existing facts.
+
+EXISTING FACTS FROM UNIT {unit}:
+{existing_facts}
+
+NEW FACTS (ID: statement):
+{new_facts_text}
+
+For each new fact, is it redundant with any of the existing facts? Judge each new fact only against the existing facts, not against the other new facts. Consider the following:
+1. Facts are redundant if they express essentially the same information, even if worded differently.
+2. Facts are NOT redundant if they cover related topics but provide distinct information.
+3. Facts are NOT redundant if they mention the same historical entity but provide different details or perspectives.
+
+For every new fact, please provide:
+1. A judgment of TRUE (if redundant) or FALSE (if not redundant)
+2. A brief explanation of your reasoning (max 1-2 sentences)
+
+Format your response as a JSON object with one verdict per new fact, in the same order as the new facts:
+{{
+  "verdicts": [
+    {{
+      "fact_id": "The new fact ID",
+      "is_redundant": true/false,
+      "reasoning": "Your explanation here"
+    }}
+  ]
+}}
+"""
+
+    request = {
+        "model": "o1",
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": {"type": "json_object"}
+    }
+
+    def request_content():
+        response = llm_scheduler.scheduler.call(
+            "o1",
+            lambda: client.chat.completions.create(**request),
+            request
+        )
+        return response.choices[0].message.content
+
+    fact_ids = {str(fact_id) for fact_id, _ in new_facts}
+    try:
+        content = llm_cache.get_cache().cached(request, request_content, parse_batch_verdicts)
+        logging.info(f"Received batch redundancy check response for {len(new_facts)} facts in unit {unit}")
+        
+        # Keep only well-formed verdicts for facts we asked about
+        return {fact_id: verdict for fact_id, verdict in parse_batch_verdicts(content).items() if fact_id in fact_ids}
+    except Exception as e:
+        logging.error(f"Error checking redundancy for batch in unit {unit}: {str(e)}")
+        return {}
+
+# Tool used to get structured metadata for a fact
+METADATA_TOOL = {
+    "name": "get_fact_metadata",
+    "description": "Get metadata attributes for a historical fact",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "classification": {
+                "type": "string",
+                "enum": ["Essential", "Supporting"],
+                "description": "Whether this is an essential or supporting fact"
+            },
+            "definition": {
+                "type": "boolean",
+                "description": "Whether this fact represents a definition"
+            },
+            "date": {
+                "type": "string",
+                "description": "The relevant date or time period"
+            },
+            "theme": {
+                "type": "string",
+                "enum": ["TEC", "ENV", "ECN", "GOV", "SIO", "CDI"],
+                "description": "The primary historical theme"
+            },
+            "cluster": {
+                "type": "string",
+                "description": "The cluster"
+            },
+            "learning_objective": {
+                "type": "string",
+                "description": "The learning objective"
             },
-            "required": ["classification", "definition", "date", "theme", "cluster", "learning_objective", "reasoning"]
-        }
+            "reasoning": {
+                "type": "string",
+                "description": "The reasoning for each element of the metadata that was created"
+            }
+        },
+        "required": ["classification", "definition", "date", "theme", "cluster", "learning_objective", "reasoning"]
     }
-    
+}
+
+METADATA_ERROR = {
+    "classification": "Error",
+    "definition": "Error",
+    "date": "Error",
+    "theme": "Error",
+    "cluster": "Error",
+    "learning_objective": "Error"
+}
+
+def build_metadata_request(fact_statement, curriculum):
+    """
+    Build the Anthropic request that generates metadata for a fact with the get_fact_metadata tool.
+    Returns None if the prompt template cannot be loaded.
+    """
     # Load the metadata generation prompt template
     try:
         with open('fact_generator_prompts/metadata_generation_prompt.txt', 'r', encoding='utf-8') as file:
@@ -151,55 +249,202 @@ def generate_metadata(fact_statement, curriculum):
         prompt = prompt.replace("{statement}", fact_statement)
     except Exception as e:
         logging.error(f"Error loading or processing metadata prompt template: {str(e)}")
+        return None
 
-    try:
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=8000,
-            temperature=0,
-            messages=[{"role": "user", "content": prompt}],
-            tools=[get_fact_metadata_tool]
-        )
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 8000,
+        "temperature": 0,
+        "messages": [{"role": "user", "content": prompt}],
+        "tools": [METADATA_TOOL]
+    }
+
+def normalize_metadata(metadata):
+    """
+    Convert get_fact_metadata tool input into the values written to the Final Facts sheet.
+    """
+    if not metadata:
+        logging.error("No metadata tool use found in response")
+        return dict(METADATA_ERROR)
+    
+    # Convert definition from boolean to string for spreadsheet compatibility
+    if isinstance(metadata.get("definition"), bool):
+        metadata["definition"] = str(metadata["definition"]).lower()
+    
+    # Map learning_objective to lo_mapping to match our expected output structure
+    metadata["learning_objective"] = metadata.pop("learning_objective", "")
         
-        for i, content in enumerate(message.content):
+    return metadata
+
+def generate_metadata(fact_statement, curriculum):
+    """
+    Generate metadata for a fact using the Anthropic API with the get_fact_metadata tool.
+    Returns a dictionary with metadata fields.
+    """
+    client = llm_clients.get_anthropic_client()
+    
+    request = build_metadata_request(fact_statement, curriculum)
+    if request is None:
+        return dict(METADATA_ERROR)
+
+    def request_metadata():
+        message = llm_scheduler.scheduler.call(
+            "claude-3-5-sonnet-20241022",
+            lambda: client.messages.create(**request),
+            request
+        )
+        for content in message.content:
             if content.type == 'tool_use':
-                metadata = content.input
-        
-        if not metadata:
-            logging.error("No metadata tool use found in response")
-            return {
-                "classification": "Error",
-                "definition": "Error",
-                "date": "Error",
-                "theme": "Error",
-                "cluster": "Error",
-                "learning_objective": "Error"
-            }
-        
-        # Convert definition from boolean to string for spreadsheet compatibility
-        if isinstance(metadata.get("definition"), bool):
-            metadata["definition"] = str(metadata["definition"]).lower()
-        
-        # Map learning_objective to lo_mapping to match our expected output structure
-        metadata["learning_objective"] = metadata.pop("learning_objective", "")
-            
-        return metadata
-        
+                return content.input
+        return None
+
+    try:
+        return normalize_metadata(llm_cache.get_cache().cached(request, request_metadata))
     except Exception as e:
         logging.error(f"Error generating metadata: {str(e)}")
-        return {
-            "classification": "Error",
-            "definition": "Error",
-            "date": "Error",
-            "theme": "Error",
-            "cluster": "Error",
-            "learning_objective": "Error"
-        }
-
-def process_facts():
+        return dict(METADATA_ERROR)
+
+def find_redundancy_candidates(fact_id, fact_statement, unit):
+    """
+    Pick the existing facts a new fact should be compared against.
+    Returns (local_verdict, candidates): local_verdict is (True, reasoning) when the prefilter finds a
+    near-exact duplicate (no LLM call needed), otherwise None; candidates are the existing fact dicts
+    to show the model (the top_k nearest with the prefilter enabled, otherwise the whole unit).
+    """
+    prefilter = configs.event.get("redundancy_prefilter", {})
+    
+    try:
+        if not prefilter.get("enabled", False):
+            return None, fact_store.get_fact_store().get_unit_facts(unit)
+        
+        # Only the nearest existing facts go into the prompt
+        candidates = fact_similarity.get_unit_index(unit).query(fact_statement, prefilter.get("top_k", 25))
+    except Exception as e:
+        logging.error(f"Error getting facts for unit {unit}: {str(e)}")
+        return None, []
+    
+    if candidates:
+        best_fact, best_score = candidates[0]
+        if best_score >= prefilter.get("duplicate_threshold", 0.95):
+            # Near-exact duplicates are decided locally without an LLM call
+            logging.info(f"Fact {fact_id} is a near-exact duplicate of {best_fact['id']}")
+            reasoning = f"Near-exact duplicate of existing fact {best_fact['id']} (similarity {best_score:.2f})."
+            return (True, reasoning), [fact for fact, score in candidates]
+    return None, [fact for fact, score in candidates]
+
+def format_existing_facts(facts):
+    """Format existing fact dicts as the bulleted list used in redundancy prompts."""
+    if not facts:
+        return "No existing facts found."
+    return "\n".join(f"- {fact['text']}" for fact in facts)
+
+def build_final_row(fact_id, fact_statement, unit, is_redundant, reasoning):
+    """
+    Build the Final Facts row for a redundancy verdict. The metadata columns are left blank;
+    fill_metadata (or fill_metadata_in_batch) adds them for non-redundant facts.
+    """
+    return [
+        unit, 
+        fact_id, 
+        fact_statement, 
+        str(is_redundant), 
+        reasoning,
+        "", "", "", "", "", ""
+    ]
+
+def set_metadata_columns(row, metadata):
+    """Write a metadata dict into a Final Facts row's metadata columns."""
+    row[5:11] = [
+        metadata.get("classification", ""),
+        metadata.get("definition", ""),
+        metadata.get("date", ""),
+        metadata.get("theme", ""),
+        metadata.get("cluster", ""),
+        metadata.get("learning_objective", "")
+    ]
+
+def fill_metadata(row, curriculum):
+    """Generate metadata for a non-redundant fact's Final Facts row and fill it in place."""
+    logging.info(f"Fact {row[1]} is not redundant, generating metadata")
+    set_metadata_columns(row, generate_metadata(row[2], curriculum))
+    return row
+
+def finalize_batch(unit, facts):
+    """
+    Judge the redundancy of a batch of facts from the same unit.
+    facts is a list of (fact_id, fact_statement, unit, curriculum) tuples. With more than one fact
+    needing a model verdict, the shared unit context is sent once with every candidate fact
+    (check_redundancy_batch); facts the batch answer leaves out fall back to check_redundancy.
+    Returns a dict of fact_id -> Final Facts row without metadata (None if the redundancy check failed).
+    """
+    verdicts = {}
+    context = {}
+    to_check = []
+    for fact_id, fact_statement, _, _ in facts:
+        local_verdict, candidates = find_redundancy_candidates(fact_id, fact_statement, unit)
+        if local_verdict is not None:
+            verdicts[fact_id] = local_verdict
+            continue
+        to_check.append((fact_id, fact_statement))
+        for candidate in candidates:
+            context.setdefault(candidate["id"], candidate)
+    
+    existing_facts = format_existing_facts(list(context.values()))
+    if len(to_check) > 1:
+        batch_verdicts = check_redundancy_batch(unit, to_check, existing_facts)
+        for fact_id, fact_statement in to_check:
+            if str(fact_id) in batch_verdicts:
+                verdicts[fact_id] = batch_verdicts[str(fact_id)]
+    
+    # Single facts, and anything the batch answer missed, are checked one at a time
+    for fact_id, fact_statement in to_check:
+        if fact_id not in verdicts:
+            verdicts[fact_id] = check_redundancy(fact_id, fact_statement, unit, existing_facts)
+    
+    rows = {}
+    for fact_id, fact_statement, _, _ in facts:
+        is_redundant, reasoning = verdicts[fact_id]
+        if is_redundant is None:
+            logging.error(f"Failed to check redundancy for fact {fact_id}")
+            rows[fact_id] = None
+            continue
+        rows[fact_id] = build_final_row(fact_id, fact_statement, unit, is_redundant, reasoning)
+    return rows
+
+def fill_metadata_in_batch(rows, curricula):
+    """
+    Generate metadata for every non-redundant Final Facts row through the Anthropic Message Batches API
+    and fill in the metadata columns in place. curricula holds each row's curriculum.
+    """
+    requests = {}
+    for index, (row, curriculum) in enumerate(zip(rows, curricula)):
+        if row[3] == "False":
+            request = build_metadata_request(row[2], curriculum)
+            if request is None:
+                set_metadata_columns(row, METADATA_ERROR)
+                continue
+            requests[f"metadata-{index}"] = request
+    
+    logging.info(f"Generating metadata for {len(requests)} facts through the batch API")
+    results = llm_batch.run_cached_tool_batch("anthropic", "final-facts-metadata", requests)
+    
+    for custom_id in requests:
+        row = rows[int(custom_id.split("-")[1])]
+        set_metadata_columns(row, normalize_metadata(results.get(custom_id)))
+
+def process_facts(max_workers=None):
     """
     Main function to process facts from input sheet and append results to output sheet.
+    Facts are grouped by unit into batches of configs.event["redundancy_batch_size"] that share one
+    redundancy request. Batches run on a bounded thread pool (configs.event["finalize_concurrency"]),
+    and once a batch has its verdicts, each non-redundant fact's metadata call is queued on the same
+    pool as its own task; rows are still appended in input order. With configs.event["batch_mode"]
+    enabled, metadata for all non-redundant facts is generated through the batch API once the
+    redundancy checks are done.
     """
+    if max_workers is None:
+        max_workers = configs.event.get("finalize_concurrency", 8)
+    
     # Setup sheets
     input_sheet, output_sheet = setup_sheets()
     
@@ -211,7 +456,8 @@ def process_facts():
     existing_output_data = output_sheet.get_all_records()
     processed_fact_ids = {row.get('Fact ID') for row in existing_output_data if row.get('Fact ID')}
     
-    # Process each record
+    # Collect the facts to finalize, skipping processed facts and duplicate IDs within this run
+    pending = []
     for record in input_records:
         # Extract data from record
         fact_id = record.get('Fact ID', '')
@@ -224,61 +470,80 @@ def process_facts():
             logging.warning(f"Missing required data for record: {record}")
             continue
         
-        # Skip if fact has already been processed
+        # Skip if fact has already been processed (or is already queued in this run)
         if fact_id in processed_fact_ids:
             logging.info(f"Fact {fact_id} already processed, skipping")
             continue
+        processed_fact_ids.add(fact_id)
         
-        # Get existing facts for the unit
-        try:
-            existing_facts = hf.get_facts_for_unit(unit)
-            facts_text = "\n".join([f"- {fact}" for fact in existing_facts])
-        except Exception as e:
-            logging.error(f"Error getting facts for unit {unit}: {str(e)}")
-            facts_text = "No existing facts found."
-        
-        # Check for redundancy
-        is_redundant, reasoning = check_redundancy(fact_id, fact_statement, unit, facts_text)
-        
-        if is_redundant is not None:
-            # Initialize values for metadata fields
-            metadata = {
-                "classification": "",
-                "definition": "",
-                "date": "",
-                "theme": "",
-                "cluster": "",
-                "learning_objective": ""
-            }
-            
-            # If not redundant, generate metadata
-            if is_redundant is False:
-                logging.info(f"Fact {fact_id} is not redundant, generating metadata")
-                metadata = generate_metadata(fact_statement, curriculum)
-            
-            # Prepare row for output sheet with metadata
-            new_row = [
-                unit, 
-                fact_id, 
-                fact_statement, 
-                str(is_redundant), 
-                reasoning,
-                metadata.get("classification", ""),
-                metadata.get("definition", ""),
-                metadata.get("date", ""),
-                metadata.get("theme", ""),
-                metadata.get("cluster", ""),
-                metadata.get("learning_objective", "")
-            ]
+        pending.append((fact_id, fact_statement, unit, curriculum))
+    
+    # Group facts by unit into batches that share one redundancy prompt
+    batch_size = max(1, configs.event.get("redundancy_batch_size", 1))
+    facts_by_unit = {}
+    for fact in pending:
+        facts_by_unit.setdefault(str(fact[2]), []).append(fact)
+    batches = []
+    for unit, unit_facts in facts_by_unit.items():
+        for start in range(0, len(unit_facts), batch_size):
+            batches.append((unit_facts[start][2], unit_facts[start:start + batch_size]))
+    
+    logging.info(f"Finalizing {len(pending)} facts in {len(batches)} batches with up to {max_workers} workers")
+    
+    # In batch mode metadata is generated for all facts at once after the redundancy checks
+    batch_metadata = llm_batch.get_batch_settings()["enabled"]
+    deferred_rows = []
+    deferred_curricula = []
+    
+    # Buffer output rows and append them in batches instead of one request per fact
+    output_writer = sheets_writer.SheetAppendWriter(output_sheet, chunk_rows=50, flush_interval=30.0)
+    
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def check_batch(unit, batch):
+                """Verdicts for one batch, then one metadata task per non-redundant fact."""
+                rows = finalize_batch(unit, batch)
+                metadata_futures = {}
+                if not batch_metadata:
+                    for fact_id, _, _, curriculum in batch:
+                        if rows[fact_id] is not None and rows[fact_id][3] == "False":
+                            metadata_futures[fact_id] = executor.submit(fill_metadata, rows[fact_id], curriculum)
+                return rows, metadata_futures
             
-            # Append to output sheet
-            output_sheet.append_row(new_row)
-            logging.info(f"Added fact {fact_id} to output sheet with metadata")
+            future_by_fact = {}
+            for unit, batch in batches:
+                future = executor.submit(check_batch, unit, batch)
+                for fact in batch:
+                    future_by_fact[fact[0]] = future
             
-            # Add to processed facts to avoid processing again in this run
-            processed_fact_ids.add(fact_id)
-        else:
-            logging.error(f"Failed to check redundancy for fact {fact_id}")
+            # Consume results in input order so the output order is deterministic
+            for fact_id, _, _, curriculum in pending:
+                try:
+                    rows, metadata_futures = future_by_fact[fact_id].result()
+                    new_row = rows[fact_id]
+                    if fact_id in metadata_futures:
+                        metadata_futures[fact_id].result()
+                except Exception as e:
+                    logging.error(f"Error finalizing fact {fact_id}: {str(e)}")
+                    continue
+                if new_row is None:
+                    continue
+                if batch_metadata:
+                    deferred_rows.append(new_row)
+                    deferred_curricula.append(curriculum)
+                    continue
+                
+                # Queue for the output sheet; flushed in batches
+                output_writer.append(new_row)
+                logging.info(f"Added fact {fact_id} to output sheet with metadata")
+        
+        if deferred_rows:
+            fill_metadata_in_batch(deferred_rows, deferred_curricula)
+            output_writer.append_rows(deferred_rows)
+            logging.info(f"Added {len(deferred_rows)} facts to output sheet with batch-generated metadata")
+    finally:
+        # Push whatever is still buffered, even if processing stopped early
+        output_writer.flush()
 
 if __name__ == "__main__":
     logging.info("Starting fact finalization process")
@@ -0,0 +1,86 @@
+import json
+import threading
+import configs
+
+# Columns every grading file starts with
+GRADE_PREFIX_HEADERS = ['Question ID', 'Question', 'Question Type', 'Unit', 'Response']
+# Columns every grading file ends with
+GRADE_SUFFIX_HEADERS = ['Total Score', 'Raw JSON']
+
+class GradeProjector:
+    """
+    Maps a grading tool call to a grading-file row in one pass over its subParts.
+    Compiled once per question type from the tool's input schema and the column names in
+    configs.grading_outputs. The subPart field that identifies a part is 'id' if the schema has one,
+    otherwise 'name', and its enum gives the parts in column order. Raises ValueError if the enum is
+    missing or the configured columns do not cover exactly its parts.
+    Parts missing from the answer keep score 0 and an empty evaluation; parts the layout does not know
+    still count towards the total, as the per-type writers did.
+    """
+    def __init__(self, question_type, tool, layout):
+        part_schema = tool["input_schema"]["properties"]["subParts"]["items"]["properties"]
+        self.question_type = question_type
+        self.key_field = "id" if "id" in part_schema else "name"
+        self.file_path = layout["file"]
+
+        keys = part_schema[self.key_field].get("enum")
+        if not keys:
+            raise ValueError(f"{question_type} grading tool has no enum for subPart '{self.key_field}'")
+        columns = layout["columns"]
+        missing = [key for key in keys if key not in columns]
+        unknown = [key for key in columns if key not in keys]
+        if missing or unknown:
+            raise ValueError(
+                f"{question_type} grading columns do not match the tool schema: "
+                f"no columns for {missing}, columns for unknown parts {unknown}"
+            )
+        # [(part key, score column, evaluation column)] in schema order
+        self.parts = [(key, *columns[key]) for key in keys]
+        parts = self.parts
+        self.headers = GRADE_PREFIX_HEADERS + [
+            header for _, score_header, evaluation_header in parts for header in (score_header, evaluation_header)
+        ] + GRADE_SUFFIX_HEADERS
+        # Row position of each part's score; the evaluation follows it
+        prefix = len(GRADE_PREFIX_HEADERS)
+        self.score_columns = {key: prefix + 2 * index for index, (key, _, _) in enumerate(parts)}
+        self.template = [None] * prefix + [0, ''] * len(parts) + [0, None]
+
+    def project(self, question_id, question, question_type, unit, response, grading_json):
+        """Build the grading row for a tool call's input."""
+        row = self.template[:]
+        row[0:5] = [question_id, question, question_type, unit, response]
+
+        key_field = self.key_field
+        score_columns = self.score_columns
+        unknown_scores = None
+        for part in grading_json['subParts']:
+            column = score_columns.get(part[key_field])
+            if column is None:
+                # A part the layout has no column for (last answer wins, like a known part)
+                if unknown_scores is None:
+                    unknown_scores = {}
+                unknown_scores[part[key_field]] = part['score']
+                continue
+            row[column] = part['score']
+            row[column + 1] = part['response_evaluation']
+
+        total_score = sum(row[column] for column in score_columns.values())
+        if unknown_scores:
+            total_score += sum(unknown_scores.values())
+        row[-2] = total_score
+        row[-1] = json.dumps(grading_json)
+        return row
+
+_projectors = {}
+_projectors_lock = threading.Lock()
+
+def get_projector(question_type):
+    """Return the compiled GradeProjector for a question type (KeyError if it has no grading layout)."""
+    with _projectors_lock:
+        if question_type not in _projectors:
+            _projectors[question_type] = GradeProjector(
+                question_type,
+                configs.anthropic_tools[question_type],
+                configs.grading_outputs[question_type]
+            )
+        return _projectors[question_type]
@@ -1,27 +1,39 @@
 import os
 import csv
-import gspread
 import json
 import logging
 import sys
-from google.oauth2.service_account import Credentials
 import configs
+import csv_sink
+import fact_store
+import grade_writer
+import run_journal
+import sheets_session
+import sheets_writer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# Columns of the FRQ output CSV and the FRQ Responses sheet
+FRQ_HEADERS = [
+    "Question ID",
+    "Question",
+    "Question Type",
+    "Unit",
+    "Responses",
+    "Facts Referenced",
+    "Combined Response with Facts",
+    "Reasoning",
+    "Raw JSON"
+]
+
 def setup_google_sheet(credentials_file, spreadsheet_id, sheet_name):
     """
     Sets up and returns a Google Sheet worksheet.
+    Authorization, the spreadsheet and the worksheet handle are cached by sheets_session,
+    so repeated calls reuse one keep-alive HTTP session.
     """
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    creds = Credentials.from_service_account_file(credentials_file, scopes=scopes)
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    return sheet
+    return sheets_session.get_session(credentials_file).worksheet(spreadsheet_id, sheet_name)
 
 def get_input_sheet():
     """
@@ -74,24 +86,12 @@ def get_question_inputs(records):
     # Return a list of tuples with all the question data
     return list(zip(questions, question_types, units, question_ids))
 
-def setup_output_files():
+def setup_output_files(resume=False):
     """
     Sets up output files for FRQ responses and grading.
+    With resume=True existing grading files are kept so a restarted run can append to them.
     Returns a tuple of (frq_output_path, output_files)
     """
-    # Setup FRQ output file
-    frq_headers = [
-        "Question ID",
-        "Question",
-        "Question Type",
-        "Unit",
-        "Responses",
-        "Facts Referenced",
-        "Combined Response with Facts",
-        "Reasoning",
-        "Raw JSON"
-    ]
-    
     output_folder = "outputs"
     os.makedirs(output_folder, exist_ok=True)
     os.makedirs(f"{output_folder}/grading", exist_ok=True)
@@ -104,61 +104,49 @@ def setup_output_files():
     if not os.path.exists(frq_output_path):
         try:
             with open(frq_output_path, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=frq_headers)
+                writer = csv.DictWriter(csvfile, fieldnames=FRQ_HEADERS)
                 writer.writeheader()
             logging.info(f"Created output CSV file with headers: {frq_output_path}")
         except Exception as e:
             logging.error(f"Failed to create output CSV file: {str(e)}")
             sys.exit(1)
     
-    # Create output files for grading
-    saq_headers = [
-        'Question ID', 'Question', 'Question Type', 'Unit', 'Response',
-        'Part A Score', 'Part A Evaluation',
-        'Part B Score', 'Part B Evaluation',
-        'Part C Score', 'Part C Evaluation',
-        'Total Score', 'Raw JSON'
-    ]
-    
-    leq_headers = [
-        'Question ID', 'Question', 'Question Type', 'Unit', 'Response',
-        'Thesis Construction Score', 'Thesis Response Evaluation',
-        'Contextualization Score', 'Contextualization Response Evaluation',
-        'LEQ Outside Evidence Score', 'LEQ Outside Evidence Response Evaluation',
-        'Historical Reasoning Score', 'Historical Reasoning Response Evaluation',
-        'LEQ Complexity Score', 'LEQ Complexity Response Evaluation',
-        'Total Score', 'Raw JSON'
-    ]
-    
-    dbq_headers = [
-        'Question ID', 'Question', 'Question Type', 'Unit', 'Response',
-        'Thesis Construction Score', 'Thesis Response Evaluation',
-        'Contextualization Score', 'Contextualization Response Evaluation',
-        'Document Use Score', 'Document Use Response Evaluation',
-        'DBQ Outside Evidence Score', 'DBQ Outside Evidence Response Evaluation',
-        'Document Analysis Score', 'Document Analysis Response Evaluation',
-        'Historical Reasoning Score', 'Historical Reasoning Response Evaluation',
-        'DBQ Complexity Score', 'DBQ Complexity Response Evaluation',
-        'Total Score', 'Raw JSON'
-    ]
-    
-    # Create output files with appropriate headers
-    output_files = {
-        'SAQs': ('outputs/grading/saq_graded.csv', saq_headers),
-        'LEQs': ('outputs/grading/leq_graded.csv', leq_headers),
-        'DBQs': ('outputs/grading/dbq_graded.csv', dbq_headers)  
-    }
+    # Create output files for grading; columns come from each type's grade projector
+    output_files = {}
+    for question_type in configs.grading_outputs:
+        projector = grade_writer.get_projector(question_type)
+        output_files[question_type] = (projector.file_path, projector.headers)
     
     for file_path, headers in output_files.values():
+        if resume and os.path.exists(file_path):
+            logging.info(f"Resuming with existing grading file: {file_path}")
+            continue
         with open(file_path, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(headers)
     
     return frq_output_path, output_files
 
-def write_to_frq_sheet(frq_output_path):
+def append_rows_to_sheet(sheet_name, headers, data_to_append):
+    """
+    Appends rows after the existing data of a worksheet, writing the headers first if the sheet is empty.
+    Uses chunked values.append calls, so the sheet's existing contents are never downloaded.
+    """
+    with sheets_writer.open_writer(sheet_name, headers) as writer:
+        writer.append_rows(data_to_append)
+
+def get_grading_sheet_name(question_type):
+    """
+    Returns the grading sheet name for a question type (configurable in configs.event["google_sheet"]).
+    """
+    google_sheet_info = configs.event.get("google_sheet", {})
+    key = f"{question_type.lower()[:-1]}_grading_sheet_name"
+    return google_sheet_info.get(key, f"{question_type[:-1]} Grading")
+
+def write_to_frq_sheet(frq_output_path, journal=None):
     """
     Writes FRQ responses from CSV to Google Sheet.
+    With a run journal, rows already synced are skipped and newly written rows are marked as synced.
     """
     google_sheet_info = configs.event.get("google_sheet")
     if not google_sheet_info:
@@ -166,86 +154,49 @@ def write_to_frq_sheet(frq_output_path):
         return
     
     try:
-        output_sheet = setup_google_sheet(
-            google_sheet_info["credentials_file"],
-            google_sheet_info["spreadsheet_id"],
-            google_sheet_info["frq_output_sheet_name"]
-        )
-        
-        # Get all values to find the next empty row
-        existing_values = output_sheet.get_all_values()
-        next_row = len(existing_values) + 1
-        
-        # Ensure headers exist if sheet is empty
-        if not existing_values:
-            output_sheet.update("A1", [["Question ID", "Question", "Question Type", "Unit", 
-                                "Responses", "Facts Referenced", "Combined Response with Facts",
-                                "Reasoning", "Raw JSON"]])
-            next_row = 2  # Start data at row 2
-        
         # Read from CSV file
         with open(frq_output_path, 'r', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             rows = list(reader)
         
+        if journal is not None and journal.resumed:
+            # The interrupted run may have left an older row for a question that was later redone
+            rows = run_journal.latest_rows(rows)
+        
         # Prepare data to append
         data_to_append = []
+        synced_ids = set()
         for row in rows:
-            data_to_append.append([
-                row['Question ID'],
-                row['Question'],
-                row['Question Type'],
-                row['Unit'],
-                row['Responses'],
-                row['Facts Referenced'],
-                row['Combined Response with Facts'],
-                row['Reasoning'],
-                row['Raw JSON']
-            ])
+            if journal is not None:
+                # Skip rows already pushed (by this run's background sync or the interrupted run)
+                if journal.is_done(row['Question ID'], "synced"):
+                    continue
+                synced_ids.add(row['Question ID'])
+            data_to_append.append([row[header] for header in FRQ_HEADERS])
         
-        # Append all rows at once (faster than one by one)
-        if data_to_append:
-            output_sheet.update(f"A{next_row}", data_to_append)
+        append_rows_to_sheet(google_sheet_info["frq_output_sheet_name"], FRQ_HEADERS, data_to_append)
+        
+        if journal is not None:
+            for question_id in synced_ids:
+                journal.mark(question_id, "synced")
             
         logging.info(f"Successfully appended {len(data_to_append)} FRQ responses to Google Sheet")
     except Exception as e:
         logging.error(f"Failed to write to Google Sheet: {str(e)}")
 
-def write_to_grading_sheet(grading_outputs):
+def write_to_grading_sheet(grading_outputs, journal=None):
     """
     Writes grading results from CSV files to Google Sheets (one sheet per question type).
+    With a run journal, rows already synced are skipped and newly written rows are marked as grade_synced.
     """
     google_sheet_info = configs.event.get("google_sheet")
     if not google_sheet_info:
         logging.error("No Google Sheet information for writing grading results")
         return
     
-    # Sheet names for each question type should be provided in the config
-    sheet_mapping = {
-        'SAQs': google_sheet_info.get("saq_grading_sheet_name", "SAQ Grading"),
-        'LEQs': google_sheet_info.get("leq_grading_sheet_name", "LEQ Grading"),
-        'DBQs': google_sheet_info.get("dbq_grading_sheet_name", "DBQ Grading")
-    }
-    
     # Process each question type
     for question_type, (file_path, headers) in grading_outputs.items():
         try:
-            # Get the appropriate sheet for this question type
-            output_sheet = setup_google_sheet(
-                google_sheet_info["credentials_file"],
-                google_sheet_info["spreadsheet_id"],
-                sheet_mapping[question_type]
-            )
-            
-            # Get all values to find the next empty row
-            existing_values = output_sheet.get_all_values()
-            next_row = len(existing_values) + 1
-            
-            # Ensure headers exist if sheet is empty
-            if not existing_values:
-                output_sheet.update("A1", [headers])
-                next_row = 2  # Start data at row 2
-            
             # Read data from CSV
             data_to_append = []
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -253,9 +204,15 @@ def write_to_grading_sheet(grading_outputs):
                 next(reader)  # Skip header
                 data_to_append = list(reader)
             
-            # Append data if available
-            if data_to_append:
-                output_sheet.update(f"A{next_row}", data_to_append)
+            if journal is not None:
+                # Question ID is the first column of every grading file
+                data_to_append = [row for row in data_to_append if not journal.is_done(row[0], "grade_synced")]
+            
+            append_rows_to_sheet(get_grading_sheet_name(question_type), headers, data_to_append)
+            
+            if journal is not None:
+                for row in data_to_append:
+                    journal.mark(row[0], "grade_synced")
                 
             logging.info(f"Successfully appended {len(data_to_append)} {question_type} grading results to Google Sheet")
         except Exception as e:
@@ -267,34 +224,26 @@ def get_facts_for_unit(unit_string):
     Read facts from the corresponding unit's CSV file(s).
     Input could be a single unit or multiple units (e.g., '12', '589').
     Returns facts combined from all specified units.
+    Served from the in-memory FactStore, which only re-reads a file when its mtime changes.
     """
-    # Parse unit string into individual unit numbers
-    unit_numbers = [int(digit) for digit in str(unit_string)]
-    
-    facts_dir = "KS_facts"
-    all_facts = []
-    
-    # Collect facts from each unit
-    for unit_number in unit_numbers:
-        found = False
-        for filename in os.listdir(facts_dir):
-            if filename.startswith(f"unit{unit_number}") and filename.endswith(".csv"):
-                facts_path = os.path.join(facts_dir, filename)
-                with open(facts_path, "r", encoding="utf-8") as f:
-                    reader = csv.reader(f)
-                    next(reader)  # Skip header row
-                    unit_facts = [row[2] for row in reader if row and len(row) > 2]  # Column C (index 2)
-                    all_facts.extend(unit_facts)
-                found = True
-                break
-        
-        if not found:
-            logging.warning(f"No facts file found for unit {unit_number}")
-    
-    if not all_facts:
-        raise FileNotFoundError(f"No facts files found for any unit in {unit_string}")
-    
-    return "\n".join(all_facts)
+    return fact_store.get_fact_store().get_unit_text(unit_string)
+
+def build_frq_row(question_id, question, question_type, unit, function_args):
+    """
+    Builds an FRQ output row (in FRQ_HEADERS order) from the generation tool call arguments.
+    """
+    responses, facts_referenced, combined = format_response_data(function_args, question_type)
+    return [
+        question_id,
+        question,
+        question_type,
+        unit,
+        responses,
+        facts_referenced,
+        combined,
+        function_args["reasoning"],
+        json.dumps(function_args)
+    ]
 
 def format_response_data(function_args, question_type):
     """
@@ -346,135 +295,46 @@ def format_response_data(function_args, question_type):
     # Return empty strings if question type not recognized
     return "", "", ""
 
-def write_saq_grade(file_path, question_id, question, question_type, unit, responses, grading_json):
-    # Initialize scores and evaluations
-    part_scores = {'a': 0, 'b': 0, 'c': 0}
-    part_evals = {'a': '', 'b': '', 'c': ''}
-    
-    # Extract scores and evaluations from grading JSON
-    for part in grading_json['subParts']:
-        part_id = part['id']
-        part_scores[part_id] = part['score']
-        part_evals[part_id] = part['response_evaluation']
-    
-    total_score = sum(part_scores.values())
-    
-    with open(file_path, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            question_id,
-            question,
-            question_type,
-            unit,
-            responses,
-            part_scores['a'],
-            part_evals['a'],
-            part_scores['b'],
-            part_evals['b'],
-            part_scores['c'],
-            part_evals['c'],
-            total_score,
-            json.dumps(grading_json)
-        ])
-
-def write_leq_grade(file_path, question_id, question, question_type, unit, responses, grading_json):
-    # Initialize scores dictionary
-    skill_scores = {
-        'Thesis Construction': 0,
-        'Contextualization': 0,
-        'LEQ Outside Evidence': 0,
-        'Historical Reasoning': 0,
-        'LEQ Complexity': 0
-    }
-    skill_evals = {
-        'Thesis Construction': '',
-        'Contextualization': '',
-        'LEQ Outside Evidence': '',
-        'Historical Reasoning': '',
-        'LEQ Complexity': ''
-    }
+def get_cited_fact_ids(function_args, question_type):
+    """
+    Returns the fact IDs cited in a generation tool call (facts_referenced of every SAQ part, or facts_used).
+    """
+    if question_type == "SAQs":
+        return [
+            fact_id
+            for part in function_args.get("answers", {}).values()
+            for fact_id in part.get("facts_referenced", [])
+        ]
+    return list(function_args.get("facts_used", []))
 
-    # Extract scores from grading JSON
-    for part in grading_json['subParts']:
-        skill = part['name']
-        skill_scores[skill] = part['score']
-        skill_evals[skill] = part['response_evaluation']
-    
-    total_score = sum(skill_scores.values())
-    
-    with open(file_path, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            question_id,
-            question,
-            question_type,
-            unit,
-            responses,
-            skill_scores['Thesis Construction'],
-            skill_evals['Thesis Construction'],
-            skill_scores['Contextualization'],
-            skill_evals['Contextualization'],
-            skill_scores['LEQ Outside Evidence'],
-            skill_evals['LEQ Outside Evidence'],
-            skill_scores['Historical Reasoning'],
-            skill_evals['Historical Reasoning'],
-            skill_scores['LEQ Complexity'],
-            skill_evals['LEQ Complexity'],
-            total_score,
-            json.dumps(grading_json)
-        ])
+def parse_facts_referenced(facts_referenced):
+    """
+    Split a Facts Referenced cell (as written by format_response_data) back into fact IDs.
+    Handles both the SAQ layout ("a Facts:\nid1, id2\n\nb Facts:...") and the LEQ/DBQ "id1, id2".
+    """
+    fact_ids = []
+    for line in facts_referenced.splitlines():
+        line = line.strip()
+        if not line or line.endswith("Facts:"):
+            continue
+        fact_ids.extend(fact_id.strip() for fact_id in line.split(",") if fact_id.strip())
+    return fact_ids
 
-def write_dbq_grade(file_path, question_id, question, question_type, unit, responses, grading_json):
-    # Initialize scores dictionary
-    skill_scores = {
-        'Thesis Construction': 0,
-        'Contextualization': 0,
-        'Document Use': 0,
-        'DBQ Outside Evidence': 0,
-        'Document Analysis': 0,
-        'Historical Reasoning': 0,
-        'DBQ Complexity': 0
-    }
-    skill_evals = {
-        'Thesis Construction': '',
-        'Contextualization': '',
-        'Document Use': '',
-        'DBQ Outside Evidence': '',
-        'Document Analysis': '',
-        'Historical Reasoning': '',
-        'DBQ Complexity': ''
-    }
+def build_grade_row(question_id, question, question_type, unit, responses, grading_json):
+    """
+    Builds the grading row for any question type with its compiled projector.
+    Raises if the grading tool call is malformed (e.g. no subParts).
+    """
+    return grade_writer.get_projector(question_type).project(question_id, question, question_type, unit, responses, grading_json)
 
-    # Extract scores from grading JSON
-    for part in grading_json['subParts']:
-        skill = part['name']
-        skill_scores[skill] = part['score']
-        skill_evals[skill] = part['response_evaluation']
+def write_grade(file_path, question_id, question, question_type, unit, responses, grading_json, on_commit=None):
+    """
+    Builds the grading row for any question type with its compiled projector and appends it to file_path.
+    Returns the row.
+    """
+    row = build_grade_row(question_id, question, question_type, unit, responses, grading_json)
     
-    total_score = sum(skill_scores.values())
+    # Appended by the single CSV writer thread; on_commit runs once the row is on disk
+    csv_sink.get_sink().write(file_path, row, on_commit)
     
-    with open(file_path, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            question_id,
-            question,
-            question_type,
-            unit,
-            responses,
-            skill_scores['Thesis Construction'],
-            skill_evals['Thesis Construction'],
-            skill_scores['Contextualization'],
-            skill_evals['Contextualization'],
-            skill_scores['Document Use'],
-            skill_evals['Document Use'],
-            skill_scores['DBQ Outside Evidence'],
-            skill_evals['DBQ Outside Evidence'],
-            skill_scores['Document Analysis'],
-            skill_evals['Document Analysis'],
-            skill_scores['Historical Reasoning'],
-            skill_evals['Historical Reasoning'],
-            skill_scores['DBQ Complexity'],
-            skill_evals['DBQ Complexity'],
-            total_score,
-            json.dumps(grading_json)
-        ])
\ No newline at end of file
+    return row
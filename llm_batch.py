@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import anthropic
+import openai
+import configs
+import llm_cache
+
+BATCH_DIR = os.path.join("outputs", "batches")
+
+# Batches in these states will not change any more
+ANTHROPIC_DONE_STATES = {"ended"}
+OPENAI_DONE_STATES = {"completed", "failed", "expired", "cancelled"}
+
+def get_batch_settings():
+    """The batch_mode settings from configs, with defaults filled in."""
+    settings = {"enabled": False, "poll_interval": 60, "max_requests_per_batch": 10000}
+    settings.update(configs.event.get("batch_mode", {}))
+    return settings
+
+def to_batch_line(provider, custom_id, request):
+    """One line of a batch input file in the provider's format."""
+    if provider == "anthropic":
+        return {"custom_id": custom_id, "params": request}
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": request}
+
+def write_batch_file(path, provider, requests):
+    """Serialize {custom_id: request} to a JSONL batch file and return its SHA-256."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, request in requests.items():
+            line = json.dumps(to_batch_line(provider, custom_id, request), ensure_ascii=False, sort_keys=True) + "\n"
+            f.write(line)
+            digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+def submit_batch(provider, path):
+    """Submit a batch input file and return the provider's batch ID."""
+    if provider == "anthropic":
+        with open(path, "r", encoding="utf-8") as f:
+            batch_requests = [json.loads(line) for line in f if line.strip()]
+        client = anthropic.Anthropic(api_key=configs.event["anthropic_api_key"])
+        return client.messages.batches.create(requests=batch_requests).id
+
+    client = openai.OpenAI(api_key=configs.event["openai_api_key"])
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    ).id
+
+def wait_for_batch(provider, batch_id, poll_interval):
+    """Poll a batch until the provider reports it finished; returns the final status."""
+    if provider == "anthropic":
+        client = anthropic.Anthropic(api_key=configs.event["anthropic_api_key"])
+    else:
+        client = openai.OpenAI(api_key=configs.event["openai_api_key"])
+
+    while True:
+        if provider == "anthropic":
+            batch = client.messages.batches.retrieve(batch_id)
+            status = batch.processing_status
+            counts = batch.request_counts
+            progress = f"{counts.succeeded + counts.errored + counts.canceled + counts.expired} done, {counts.processing} processing"
+            done = status in ANTHROPIC_DONE_STATES
+        else:
+            batch = client.batches.retrieve(batch_id)
+            status = batch.status
+            counts = batch.request_counts
+            progress = f"{counts.completed + counts.failed}/{counts.total} done" if counts else ""
+            done = status in OPENAI_DONE_STATES
+
+        logging.info(f"Batch {batch_id} is {status} ({progress})")
+        if done:
+            return status
+        time.sleep(poll_interval)
+
+def fetch_results(provider, batch_id):
+    """
+    Return {custom_id: response} for a finished batch, where response is the Anthropic message or the
+    OpenAI chat completion as a dict. Requests that errored, expired or were canceled map to None.
+    """
+    results = {}
+    if provider == "anthropic":
+        client = anthropic.Anthropic(api_key=configs.event["anthropic_api_key"])
+        for entry in client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = entry.result.message.model_dump()
+            else:
+                logging.error(f"Batch request {entry.custom_id} did not succeed: {entry.result.type}")
+                results[entry.custom_id] = None
+        return results
+
+    client = openai.OpenAI(api_key=configs.event["openai_api_key"])
+    batch = client.batches.retrieve(batch_id)
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") == 200:
+                results[entry["custom_id"]] = response["body"]
+            else:
+                logging.error(f"Batch request {entry['custom_id']} did not succeed: {entry.get('error') or response}")
+                results[entry["custom_id"]] = None
+    return results
+
+def get_tool_input(provider, response):
+    """The first tool call's input from a batch response, or None."""
+    if response is None:
+        return None
+    if provider == "anthropic":
+        for content in response.get("content", []):
+            if content.get("type") == "tool_use":
+                return content["input"]
+        return None
+    tool_calls = response["choices"][0]["message"].get("tool_calls") or []
+    if not tool_calls:
+        return None
+    return json.loads(tool_calls[0]["function"]["arguments"])
+
+def run_batch(provider, name, requests, poll_interval=None):
+    """
+    Send {custom_id: request} through the provider's batch API and return {custom_id: response}.
+    Requests are split into batches of max_requests_per_batch, each written to
+    outputs/batches/<name>-<part>.<provider>.jsonl. A state file next to each input remembers the
+    submitted batch ID, so a restarted run with the same input resumes polling instead of resubmitting.
+    """
+    settings = get_batch_settings()
+    if poll_interval is None:
+        poll_interval = settings["poll_interval"]
+    chunk_size = settings["max_requests_per_batch"]
+
+    custom_ids = list(requests)
+    submitted = []
+    for part, start in enumerate(range(0, len(custom_ids), chunk_size), start=1):
+        chunk = {custom_id: requests[custom_id] for custom_id in custom_ids[start:start + chunk_size]}
+        path = os.path.join(BATCH_DIR, f"{name}-{part}.{provider}.jsonl")
+        input_hash = write_batch_file(path, provider, chunk)
+
+        state_path = f"{path}.state.json"
+        state = {}
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+
+        if state.get("input_hash") == input_hash and state.get("batch_id"):
+            logging.info(f"Resuming batch {state['batch_id']} for {path}")
+        else:
+            state = {"batch_id": submit_batch(provider, path), "input_hash": input_hash}
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            logging.info(f"Submitted {len(chunk)} requests from {path} as batch {state['batch_id']}")
+        submitted.append(state["batch_id"])
+
+    results = {}
+    for batch_id in submitted:
+        wait_for_batch(provider, batch_id, poll_interval)
+        results.update(fetch_results(provider, batch_id))
+    return results
+
+def run_cached_tool_batch(provider, name, requests, poll_interval=None):
+    """
+    Batch counterpart of llm_cache.cached for tool-calling requests.
+    Requests already in the LLM cache are answered from it; the rest go through run_batch and their
+    tool inputs are cached. Returns {custom_id: tool input or None}.
+    """
+    cache = llm_cache.get_cache()
+    values = {}
+    pending = {}
+    for custom_id, request in requests.items():
+        value = cache.get(cache.make_key(request))
+        if value is not None:
+            values[custom_id] = value
+        else:
+            pending[custom_id] = request
+    logging.info(f"{len(values)} of {len(requests)} {name} requests answered from the LLM cache")
+
+    if pending:
+        responses = run_batch(provider, name, pending, poll_interval)
+        for custom_id, request in pending.items():
+            value = get_tool_input(provider, responses.get(custom_id))
+            if value is not None:
+                cache.put(cache.make_key(request), value)
+            values[custom_id] = value
+    return values
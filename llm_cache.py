@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import configs
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache of LLM results backed by SQLite.
+    Entries are keyed by a hash of the full request (model, messages, tools and parameters)
+    and evicted least-recently-used first once the stored values exceed max_bytes.
+    With bypass=True lookups are skipped but fresh results are still stored.
+    A running byte total is kept so a put only scans the table when the cache may be over its limit.
+    """
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, bypass=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self.conn.commit()
+            self.total_bytes = self._stored_bytes()
+
+    def _stored_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(request):
+        """Hash a request dict into a stable cache key."""
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for a key, or None."""
+        if self.bypass:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store a JSON-serializable value and evict old entries if the cache is over its size limit."""
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time())
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def delete(self, key):
+        """Remove an entry, e.g. a response the caller could not use."""
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous is None:
+                return
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.commit()
+            self.total_bytes -= previous[0]
+
+    def _evict(self):
+        """Drop least recently used entries until the total size is back under max_bytes."""
+        # Other processes share the database, so recount before evicting
+        total = self._stored_bytes()
+        self.total_bytes = total
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.total_bytes = total
+        logging.info(f"Evicted {evicted} entries from LLM cache {self.path}")
+
+    def _lookup(self, key, request, validate):
+        """Return a usable cached value, dropping one that fails validation."""
+        value = self.get(key)
+        if value is None:
+            return None
+        if validate is not None:
+            try:
+                validate(value)
+            except Exception as e:
+                logging.warning(f"Discarding cached {request.get('model')} response that failed validation: {str(e)}")
+                self.delete(key)
+                return None
+        logging.info(f"LLM cache hit for {request.get('model')}")
+        return value
+
+    def cached(self, request, compute, validate=None):
+        """
+        Return the cached result for `request`, or call `compute()` and store its result.
+        None results (failed calls) are never stored. `validate(value)` should raise if the caller
+        cannot use a result; such a result is not stored, and the exception propagates so the
+        caller's retry asks the model again.
+        """
+        key = self.make_key(request)
+        value = self._lookup(key, request, validate)
+        if value is not None:
+            return value
+        value = compute()
+        if value is not None:
+            if validate is not None:
+                validate(value)
+            self.put(key, value)
+        return value
+
+    async def cached_async(self, request, compute, validate=None):
+        """Async counterpart of cached(); `compute` is a zero-argument coroutine function."""
+        key = self.make_key(request)
+        value = self._lookup(key, request, validate)
+        if value is not None:
+            return value
+        value = await compute()
+        if value is not None:
+            if validate is not None:
+                validate(value)
+            self.put(key, value)
+        return value
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide LLMCache configured by configs.event['llm_cache']."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            cache_config = configs.event.get("llm_cache", {})
+            bypass = cache_config.get("bypass", False) or os.getenv("LLM_CACHE_BYPASS", "") not in ("", "0")
+            _default_cache = LLMCache(
+                cache_config.get("path", "outputs/llm_cache.sqlite3"),
+                cache_config.get("max_bytes", 512 * 1024 * 1024),
+                bypass
+            )
+        return _default_cache
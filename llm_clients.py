@@ -0,0 +1,28 @@
+import threading
+from anthropic import Anthropic
+from openai import OpenAI
+import configs
+
+# Synchronous clients are thread-safe, so pool workers share one client (and its connection pool)
+# instead of opening a new one per task. Retries are left to llm_scheduler.
+_anthropic_client = None
+_anthropic_client_lock = threading.Lock()
+
+def get_anthropic_client():
+    """Return the process-wide Anthropic client."""
+    global _anthropic_client
+    with _anthropic_client_lock:
+        if _anthropic_client is None:
+            _anthropic_client = Anthropic(api_key=configs.event["anthropic_api_key"], max_retries=0)
+        return _anthropic_client
+
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Return the process-wide OpenAI client."""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(api_key=configs.event["openai_api_key"], max_retries=0)
+        return _openai_client
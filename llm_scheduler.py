@@ -0,0 +1,323 @@
+import asyncio
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+import statistics
+import anthropic
+import openai
+import configs
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+def estimate_tokens(payload):
+    """
+    Roughly estimate the prompt tokens of a request payload (string, messages, tools, ...).
+    Uses the ~4 characters per token rule of thumb, which is close enough for budgeting.
+    """
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, ensure_ascii=False, default=str)
+    return len(payload) // 4 + 1
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Full-jitter exponential backoff: a random delay in [0, min(cap, base * 2**attempt)].
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def retry_after_seconds(error):
+    """
+    Read the retry-after-ms / retry-after headers from an SDK error, if present.
+    Returns the delay in seconds or None.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        # retry-after may also be an HTTP date
+        try:
+            retry_date = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, retry_date.timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+def is_retryable(error):
+    """Whether an SDK error is transient (rate limit, overload, timeout, connection)."""
+    if isinstance(error, (openai.APIConnectionError, anthropic.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+def get_usage_tokens(response):
+    """Return the total tokens (input + output) reported by an OpenAI or Anthropic response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    # OpenAI chat completions
+    if getattr(usage, "total_tokens", None) is not None:
+        return usage.total_tokens
+    # Anthropic messages
+    input_tokens = getattr(usage, "input_tokens", None)
+    output_tokens = getattr(usage, "output_tokens", None)
+    if input_tokens is None and output_tokens is None:
+        return None
+    return (input_tokens or 0) + (output_tokens or 0)
+
+def get_prompt_cache_usage(response):
+    """
+    Return (input_tokens, cached_input_tokens, cache_write_tokens) for an OpenAI or Anthropic response,
+    or None if the response carries no usage.
+    input_tokens counts every prompt token, whether it was read from the provider's prompt cache or not.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    # OpenAI chat completions: cached tokens are a subset of prompt_tokens
+    if getattr(usage, "prompt_tokens", None) is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        return usage.prompt_tokens, cached_tokens, 0
+    # Anthropic messages: input_tokens excludes cache reads and cache writes
+    input_tokens = getattr(usage, "input_tokens", None)
+    if input_tokens is None:
+        return None
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    return input_tokens + cache_read + cache_write, cache_read, cache_write
+
+class TokenBucket:
+    """
+    A continuously refilling bucket holding up to one minute of quota.
+    Reservations are taken immediately and may drive the level negative, in which case the
+    caller is told how long to wait; this queues callers in arrival order without a background thread.
+    """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take `amount` from the bucket and return the seconds to wait before using it."""
+        self._refill(now)
+        # A single request larger than the whole quota still has to be let through eventually
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    def adjust(self, amount, now):
+        """Charge (positive) or refund (negative) tokens after the real usage is known."""
+        self._refill(now)
+        self.level -= amount
+
+    def pause(self, seconds, now):
+        """Empty the bucket so nothing is admitted for `seconds` (used when the provider says retry-after)."""
+        self._refill(now)
+        self.level = min(self.level, -seconds * self.rate)
+
+class ModelLimiter:
+    """Requests/min and tokens/min buckets for a single model."""
+    def __init__(self, model, requests_per_minute, tokens_per_minute):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = threading.Lock()
+
+    def reserve(self, estimated_tokens):
+        """Reserve one request and the estimated tokens; returns the delay before dispatch."""
+        with self.lock:
+            now = time.monotonic()
+            return max(self.requests.reserve(1, now), self.tokens.reserve(estimated_tokens, now))
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the response reports its real usage."""
+        if actual_tokens is None:
+            return
+        with self.lock:
+            self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def pause(self, seconds):
+        """Stop admitting requests for this model for `seconds`."""
+        with self.lock:
+            now = time.monotonic()
+            self.requests.pause(seconds, now)
+            self.tokens.pause(seconds, now)
+
+class LLMScheduler:
+    """
+    Shared scheduler for every LLM call in the process.
+    Each model gets its own ModelLimiter sized from configs.rate_limits, scaled by a headroom
+    factor so we stay just under the provider quota instead of bouncing off it.
+    """
+    def __init__(self, rate_limits, headroom=0.9):
+        self.rate_limits = rate_limits
+        self.headroom = headroom
+        self.limiters = {}
+        self.prompt_usage = {}
+        self.call_stats = {}
+        self.lock = threading.Lock()
+
+    def limiter(self, model):
+        """Return (creating on first use) the limiter for a model."""
+        with self.lock:
+            if model not in self.limiters:
+                limits = self.rate_limits.get(model, self.rate_limits["default"])
+                self.limiters[model] = ModelLimiter(
+                    model,
+                    limits["requests_per_minute"] * self.headroom,
+                    limits["tokens_per_minute"] * self.headroom
+                )
+            return self.limiters[model]
+
+    def record_prompt_usage(self, model, response):
+        """Accumulate prompt and prompt-cache token counts per model."""
+        usage = get_prompt_cache_usage(response)
+        if usage is None:
+            return
+        with self.lock:
+            totals = self.prompt_usage.setdefault(model, [0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += usage[0]
+            totals[2] += usage[1]
+            totals[3] += usage[2]
+
+    def prompt_cache_report(self):
+        """Per-model request count, prompt tokens, cache reads/writes and cache hit ratio so far."""
+        with self.lock:
+            return {
+                model: {
+                    "requests": requests,
+                    "input_tokens": input_tokens,
+                    "cached_input_tokens": cached_tokens,
+                    "cache_write_tokens": cache_write_tokens,
+                    "cache_hit_ratio": round(cached_tokens / input_tokens, 4) if input_tokens else 0.0
+                }
+                for model, (requests, input_tokens, cached_tokens, cache_write_tokens) in self.prompt_usage.items()
+            }
+
+    def record_call(self, model, seconds, attempts, failed=False):
+        """Record one dispatched call: wall time including rate-limit waits and retries, and attempts made."""
+        with self.lock:
+            stats = self.call_stats.setdefault(model, {"calls": 0, "attempts": 0, "failures": 0, "latencies": []})
+            stats["calls"] += 1
+            stats["attempts"] += attempts
+            if failed:
+                stats["failures"] += 1
+            else:
+                stats["latencies"].append(seconds)
+
+    def call_report(self):
+        """Per-model calls, retries, failures and p50/p95 latency (seconds) of successful calls so far."""
+        with self.lock:
+            report = {}
+            for model, stats in self.call_stats.items():
+                latencies = sorted(stats["latencies"])
+                if len(latencies) > 1:
+                    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+                    p50, p95 = quantiles[49], quantiles[94]
+                else:
+                    p50 = p95 = latencies[0] if latencies else None
+                report[model] = {
+                    "calls": stats["calls"],
+                    "retries": stats["attempts"] - stats["calls"],
+                    "failures": stats["failures"],
+                    "latency_p50": p50,
+                    "latency_p95": p95
+                }
+            return report
+
+    def _retry_delay(self, limiter, error, attempt, max_retries):
+        """Return how long to wait before retrying `error`, or None if it should be raised."""
+        if attempt >= max_retries - 1 or not is_retryable(error):
+            return None
+        delay = retry_after_seconds(error)
+        if delay is not None:
+            # The provider told us when quota frees up; hold back every caller of this model.
+            # The next reserve() then waits out the pause, so no extra sleep is needed here.
+            limiter.pause(delay)
+            return 0.0
+        return backoff_delay(attempt)
+
+    def call(self, model, send, prompt, max_retries=5):
+        """
+        Dispatch a blocking SDK call under the model's rate limits.
+        `send` is a zero-argument callable performing the request; `prompt` is what gets token-estimated.
+        """
+        limiter = self.limiter(model)
+        estimated_tokens = estimate_tokens(prompt)
+        started = time.monotonic()
+
+        for attempt in range(max_retries):
+            wait = limiter.reserve(estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = send()
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt, max_retries)
+                if delay is None:
+                    self.record_call(model, time.monotonic() - started, attempt + 1, failed=True)
+                    raise
+                logging.warning(f"{model} request failed ({str(e)}), retry {attempt + 1} of {max_retries - 1}")
+                if delay > 0:
+                    time.sleep(delay)
+                continue
+
+            limiter.settle(estimated_tokens, get_usage_tokens(response))
+            self.record_prompt_usage(model, response)
+            self.record_call(model, time.monotonic() - started, attempt + 1)
+            return response
+
+    async def call_async(self, model, send, prompt, max_retries=5):
+        """
+        Async counterpart of call(); `send` is a zero-argument callable returning an awaitable.
+        """
+        limiter = self.limiter(model)
+        estimated_tokens = estimate_tokens(prompt)
+        started = time.monotonic()
+
+        for attempt in range(max_retries):
+            wait = limiter.reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                response = await send()
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt, max_retries)
+                if delay is None:
+                    self.record_call(model, time.monotonic() - started, attempt + 1, failed=True)
+                    raise
+                logging.warning(f"{model} request failed ({str(e)}), retry {attempt + 1} of {max_retries - 1}")
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                continue
+
+            limiter.settle(estimated_tokens, get_usage_tokens(response))
+            self.record_prompt_usage(model, response)
+            self.record_call(model, time.monotonic() - started, attempt + 1)
+            return response
+
+# Process-wide scheduler shared by every call site
+scheduler = LLMScheduler(configs.rate_limits, configs.event.get("rate_limit_headroom", 0.9))
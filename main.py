@@ -1,78 +1,89 @@
+import os
+import asyncio
 import csv
 import json
-import time
 import logging
-import multiprocessing
-from openai import OpenAI
-from anthropic import Anthropic
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+import columnar_sink
 import configs
+import csv_sink
+import fact_coverage
+import fact_retrieval
 import helper_functions
+import llm_batch
+import llm_cache
+import llm_scheduler
+import prompt_layout
+import run_journal
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-def process_frq(question_tuple, output_path, lock, max_retries=5):
+async def process_frq(openai_client, semaphore, question_tuple, output_path, journal=None, max_retries=5):
     """
-    Process a single FRQ question using OpenAI API and write results to the output file.
+    Process a single FRQ question using the async OpenAI client and write results to the output file.
+    The semaphore bounds how many requests are in flight at once.
+    The question is marked as generated in the run journal once its row is on disk.
     """
-    # Initialize OpenAI client inside the process
-    openai_client = OpenAI(api_key=configs.event["openai_api_key"])
-    
     question, question_type, unit, question_id = question_tuple
     
     try:
-        # Get facts for this specific question's unit
-        facts = helper_functions.get_facts_for_unit(unit)
+        # Get the facts for this question's units that are most relevant to the question
+        facts = fact_retrieval.get_fact_context(question, question_type, unit)
         
-        instructions = f"""
-            Using JUST the following facts, respond to the inputted AP World History free-response question (FRQ). Consider the following scoring notes for these types of questions:
-            <notes>
-            {configs.notes[question_type]}
-            </notes>
-            <facts>
-            {facts}
-            </facts>
-            Make a note of the fact ids used as you respond to the FRQ. If the question has multiple parts (i.e., a, b, and c), none of the parts can have the same answer.
-            """
+        # Static instructions first, then notes, then facts, so requests of the same type/unit share a prefix
+        instructions = prompt_layout.build_frq_instructions(configs.notes[question_type], facts)
         
         tools = [configs.openai_tools[question_type]]
         messages = [
             {"role": "developer", "content": instructions},
             {"role": "user", "content": [{"type": "text", "text": question}]},
         ]
+        request = {
+            "model": "o3-mini",
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": "auto",
+            "reasoning_effort": "high"
+        }
+        
+        async def request_function_args():
+            async with semaphore:
+                completion = await llm_scheduler.scheduler.call_async(
+                    "o3-mini",
+                    lambda: openai_client.chat.completions.create(**request),
+                    request
+                )
+            
+            # Extract function arguments
+            function_args_str = completion.choices[0].message.tool_calls[0].function.arguments
+            return json.loads(function_args_str)
+        
+        def validate_function_args(function_args):
+            helper_functions.build_frq_row(question_id, question, question_type, unit, function_args)
         
         for retry_count in range(max_retries):
             try:
-                completion = openai_client.chat.completions.create(
-                    model="o3-mini", 
-                    messages=messages, 
-                    tools=tools, 
-                    tool_choice="auto", 
-                    reasoning_effort="high"
+                # Identical requests from earlier runs are answered from the on-disk cache;
+                # a malformed tool call is not cached, so the retry asks again
+                function_args = await llm_cache.get_cache().cached_async(
+                    request, request_function_args, validate_function_args
                 )
                 
-                # Extract function arguments
-                function_args_str = completion.choices[0].message.tool_calls[0].function.arguments
-                function_args = json.loads(function_args_str)
-                
                 # Format the response data
-                responses, facts_referenced, combined = helper_functions.format_response_data(function_args, question_type)
+                row = helper_functions.build_frq_row(question_id, question, question_type, unit, function_args)
                 
-                # Write to output file with lock for thread safety
-                with lock:
-                    with open(output_path, "a", newline="", encoding="utf-8") as f:
-                        writer = csv.writer(f)
-                        writer.writerow([
-                            question_id,
-                            question,
-                            question_type,
-                            unit,
-                            responses,
-                            facts_referenced,
-                            combined,
-                            function_args["reasoning"],
-                            json.dumps(function_args)
-                        ])
+                # The CSV writer thread appends the row; it is marked generated once it is on disk
+                on_commit = None
+                if journal is not None:
+                    on_commit = lambda: journal.mark(question_id, "generated")
+                csv_sink.get_sink().write(output_path, row, on_commit)
+                
+                # Keep the fact ID -> question index current without rescanning outputs
+                fact_coverage.get_index(output_path).record(
+                    question_id, unit, helper_functions.get_cited_fact_ids(function_args, question_type)
+                )
                 
                 logging.info(f"Successfully processed question ID {question_id}")
                 return function_args
@@ -81,7 +92,7 @@ def process_frq(question_tuple, output_path, lock, max_retries=5):
                 logging.error(f"Attempt {retry_count + 1} failed for question ID {question_id}: {str(e)}")
                 if retry_count < max_retries - 1:
                     logging.info(f"Retrying question ID {question_id} after a short delay...")
-                    time.sleep(2)
+                    await asyncio.sleep(llm_scheduler.backoff_delay(retry_count))
                 continue
         
         logging.error(f"Failed to process question ID {question_id} after {max_retries} attempts")
@@ -91,123 +102,220 @@ def process_frq(question_tuple, output_path, lock, max_retries=5):
         logging.error(f"Error processing question ID {question_id} of type '{question_type}' for unit {unit}: {str(e)}")
         return None
 
-def process_grading(row, output_files, grading_prompts, max_retries=3):
-    """Process a single FRQ response for grading using Anthropic API."""
-    # Initialize Anthropic client inside the process
-    anthropic_client = Anthropic(api_key=configs.event["anthropic_api_key"])
-    
-    question_id = row['Question ID']
-    question = row['Question']
+def build_grading_request(row, grading_prompts):
+    """
+    Build the Anthropic grading request for an FRQ response row, or None if its type cannot be graded.
+    """
     question_type = row['Question Type']
-    unit = row['Unit']
-    response = row['Responses']
-
-    # Get the correct tool and prompt for this question type
-    if question_type == 'SAQs':
-        file_path, headers = output_files['SAQs']
-    elif question_type == 'LEQs':
-        file_path, headers = output_files['LEQs']
-    elif question_type == 'DBQs':
-        file_path, headers = output_files['DBQs']
-    else:
+    if question_type not in configs.anthropic_tools:
         logging.error(f"Unknown question type: {question_type}")
-        return
+        return None
     
     if question_type not in grading_prompts:
         logging.error(f"No grading prompt found for {question_type}")
-        return
+        return None
                 
-    prompt_template = grading_prompts[question_type]
-    formatted_prompt = prompt_template.replace("{question}", question).replace("{response}", response)
+    # The rubric is a cached system block; only the question and response change per request
+    rubric, submission_template = grading_prompts[question_type]
+    system, messages = prompt_layout.build_grading_request_parts(rubric, submission_template, row['Question'], row['Responses'])
 
     tools = [configs.anthropic_tools[question_type]]
+    request = {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 8000,
+        "temperature": 0,
+        "messages": messages,
+        "tools": tools
+    }
+    if system is not None:
+        request["system"] = system
+    return request
 
-    
-    for attempt in range(1, max_retries + 1):
-        try:
-            # Call Anthropic API with prompt
-            message = anthropic_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=8000,
-                temperature=0,
-                messages=[{"role": "user", "content": formatted_prompt}],
-                tools=tools
+def write_grade(row, output_files, grading_json, journal=None):
+    """
+    Write the grading results for an FRQ response row to its type's grading file and return the grade row.
+    With a run journal, the question is marked as graded once the row is on disk.
+    """
+    question_id = row['Question ID']
+    question = row['Question']
+    question_type = row['Question Type']
+    unit = row['Unit']
+    response = row['Responses']
+    file_path, headers = output_files[question_type]
+    on_commit = None
+    if journal is not None:
+        on_commit = lambda: journal.mark(question_id, "graded")
+
+    return helper_functions.write_grade(file_path, question_id, question, question_type, unit, response, grading_json, on_commit)
+
+async def process_grading(anthropic_client, semaphore, row, output_files, grading_prompts, journal=None, max_retries=3):
+    """
+    Process a single FRQ response for grading using the async Anthropic client.
+    Returns the grading row that was written, or False if grading failed.
+    """
+    question_id = row['Question ID']
+    question_type = row['Question Type']
+
+    request = build_grading_request(row, grading_prompts)
+    if request is None:
+        return False
+
+    async def request_grading_json():
+        # Call Anthropic API with prompt
+        async with semaphore:
+            message = await llm_scheduler.scheduler.call_async(
+                "claude-3-5-sonnet-20241022",
+                lambda: anthropic_client.messages.create(**request),
+                request
             )
 
-            
-            tool_use_found = False
-            for i, content in enumerate(message.content):
-                if content.type == 'tool_use':
-                    tool_use_found = True
-                    grading_json = content.input
-                    
-                    # Write the grading results based on question type
-                    if question_type == 'SAQs':
-                        helper_functions.write_saq_grade(file_path, question_id, question, question_type, unit, response, grading_json)
-                    elif question_type == 'LEQs':
-                        helper_functions.write_leq_grade(file_path, question_id, question, question_type, unit, response, grading_json)
-                    elif question_type == 'DBQs':
-                        helper_functions.write_dbq_grade(file_path, question_id, question, question_type, unit, response, grading_json)
-                    
-                    logging.info(f"Successfully graded question ID {question_id}")
-                    return True
-            
-            if not tool_use_found:
-                logging.error(f"No tool_use found in response for question ID {question_id}, type {question_type}")
-                logging.error(f"Response content types: {[c.type for c in message.content]}")
-                logging.error(f"Full response: {message}")
+        for content in message.content:
+            if content.type == 'tool_use':
+                return content.input
+
+        logging.error(f"No tool_use found in response for question ID {question_id}, type {question_type}")
+        logging.error(f"Response content types: {[c.type for c in message.content]}")
+        logging.error(f"Full response: {message}")
+        return None
+
+    def validate_grading_json(grading_json):
+        helper_functions.build_grade_row(question_id, row['Question'], question_type, row['Unit'], row['Responses'], grading_json)
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            grading_json = await llm_cache.get_cache().cached_async(request, request_grading_json, validate_grading_json)
+            if grading_json is not None:
+                grade_row = write_grade(row, output_files, grading_json, journal)
+                
+                logging.info(f"Successfully graded question ID {question_id}")
+                return grade_row
             
         except Exception as e:
             logging.error(f"Attempt {attempt} failed for grading question ID {question_id}: {str(e)}")
             if attempt < max_retries:
                 logging.info(f"Retrying grading for question ID {question_id} after a short delay...")
-                time.sleep(2 * attempt)  # Exponential backoff
+                await asyncio.sleep(llm_scheduler.backoff_delay(attempt))
             else:
                 logging.error(f"Failed to grade question ID {question_id} after {max_retries} attempts")
     
     return False
-def generate_frq_responses(question_data, frq_output_path):
+
+def grade_in_batch(rows, output_files, grading_prompts, journal=None):
     """
-    Generate FRQ responses using multiprocessing.
+    Grade FRQ responses through the Anthropic Message Batches API instead of one request per response.
+    All requests are submitted together, polled until the batch ends, and the results are written
+    with the same grade writers as the online path. Responses without a result are left ungraded.
     """
-    with multiprocessing.Manager() as manager:
-        lock = manager.Lock()
-        pool = multiprocessing.Pool(processes=7, maxtasksperchild=7)
-        
-        async_results = []
-        for qt in question_data:
-            result = pool.apply_async(
-                process_frq,
-                args=(qt, frq_output_path, lock)
-            )
-            async_results.append(result)
-        
-        # Wait for all processes to complete
-        for result in async_results:
-            try:
-                result.get()  # Ensures we catch any exceptions in child processes
-            except Exception as e:
-                logging.error(f"An error occurred during FRQ processing: {str(e)}")
-        
-        pool.close()
-        pool.join()
+    requests = {}
+    rows_by_id = {}
+    for index, row in enumerate(rows):
+        request = build_grading_request(row, grading_prompts)
+        if request is None:
+            continue
+        custom_id = f"grade-{index}"
+        requests[custom_id] = request
+        rows_by_id[custom_id] = row
+    
+    stem = os.path.splitext(os.path.basename(configs.event["output_file"]))[0]
+    results = llm_batch.run_cached_tool_batch("anthropic", f"{stem}-grading", requests)
+    
+    graded = 0
+    for custom_id, row in rows_by_id.items():
+        grading_json = results.get(custom_id)
+        if grading_json is None:
+            logging.error(f"No batch grading result for question ID {row['Question ID']}")
+            continue
+        try:
+            write_grade(row, output_files, grading_json, journal)
+        except Exception as e:
+            # Drop the unusable result from the cache so the next run grades this response again
+            logging.error(f"Malformed batch grading result for question ID {row['Question ID']}: {str(e)}")
+            cache = llm_cache.get_cache()
+            cache.delete(cache.make_key(requests[custom_id]))
+            continue
+        graded += 1
+    logging.info(f"Batch graded {graded} of {len(rows_by_id)} FRQ responses")
+
+async def run_frq_generation(question_data, frq_output_path, concurrency, journal=None):
+    """
+    Run process_frq for every question as coroutines sharing one async OpenAI client.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # SDK-level retries are disabled; llm_scheduler owns backoff and rate limiting
+    async with AsyncOpenAI(api_key=configs.event["openai_api_key"], max_retries=0) as openai_client:
+        tasks = [
+            process_frq(openai_client, semaphore, qt, frq_output_path, journal)
+            for qt in question_data
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"An error occurred during FRQ processing: {str(result)}")
+    
+    return results
+
+def generate_frq_responses(question_data, frq_output_path, concurrency=None, journal=None):
+    """
+    Generate FRQ responses concurrently on a single asyncio event loop.
+    Concurrency defaults to configs.event["frq_concurrency"].
+    Questions already marked as generated in the run journal are skipped.
+    """
+    if concurrency is None:
+        concurrency = configs.event.get("frq_concurrency", 7)
+    
+    if journal is not None:
+        remaining = [qt for qt in question_data if not journal.is_done(qt[3], "generated")]
+        logging.info(f"Skipping {len(question_data) - len(remaining)} questions already generated in a previous run")
+        question_data = remaining
+    
+    logging.info(f"Generating FRQ responses with up to {concurrency} concurrent requests")
+    asyncio.run(run_frq_generation(question_data, frq_output_path, concurrency, journal))
+    csv_sink.get_sink().flush()
     
     logging.info(f"Completed FRQ response generation for {len(question_data)} questions")
 
-def grade_frq_responses(frq_output_path, output_files):
+async def run_grading(rows, output_files, grading_prompts, concurrency, journal=None):
     """
-    Grade FRQ responses using multiprocessing.
+    Run process_grading for every row as coroutines sharing one async Anthropic client.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AsyncAnthropic(api_key=configs.event["anthropic_api_key"], max_retries=0) as anthropic_client:
+        tasks = [
+            process_grading(anthropic_client, semaphore, row, output_files, grading_prompts, journal)
+            for row in rows
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"An error occurred during grading: {str(result)}")
+    
+    return results
+
+def load_grading_prompts():
+    """
+    Load the grading prompt template for each question type.
+    Each template is split into (rubric, submission_template) so the rubric can be prompt-cached.
     """
-    # Load grading prompts
     grading_prompts = {}
-    for question_type in ['SAQs', 'LEQs', 'DBQs']:
+    for question_type in configs.grading_outputs:
         prompt_file = f"grading_prompts/{question_type.lower()[:-1]}_grading.txt"
         try:
             with open(prompt_file, 'r', encoding='utf-8') as f:
-                grading_prompts[question_type] = f.read()
+                grading_prompts[question_type] = prompt_layout.split_grading_template(f.read())
             logging.info(f"Loaded grading prompt for {question_type}")
         except Exception as e:
             logging.error(f"Failed to load grading prompt for {question_type}: {str(e)}")
+    return grading_prompts
+
+def grade_frq_responses(frq_output_path, output_files, journal=None):
+    """
+    Grade FRQ responses concurrently on a single asyncio event loop, or through the batch API
+    when configs.event["batch_mode"] is enabled.
+    Responses already marked as graded in the run journal are skipped.
+    """
+    grading_prompts = load_grading_prompts()
     
     # Read FRQ responses from Google Sheet instead of CSV
     try:
@@ -260,34 +368,183 @@ def grade_frq_responses(frq_output_path, output_files):
             logging.error(f"Failed to read FRQ responses from {frq_output_path}: {str(csv_e)}")
             return
     
+    if journal is not None:
+        if journal.resumed:
+            # Grade only the newest response per question
+            rows = run_journal.latest_rows(rows)
+        remaining = [row for row in rows if not journal.is_done(row['Question ID'], "graded")]
+        logging.info(f"Skipping {len(rows) - len(remaining)} responses already graded in a previous run")
+        rows = remaining
+    
     if not rows:
         logging.warning("No FRQ responses found to grade")
         return
     
-    with multiprocessing.Pool(processes=5, maxtasksperchild=5) as pool:
-        async_results = []
-        for row in rows:
-            result = pool.apply_async(
-                process_grading,
-                args=(row, output_files, grading_prompts)
-            )
-            async_results.append(result)
+    if llm_batch.get_batch_settings()["enabled"]:
+        logging.info(f"Grading {len(rows)} FRQ responses through the batch API")
+        grade_in_batch(rows, output_files, grading_prompts, journal)
+    else:
+        concurrency = configs.event.get("grading_concurrency", 5)
+        logging.info(f"Grading FRQ responses with up to {concurrency} concurrent requests")
+        asyncio.run(run_grading(rows, output_files, grading_prompts, concurrency, journal))
+    csv_sink.get_sink().flush()
+    
+    logging.info(f"Completed grading for {len(rows)} FRQ responses")
+
+async def sync_sheets_in_background(pending_rows, output_files, journal, stop_event, interval):
+    """
+    Periodically push rows produced by the streaming pipeline to Google Sheets.
+    pending_rows maps 'FRQs' or a question type to rows waiting to be synced; sheet calls run
+    in a worker thread so they never block generation or grading.
+    """
+    google_sheet_info = configs.event.get("google_sheet")
+    while True:
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
         
-        # Wait for all processes to complete
-        for result in async_results:
+        for sheet_key, rows in pending_rows.items():
+            if not rows or not google_sheet_info:
+                continue
+            batch = rows[:]
+            del rows[:len(batch)]
+            
+            if sheet_key == "FRQs":
+                sheet_name, headers, stage = google_sheet_info["frq_output_sheet_name"], helper_functions.FRQ_HEADERS, "synced"
+            else:
+                sheet_name, headers, stage = helper_functions.get_grading_sheet_name(sheet_key), output_files[sheet_key][1], "grade_synced"
+            
             try:
-                result.get()  # Ensures we catch any exceptions in child processes
+                await asyncio.to_thread(helper_functions.append_rows_to_sheet, sheet_name, headers, batch)
+                for row in batch:
+                    journal.mark(row[0], stage)
+                logging.info(f"Synced {len(batch)} rows to Google Sheet '{sheet_name}'")
             except Exception as e:
-                logging.error(f"An error occurred during grading: {str(e)}")
+                # Leave the rows to the catch-up sync at the end of the run
+                logging.error(f"Background sync to Google Sheet '{sheet_name}' failed: {str(e)}")
+        
+        if stop_event.is_set():
+            return
+
+async def run_streaming_pipeline(question_data, ungraded_rows, frq_output_path, output_files, journal):
+    """
+    Generate and grade in one pass: every generated response is pushed straight onto an
+    in-process grading queue, and sheet sync runs in the background.
+    """
+    grading_prompts = load_grading_prompts()
+    generation_concurrency = configs.event.get("frq_concurrency", 7)
+    grading_concurrency = configs.event.get("grading_concurrency", 5)
+    generation_semaphore = asyncio.Semaphore(generation_concurrency)
+    grading_semaphore = asyncio.Semaphore(grading_concurrency)
+    grading_queue = asyncio.Queue()
+    pending_rows = {"FRQs": [], **{question_type: [] for question_type in output_files}}
+    stop_event = asyncio.Event()
     
-    logging.info(f"Completed grading for {len(rows)} FRQ responses")
+    # Responses generated by an earlier, interrupted run still need grading
+    for row in ungraded_rows:
+        grading_queue.put_nowait(row)
+    
+    async with AsyncOpenAI(api_key=configs.event["openai_api_key"], max_retries=0) as openai_client, \
+            AsyncAnthropic(api_key=configs.event["anthropic_api_key"], max_retries=0) as anthropic_client:
+        
+        async def generate(question_tuple):
+            function_args = await process_frq(openai_client, generation_semaphore, question_tuple, frq_output_path, journal)
+            if function_args is None:
+                return
+            question, question_type, unit, question_id = question_tuple
+            frq_row = helper_functions.build_frq_row(question_id, question, question_type, unit, function_args)
+            pending_rows["FRQs"].append(frq_row)
+            await grading_queue.put(dict(zip(helper_functions.FRQ_HEADERS, frq_row)))
+        
+        async def grade_worker():
+            while True:
+                row = await grading_queue.get()
+                try:
+                    grade_row = await process_grading(anthropic_client, grading_semaphore, row, output_files, grading_prompts, journal)
+                    if grade_row:
+                        pending_rows[row['Question Type']].append(grade_row)
+                except Exception as e:
+                    logging.error(f"An error occurred during grading: {str(e)}")
+                finally:
+                    grading_queue.task_done()
+        
+        workers = [asyncio.create_task(grade_worker()) for _ in range(grading_concurrency)]
+        syncer = asyncio.create_task(sync_sheets_in_background(
+            pending_rows, output_files, journal, stop_event, configs.event.get("sheet_sync_interval", 30)
+        ))
+        
+        results = await asyncio.gather(*(generate(qt) for qt in question_data), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"An error occurred during FRQ processing: {str(result)}")
+        
+        # Let grading drain, then stop the workers and flush the last sheet rows
+        await grading_queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        stop_event.set()
+        await syncer
+
+def run_pipeline(question_data, frq_output_path, output_files, journal):
+    """
+    Streaming mode: generation feeds grading directly instead of waiting on two global barriers
+    and a Google Sheets round-trip.
+    """
+    remaining = [qt for qt in question_data if not journal.is_done(qt[3], "generated")]
+    logging.info(f"Skipping {len(question_data) - len(remaining)} questions already generated in a previous run")
+    
+    # Pick up responses that were generated but never graded
+    ungraded_rows = []
+    if journal.resumed and os.path.exists(frq_output_path):
+        with open(frq_output_path, "r", encoding="utf-8") as f:
+            rows = run_journal.latest_rows(csv.DictReader(f))
+        ungraded_rows = [
+            row for row in rows
+            if journal.is_done(row['Question ID'], "generated") and not journal.is_done(row['Question ID'], "graded")
+        ]
+    if ungraded_rows:
+        logging.info(f"Queueing {len(ungraded_rows)} previously generated responses for grading")
+    
+    asyncio.run(run_streaming_pipeline(remaining, ungraded_rows, frq_output_path, output_files, journal))
+    csv_sink.get_sink().flush()
+    logging.info(f"Completed streaming pipeline for {len(remaining)} questions")
+
+def write_prompt_cache_report(frq_output_path):
+    """
+    Log the provider prompt-cache hit ratio per model for this run and save it next to the output,
+    e.g. outputs/test_output.prompt_cache.json. Responses served from the local LLM cache are not counted.
+    """
+    report = llm_scheduler.scheduler.prompt_cache_report()
+    for model, stats in report.items():
+        logging.info(
+            f"{model}: {stats['cached_input_tokens']}/{stats['input_tokens']} prompt tokens read from the "
+            f"prompt cache ({stats['cache_hit_ratio']:.1%}) over {stats['requests']} requests"
+        )
+    
+    stem = os.path.splitext(os.path.basename(frq_output_path))[0]
+    report_path = os.path.join("outputs", f"{stem}.prompt_cache.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Prompt cache report written to {report_path}")
 
 def main():
     """
     Main orchestration function.
+    With configs.event["resume"] set, completed work recorded in the run journal is skipped.
     """
+    resume = configs.event.get("resume", False)
+    
     # Setup output files
-    frq_output_path, output_files = helper_functions.setup_output_files()
+    frq_output_path, output_files = helper_functions.setup_output_files(resume=resume)
+    journal = run_journal.RunJournal(run_journal.get_journal_path(frq_output_path), reset=not resume)
+    
+    # Optionally mirror every output CSV to Parquet
+    columnar_sink.attach_to_sink(csv_sink.get_sink(), {
+        frq_output_path: helper_functions.FRQ_HEADERS,
+        **{file_path: headers for file_path, headers in output_files.values()}
+    })
     
     # Get input data (either from Google Sheets or fallback to CSV)
     records = helper_functions.get_input_sheet()
@@ -298,21 +555,41 @@ def main():
         logging.error("No questions found to process")
         return
     
-    # Generate FRQ responses
-    generate_frq_responses(question_data, frq_output_path)
-    
-    # Write FRQ responses to Google Sheet
-    helper_functions.write_to_frq_sheet(frq_output_path)
-    logging.info("FRQ responses written to Google Sheet")
-    
-    # Grade FRQ responses
-    grade_frq_responses(frq_output_path, output_files)
+    # Batch grading needs every response up front, so it always runs staged
+    streaming = configs.event.get("pipeline_mode", "staged") == "streaming" and not llm_batch.get_batch_settings()["enabled"]
+    if streaming:
+        # Generate and grade in one pass, syncing sheets in the background
+        run_pipeline(question_data, frq_output_path, output_files, journal)
+        
+        # Catch up on any rows the background sync did not get to
+        helper_functions.write_to_frq_sheet(frq_output_path, journal)
+        helper_functions.write_to_grading_sheet(output_files, journal)
+        logging.info("FRQ responses and grading results written to Google Sheet")
+    else:
+        # Generate FRQ responses
+        generate_frq_responses(question_data, frq_output_path, journal=journal)
+        
+        # Write FRQ responses to Google Sheet
+        helper_functions.write_to_frq_sheet(frq_output_path, journal)
+        logging.info("FRQ responses written to Google Sheet")
+        
+        # Grade FRQ responses
+        grade_frq_responses(frq_output_path, output_files, journal)
+        
+        # Write grading results to Google Sheet
+        helper_functions.write_to_grading_sheet(output_files, journal)
+        logging.info("Grading results written to Google Sheet")
     
-    # Write grading results to Google Sheet
-    helper_functions.write_to_grading_sheet(output_files)
-    logging.info("Grading results written to Google Sheet")
+    # Commit callbacks write to the journal, so the sink has to stop first
+    csv_sink.get_sink().close()
+    journal.close()
     
+    coverage = fact_coverage.get_index(frq_output_path)
+    hallucinated = coverage.hallucinated()
+    logging.info(f"{len(coverage.usage_counts())} distinct fact IDs cited so far, {len(hallucinated)} not in KS_facts")
+    coverage.close()
+    write_prompt_cache_report(frq_output_path)
     logging.info("Processing complete")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
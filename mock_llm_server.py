@@ -0,0 +1,438 @@
+import re
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+def fake_from_schema(schema, index=0):
+    """
+    Build a value that satisfies a JSON schema: first enum value, 0/False/"stub" for scalars,
+    three items for arrays (string "id" fields inside them become 'a', 'b', 'c').
+    """
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type", "string")
+    if schema_type == "object":
+        value = {}
+        for name, property_schema in schema.get("properties", {}).items():
+            if name == "id" and property_schema.get("type") == "string":
+                value[name] = chr(ord("a") + index)
+            else:
+                value[name] = fake_from_schema(property_schema, index)
+        return value
+    if schema_type == "array":
+        return [fake_from_schema(schema.get("items", {}), i) for i in range(3)]
+    if schema_type in ("integer", "number"):
+        return schema.get("minimum", 0)
+    if schema_type == "boolean":
+        return False
+    return "stub"
+
+def fake_anthropic_message(request, text_responder=None):
+    """
+    An Anthropic message answering the request; calls the first tool if tools are given.
+    text_responder(request) may supply the text of a plain (tool-less) answer.
+    """
+    tools = request.get("tools") or []
+    if tools:
+        content = [{
+            "type": "tool_use",
+            "id": f"toolu_{uuid.uuid4().hex[:24]}",
+            "name": tools[0]["name"],
+            "input": fake_from_schema(tools[0]["input_schema"])
+        }]
+        stop_reason = "tool_use"
+    else:
+        content = [{"type": "text", "text": (text_responder and text_responder(request)) or "stub"}]
+        stop_reason = "end_turn"
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": request.get("model", "stub"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": len(json.dumps(request)) // 4,
+            "output_tokens": 100,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0
+        }
+    }
+
+def fake_chat_completion(request, text_responder=None):
+    """
+    An OpenAI chat completion answering the request; calls the first tool if tools are given.
+    text_responder(request) may supply the content of a plain (tool-less) answer.
+    """
+    tools = request.get("tools") or []
+    message = {"role": "assistant", "content": None}
+    if tools:
+        function = tools[0]["function"]
+        message["tool_calls"] = [{
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {
+                "name": function["name"],
+                "arguments": json.dumps(fake_from_schema(function.get("parameters", {})))
+            }
+        }]
+        finish_reason = "tool_calls"
+    else:
+        content = text_responder(request) if text_responder else None
+        if content is None:
+            content = "{}" if request.get("response_format", {}).get("type") == "json_object" else "stub"
+        message["content"] = content
+        finish_reason = "stop"
+    prompt_tokens = len(json.dumps(request)) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 100,
+            "total_tokens": prompt_tokens + 100,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+    }
+
+class LatencyModel:
+    """
+    Log-normal response latency given its median and 95th percentile in seconds (a median of 0
+    means no delay). Real API latencies are right-skewed like this: most calls are close to the
+    median, with a long tail of slow ones.
+    """
+    def __init__(self, median=0.0, p95=None, seed=None):
+        self.median = median
+        p95 = p95 if p95 is not None else median
+        # 1.645 is the 95th percentile of the standard normal
+        self.sigma = math.log(p95 / median) / 1.645 if median > 0 and p95 > median else 0.0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        with self.lock:
+            return self.median * math.exp(self.random.gauss(0.0, self.sigma))
+
+class MockState:
+    """
+    Batches, files, fault injection settings and request counters held by the server, shared across
+    handler threads. rate_limit_ratio is the share of messages/chat completion requests answered with
+    a 429 (with a retry-after-ms of retry_after seconds).
+    """
+    def __init__(self, batch_delay, latency=None, rate_limit_ratio=0.0, retry_after=0.2, text_responder=None, seed=None):
+        self.batch_delay = batch_delay
+        self.latency = latency or LatencyModel()
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.text_responder = text_responder
+        self.random = random.Random(seed)
+        self.anthropic_batches = {}
+        self.openai_batches = {}
+        self.files = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def is_done(self, batch):
+        return time.time() - batch["submitted"] >= self.batch_delay
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def should_rate_limit(self):
+        with self.lock:
+            return self.random.random() < self.rate_limit_ratio
+
+    def snapshot(self):
+        """Copy of the request counters, e.g. {'POST /v1/messages': 10, 'POST /v1/messages 429': 1, 'model o1': 4}."""
+        with self.lock:
+            return dict(self.counters)
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the Anthropic and OpenAI APIs used by the pipeline: messages, chat completions,
+    Message Batches, and the OpenAI files/batches endpoints. Every request is answered with a
+    schema-valid fake tool call, so whole runs can be exercised offline. Online requests can be
+    slowed down and rate limited (see MockState) to benchmark the pipeline under realistic conditions.
+    """
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            # Multipart uploads are streamed without a Content-Length
+            body = b""
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_jsonl(self, lines):
+        body = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-jsonl")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_not_found(self):
+        self.send_json({"type": "error", "error": {"type": "not_found_error", "message": self.path}}, 404)
+
+    def send_rate_limited(self, path):
+        if path == "/v1/messages":
+            payload = {"type": "error", "error": {"type": "rate_limit_error", "message": "Injected rate limit"}}
+        else:
+            payload = {"error": {"message": "Injected rate limit", "type": "requests", "param": None, "code": "rate_limit_exceeded"}}
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("retry-after-ms", str(int(self.state.retry_after * 1000)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answer_online(self, path, request):
+        """Answer a messages or chat completion request after the sampled latency, or with an injected 429."""
+        self.state.count(f"POST {path}")
+        self.state.count(f"model {request.get('model', 'unknown')}")
+        delay = self.state.latency.sample()
+        if delay > 0:
+            time.sleep(delay)
+        if self.state.should_rate_limit():
+            self.state.count(f"POST {path} 429")
+            return self.send_rate_limited(path)
+        if path == "/v1/messages":
+            return self.send_json(fake_anthropic_message(request, self.state.text_responder))
+        return self.send_json(fake_chat_completion(request, self.state.text_responder))
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path in ("/v1/messages", "/v1/chat/completions"):
+            return self.answer_online(path, json.loads(self.read_body()))
+        if path == "/v1/messages/batches":
+            return self.create_anthropic_batch(json.loads(self.read_body()))
+        if path == "/v1/files":
+            return self.create_file()
+        if path == "/v1/batches":
+            return self.create_openai_batch(json.loads(self.read_body()))
+        self.send_not_found()
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+        if match:
+            batch = self.state.anthropic_batches.get(match.group(1))
+            if batch is None:
+                return self.send_not_found()
+            if match.group(2):
+                return self.send_jsonl(batch["results"] if self.state.is_done(batch) else [])
+            return self.send_json(self.anthropic_batch_object(batch))
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+        if match:
+            batch = self.state.openai_batches.get(match.group(1))
+            if batch is None:
+                return self.send_not_found()
+            return self.send_json(self.openai_batch_object(batch))
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+        if match:
+            content = self.state.files.get(match.group(1))
+            if content is None:
+                return self.send_not_found()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            return self.wfile.write(content)
+        self.send_not_found()
+
+    def create_anthropic_batch(self, payload):
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        results = [
+            {
+                "custom_id": entry["custom_id"],
+                "result": {"type": "succeeded", "message": fake_anthropic_message(entry["params"], self.state.text_responder)}
+            }
+            for entry in payload["requests"]
+        ]
+        batch = {"id": batch_id, "submitted": time.time(), "results": results}
+        with self.state.lock:
+            self.state.anthropic_batches[batch_id] = batch
+        logging.info(f"Created Anthropic batch {batch_id} with {len(results)} requests")
+        self.send_json(self.anthropic_batch_object(batch))
+
+    def anthropic_batch_object(self, batch):
+        done = self.state.is_done(batch)
+        count = len(batch["results"])
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["submitted"]))
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if done else "in_progress",
+            "request_counts": {
+                "processing": 0 if done else count,
+                "succeeded": count if done else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0
+            },
+            "created_at": created_at,
+            "expires_at": created_at,
+            "ended_at": created_at if done else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url()}/v1/messages/batches/{batch['id']}/results" if done else None
+        }
+
+    def create_file(self):
+        # Multipart form upload: parse it as a MIME message to get the file part
+        body = self.read_body()
+        message = BytesParser(policy=policy.default).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8") + body
+        )
+        content = b""
+        filename = "upload.jsonl"
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                content = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self.state.lock:
+            self.state.files[file_id] = content
+        self.send_json(self.file_object(file_id, filename, len(content)))
+
+    def file_object(self, file_id, filename, size):
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": size,
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": "batch",
+            "status": "processed"
+        }
+
+    def create_openai_batch(self, payload):
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        lines = self.state.files.get(payload["input_file_id"], b"").decode("utf-8").splitlines()
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            output.append({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": entry["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": fake_chat_completion(entry["body"], self.state.text_responder)
+                },
+                "error": None
+            })
+        output_file_id = f"file-{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id,
+            "submitted": time.time(),
+            "input_file_id": payload["input_file_id"],
+            "endpoint": payload.get("endpoint", "/v1/chat/completions"),
+            "output_file_id": output_file_id,
+            "count": len(output)
+        }
+        with self.state.lock:
+            self.state.files[output_file_id] = "".join(json.dumps(line) + "\n" for line in output).encode("utf-8")
+            self.state.openai_batches[batch_id] = batch
+        logging.info(f"Created OpenAI batch {batch_id} with {len(output)} requests")
+        self.send_json(self.openai_batch_object(batch))
+
+    def openai_batch_object(self, batch):
+        done = self.state.is_done(batch)
+        return {
+            "id": batch["id"],
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "input_file_id": batch["input_file_id"],
+            "completion_window": "24h",
+            "status": "completed" if done else "in_progress",
+            "output_file_id": batch["output_file_id"] if done else None,
+            "error_file_id": None,
+            "created_at": int(batch["submitted"]),
+            "request_counts": {
+                "total": batch["count"],
+                "completed": batch["count"] if done else 0,
+                "failed": 0
+            }
+        }
+
+def start_server(host="127.0.0.1", port=0, batch_delay=2.0, **state_options):
+    """
+    Start the stand-in server on a background thread and return it; server.server_address has the
+    bound port. Point the SDKs at it with ANTHROPIC_BASE_URL=http://host:port and
+    OPENAI_BASE_URL=http://host:port/v1. state_options (latency, rate_limit_ratio, ...) go to MockState.
+    """
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.state = MockState(batch_delay, **state_options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Anthropic and OpenAI APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds until a submitted batch ends")
+    parser.add_argument("--latency-median", type=float, default=0.0, help="Median response latency in seconds")
+    parser.add_argument("--latency-p95", type=float, default=None, help="95th percentile response latency in seconds")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="retry-after sent with injected 429s, in seconds")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockLLMHandler)
+    server.daemon_threads = True
+    server.state = MockState(
+        args.batch_delay,
+        latency=LatencyModel(args.latency_median, args.latency_p95),
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after
+    )
+    logging.info(f"Mock LLM server listening on http://{args.host}:{args.port}")
+    logging.info(f"Use ANTHROPIC_BASE_URL=http://{args.host}:{args.port} and OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,167 @@
+import time
+import threading
+import gspread
+from gspread.utils import a1_to_rowcol, numericise
+
+def to_cell(value):
+    """Cell text as Sheets stores a RAW value (booleans become TRUE/FALSE, None an empty cell)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+class InMemoryWorksheet:
+    """
+    In-memory stand-in for the parts of gspread.Worksheet the pipeline uses.
+    Every method counts as one API call and sleeps for the spreadsheet's latency, so sheet traffic
+    shows up in benchmarks without a network.
+    """
+    def __init__(self, spreadsheet, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [[to_cell(value) for value in row] for row in rows or []]
+        self.lock = threading.Lock()
+
+    def _call(self):
+        self.spreadsheet.record_call()
+
+    def _last_row(self):
+        """Number of rows up to the last one holding any value."""
+        for index in range(len(self.rows), 0, -1):
+            if any(self.rows[index - 1]):
+                return index
+        return 0
+
+    def get_all_values(self):
+        self._call()
+        with self.lock:
+            rows = [list(row) for row in self.rows[:self._last_row()]]
+        width = max((len(row) for row in rows), default=0)
+        return [row + [""] * (width - len(row)) for row in rows]
+
+    def get_all_records(self):
+        values = self.get_all_values()
+        if not values:
+            return []
+        headers = values[0]
+        return [{header: numericise(value) for header, value in zip(headers, row)} for row in values[1:]]
+
+    def row_values(self, row):
+        self._call()
+        with self.lock:
+            values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def col_values(self, col):
+        self._call()
+        with self.lock:
+            values = [row[col - 1] if col <= len(row) else "" for row in self.rows[:self._last_row()]]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def update(self, range_name, values):
+        """Write a block of values starting at the top-left cell of an A1 range ('A1' or 'A1:K1')."""
+        self._call()
+        start_row, start_col = a1_to_rowcol(range_name.split(":")[0])
+        with self.lock:
+            for offset, row in enumerate(values):
+                index = start_row - 1 + offset
+                while len(self.rows) <= index:
+                    self.rows.append([])
+                target = self.rows[index]
+                end = start_col - 1 + len(row)
+                if len(target) < end:
+                    target.extend([""] * (end - len(target)))
+                target[start_col - 1:end] = [to_cell(value) for value in row]
+
+    def append_rows(self, values, value_input_option=None, insert_data_option=None, table_range=None):
+        """Add rows after the last non-empty row, like values.append."""
+        self._call()
+        with self.lock:
+            del self.rows[self._last_row():]
+            self.rows.extend([to_cell(value) for value in row] for row in values)
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+class InMemorySpreadsheet:
+    """In-memory spreadsheet: a set of named InMemoryWorksheets plus the shared API call counter."""
+    def __init__(self, spreadsheet_id, latency=0.0):
+        self.id = spreadsheet_id
+        self.latency = latency
+        self.worksheets = {}
+        self.api_calls = 0
+        self.lock = threading.Lock()
+
+    def record_call(self):
+        with self.lock:
+            self.api_calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def worksheet(self, title):
+        self.record_call()
+        with self.lock:
+            if title not in self.worksheets:
+                raise gspread.exceptions.WorksheetNotFound(title)
+            return self.worksheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        self.record_call()
+        with self.lock:
+            self.worksheets[title] = InMemoryWorksheet(self, title)
+            return self.worksheets[title]
+
+    def seed(self, title, rows=None):
+        """Create (or replace) a worksheet with the given rows, without counting an API call."""
+        with self.lock:
+            self.worksheets[title] = InMemoryWorksheet(self, title, rows)
+            return self.worksheets[title]
+
+class InMemorySheetsSession:
+    """
+    Drop-in replacement for sheets_session.SheetsSession backed by InMemorySpreadsheets; install it
+    with sheets_session.register_session(credentials_file, session).
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.spreadsheets = {}
+        self.worksheets = {}
+        self.lock = threading.Lock()
+
+    def spreadsheet(self, spreadsheet_id):
+        with self.lock:
+            if spreadsheet_id not in self.spreadsheets:
+                self.spreadsheets[spreadsheet_id] = InMemorySpreadsheet(spreadsheet_id, self.latency)
+            return self.spreadsheets[spreadsheet_id]
+
+    def worksheet(self, spreadsheet_id, sheet_name):
+        """Return the cached handle, fetching it (one API call) on first use like SheetsSession."""
+        key = (spreadsheet_id, sheet_name)
+        with self.lock:
+            if key in self.worksheets:
+                return self.worksheets[key]
+        worksheet = self.spreadsheet(spreadsheet_id).worksheet(sheet_name)
+        with self.lock:
+            self.worksheets[key] = worksheet
+        return worksheet
+
+    def add_worksheet(self, spreadsheet_id, title, rows, cols):
+        worksheet = self.spreadsheet(spreadsheet_id).add_worksheet(title=title, rows=rows, cols=cols)
+        with self.lock:
+            self.worksheets[(spreadsheet_id, title)] = worksheet
+        return worksheet
+
+    def invalidate(self, spreadsheet_id, sheet_name=None):
+        with self.lock:
+            for key in [key for key in self.worksheets if key[0] == spreadsheet_id and sheet_name in (None, key[1])]:
+                del self.worksheets[key]
+
+    def api_calls(self):
+        """Total worksheet API calls made so far across every spreadsheet."""
+        with self.lock:
+            return sum(spreadsheet.api_calls for spreadsheet in self.spreadsheets.values())
@@ -0,0 +1,163 @@
+import os
+import re
+import gzip
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+import configs
+import sheets_writer
+
+PROCESS_LOG_HEADERS = ["Timestamp", "Process Step", "Curriculum", "Input", "Output"]
+
+def slugify(text, length=40):
+    """File-name-safe short form of a step or curriculum name."""
+    return re.sub(r"[^A-Za-z0-9]+", "-", str(text)).strip("-")[:length] or "none"
+
+class ProcessLogSink:
+    """
+    Background audit log for the fact pipeline's prompt inputs and outputs (the Consolidation
+    Process sheet). record() only puts the entry on a queue, so logging never waits on Sheets; a
+    writer thread appends the rows in batches through a SheetAppendWriter. Inputs and outputs
+    longer than spill_chars are written to gzip files under directory and the cell holds a preview
+    and the file path instead of a multi-MB value.
+    If the sheet cannot be written, rows are kept and retried on the next flush. When the queue is
+    full, new records are dropped (and counted) rather than blocking the caller.
+    """
+    def __init__(self, sheet_name, directory, spill_chars=20000, preview_chars=500,
+                 flush_rows=50, flush_interval=10.0, max_queue=10000):
+        self.sheet_name = sheet_name
+        self.directory = directory
+        self.spill_chars = spill_chars
+        self.preview_chars = preview_chars
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.writer = None
+        self.pending = []
+        self.spilled = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="process-log", daemon=True)
+        self.thread.start()
+
+    def record(self, step, curriculum, input_data, output_data):
+        """Queue one process record; returns immediately."""
+        if self.closed:
+            logging.warning(f"Process log is closed, dropping {step} record")
+            return
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self.queue.put_nowait(("record", [timestamp, step, curriculum, input_data, output_data]))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"Process log queue is full, dropped {step} record ({self.dropped} dropped so far)")
+
+    def flush(self):
+        """Block until every record queued so far has been sent to the sheet (or has failed to)."""
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+
+    def close(self):
+        """Flush and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        done = threading.Event()
+        self.queue.put(("close", done))
+        done.wait()
+        self.thread.join()
+
+    def _spill(self, timestamp, step, curriculum, field, value):
+        """Write a large value to a gzip file and return the cell text that points to it."""
+        day, clock = timestamp.split(" ")
+        directory = os.path.join(self.directory, day)
+        os.makedirs(directory, exist_ok=True)
+        self.spilled += 1
+        path = os.path.join(
+            directory,
+            f"{clock.replace(':', '')}-{os.getpid()}-{self.spilled:05d}-{slugify(step)}-{slugify(curriculum)}-{field}.txt.gz"
+        )
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(value)
+        return f"{value[:self.preview_chars]}... [{len(value)} characters, full text in {path}]"
+
+    def _prepare(self, row):
+        """Turn a queued record into a sheet row, spilling oversized inputs and outputs."""
+        timestamp, step, curriculum = row[0], row[1], row[2]
+        for column, field in ((3, "input"), (4, "output")):
+            value = "" if row[column] is None else str(row[column])
+            if len(value) > self.spill_chars:
+                try:
+                    value = self._spill(timestamp, step, curriculum, field, value)
+                except Exception as e:
+                    logging.error(f"Failed to spill {field} of {step} record: {str(e)}")
+                    value = f"{value[:self.preview_chars]}... [{len(value)} characters, truncated]"
+            row[column] = value
+        return row
+
+    def _send(self):
+        """Append pending rows to the sheet in chunks."""
+        self.last_send = time.monotonic()
+        try:
+            if self.writer is None:
+                self.writer = sheets_writer.open_writer(
+                    self.sheet_name,
+                    PROCESS_LOG_HEADERS,
+                    chunk_rows=self.flush_rows,
+                    flush_interval=self.flush_interval
+                )
+            rows = self.pending
+            self.pending = []
+            # The writer only drops rows once they are on the sheet, so failed ones are retried next time
+            self.writer.append_rows(rows)
+            self.writer.flush()
+        except Exception as e:
+            logging.error(f"Failed to write process log to the {self.sheet_name} sheet: {str(e)}")
+
+    def _run(self):
+        self.last_send = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ("tick",)
+
+            if item[0] == "record":
+                try:
+                    self.pending.append(self._prepare(item[1]))
+                except Exception as e:
+                    logging.error(f"Failed to prepare process log record: {str(e)}")
+
+            # Send when the batch is full, the interval has passed, or a caller is waiting
+            due = len(self.pending) >= self.flush_rows or time.monotonic() - self.last_send >= self.flush_interval
+            waiting = item[0] in ("flush", "close")
+            if waiting or (due and (self.pending or (self.writer and self.writer.buffer))):
+                self._send()
+
+            if waiting:
+                item[1].set()
+                if item[0] == "close":
+                    return
+
+_default_sink = None
+_default_sink_lock = threading.Lock()
+
+def get_sink():
+    """Return the process-wide ProcessLogSink (configs.event["process_log"]); it is flushed at exit."""
+    global _default_sink
+    with _default_sink_lock:
+        if _default_sink is None or _default_sink.closed:
+            settings = configs.event.get("process_log", {})
+            _default_sink = ProcessLogSink(
+                settings.get("sheet_name", "Consolidation Process"),
+                settings.get("directory", os.path.join("outputs", "process_log")),
+                spill_chars=settings.get("spill_chars", 20000),
+                flush_rows=settings.get("flush_rows", 50),
+                flush_interval=settings.get("flush_interval", 10.0)
+            )
+            atexit.register(_default_sink.close)
+        return _default_sink
@@ -0,0 +1,64 @@
+import logging
+
+# Static FRQ generation instructions; the per-type notes and the facts follow in that order so the
+# developer message always starts with the same bytes
+FRQ_INSTRUCTIONS = (
+    "Using JUST the facts below, respond to the inputted AP World History free-response question (FRQ). "
+    "Make a note of the fact ids used as you respond to the FRQ. If the question has multiple parts "
+    "(i.e., a, b, and c), none of the parts can have the same answer. "
+    "Consider the following scoring notes for these types of questions:"
+)
+
+def build_frq_instructions(notes, facts):
+    """
+    Developer message for FRQ generation, laid out from most to least shared:
+    the fixed instructions, the question type's notes, then the facts.
+    Notes and facts are stripped of surrounding whitespace so equal inputs give byte-identical prompts,
+    which is what provider-side prefix caching matches on.
+    """
+    return f"{FRQ_INSTRUCTIONS}\n<notes>\n{notes.strip()}\n</notes>\n<facts>\n{facts.strip()}\n</facts>"
+
+def split_grading_template(template):
+    """
+    Split a grading template into (rubric, submission_template).
+    The submission template is the block that introduces and wraps {question} and {response}
+    (e.g. "Here is the LEQ prompt:" ... "</student_response>"); the rubric is everything else and
+    contains no per-request text, so it can be sent as a cached system prompt.
+    Returns (None, template) if the template does not have that shape.
+    """
+    lines = template.split("\n")
+    question_lines = [i for i, line in enumerate(lines) if "{question}" in line]
+    response_lines = [i for i, line in enumerate(lines) if "{response}" in line]
+    if len(question_lines) != 1 or len(response_lines) != 1 or response_lines[0] < question_lines[0]:
+        logging.warning("Grading template has no single {question}/{response} block; sending it unsplit")
+        return None, template
+
+    # Walk back over the opening tag and blank lines to the sentence introducing the question
+    start = question_lines[0] - 1
+    while start > 0 and not lines[start - 1].strip():
+        start -= 1
+    if start > 0 and not lines[start - 1].lstrip().startswith("<"):
+        start -= 1
+    # Include the closing tag after the response
+    end = response_lines[0] + 2
+
+    rubric_lines = lines[:start] + lines[end:]
+    # Keep a single blank line where the block was cut out
+    if 0 < start < len(rubric_lines) and not rubric_lines[start].strip() and not rubric_lines[start - 1].strip():
+        del rubric_lines[start]
+    rubric = "\n".join(rubric_lines).strip()
+    submission_template = "\n".join(lines[start:end]).strip()
+    return rubric, submission_template
+
+def build_grading_request_parts(rubric, submission_template, question, response):
+    """
+    Return (system, messages) for a grading call.
+    The rubric goes in a system block marked with cache_control, so every call for the same question
+    type after the first reads it from Anthropic's prompt cache; only the submission varies.
+    """
+    submission = submission_template.replace("{question}", question).replace("{response}", response)
+    if rubric is None:
+        return None, [{"role": "user", "content": submission}]
+
+    system = [{"type": "text", "text": rubric, "cache_control": {"type": "ephemeral"}}]
+    return system, [{"role": "user", "content": submission}]
@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+import datetime
+import threading
+
+class RunJournal:
+    """
+    Append-only JSONL journal of completed pipeline work, keyed by question ID and stage
+    (e.g. 'generated', 'graded', 'synced'). Every mark is flushed and fsynced, so after a
+    crash a restarted run can skip everything that already finished.
+    """
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed = set()
+        # Only a resumed run has stale rows from the interrupted run to reconcile
+        self.resumed = not reset
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if reset and os.path.exists(path):
+            os.remove(path)
+        self._load()
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell() > 0:
+            # Terminate a torn last line so the next entry starts on its own line
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    def _load(self):
+        """Read every completed (question ID, stage) pair from an existing journal."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a torn last line; everything before it is intact
+                    logging.warning(f"Ignoring unreadable line {line_number} in run journal {self.path}")
+                    continue
+                self.completed.add((entry["question_id"], entry["stage"]))
+        logging.info(f"Loaded {len(self.completed)} completed entries from run journal {self.path}")
+
+    def is_done(self, question_id, stage):
+        """Whether a stage has already been completed for a question."""
+        with self.lock:
+            return (str(question_id), stage) in self.completed
+
+    def done_count(self, stage):
+        """Number of questions that have completed a stage."""
+        with self.lock:
+            return sum(1 for _, done_stage in self.completed if done_stage == stage)
+
+    def mark(self, question_id, stage):
+        """Durably record that a stage has completed for a question."""
+        key = (str(question_id), stage)
+        with self.lock:
+            if key in self.completed:
+                return
+            self.file.write(json.dumps({
+                "question_id": key[0],
+                "stage": stage,
+                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.completed.add(key)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def latest_rows(rows, key="Question ID"):
+    """
+    Keep the last row per question ID. The FRQ CSV is appended to across runs, so the newest
+    response for a question is the one that counts.
+    """
+    latest = {}
+    for row in rows:
+        question_id = str(row[key])
+        latest.pop(question_id, None)
+        latest[question_id] = row
+    return list(latest.values())
+
+def get_journal_path(output_file):
+    """Journal path for a given FRQ output file name, e.g. outputs/test_output.journal.jsonl."""
+    stem = os.path.splitext(os.path.basename(output_file))[0]
+    return os.path.join("outputs", f"{stem}.journal.jsonl")
@@ -0,0 +1,224 @@
+import os
+import re
+import csv
+import sys
+import json
+import logging
+import numpy as np
+import columnar_sink
+import configs
+import helper_functions
+import grade_writer
+
+# A real number as written in a grading CSV (sign, digits, optional decimals and exponent)
+NUMBER_PATTERN = re.compile(r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$")
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Two-sided 95% normal quantile for confidence intervals
+Z_95 = 1.959963984540054
+
+class GradeScores:
+    """
+    The graded responses of one question type as NumPy arrays:
+    question_ids and units (string arrays), scores (responses x skills, NaN where missing) and
+    totals. unit_codes/unit_names is the factorized unit column used for grouping.
+    """
+    def __init__(self, question_type, question_ids, units, skills, scores, totals):
+        self.question_type = question_type
+        self.question_ids = question_ids
+        self.units = units
+        self.skills = skills
+        self.scores = scores
+        self.totals = totals
+        self.unit_names, self.unit_codes = np.unique(units, return_inverse=True)
+
+    def __len__(self):
+        return len(self.totals)
+
+def to_float_array(values):
+    """
+    Convert a column of numeric strings (integers or decimals such as '2.0') to float64; blanks and
+    junk become NaN. A clean column converts in one vectorized pass; otherwise only the values that
+    match NUMBER_PATTERN are converted.
+    """
+    column = np.asarray(values, dtype=str)
+    try:
+        return column.astype(np.float64)
+    except ValueError:
+        pass
+    numeric = np.fromiter((NUMBER_PATTERN.match(value) is not None for value in column), dtype=bool, count=column.size)
+    result = np.full(column.shape, np.nan)
+    result[numeric] = column[numeric].astype(np.float64)
+    return result
+
+def load_grades(path, question_type):
+    """
+    Load a grading CSV (the local output or a sheet export with the same headers), or a Parquet
+    output directory written by columnar_sink, into a GradeScores.
+    """
+    projector = grade_writer.get_projector(question_type)
+    skills = [part[0] for part in projector.parts]
+    score_headers = [part[1] for part in projector.parts]
+
+    if os.path.isdir(path):
+        table = columnar_sink.read_results(path, ['Question ID', 'Unit'] + score_headers + ['Total Score'])
+        columns = {name: table.column(name).to_pylist() for name in table.column_names}
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            headers = next(reader, projector.headers)
+            rows = list(reader)
+        positions = {header: index for index, header in enumerate(headers)}
+        columns = {
+            name: [row[positions[name]] if positions[name] < len(row) else "" for row in rows]
+            for name in ['Question ID', 'Unit'] + score_headers + ['Total Score']
+        }
+
+    scores = np.column_stack([to_float_array(columns[header]) for header in score_headers])
+    return GradeScores(
+        question_type,
+        np.asarray(columns['Question ID'], dtype=str),
+        np.asarray(columns['Unit'], dtype=str),
+        skills,
+        scores,
+        to_float_array(columns['Total Score'])
+    )
+
+def group_stats(codes, values, group_count):
+    """
+    Per-group count, mean, 95% confidence half-width and pass rate (share of scores above 0) for
+    a (responses,) or (responses, columns) array, computed with scatter-adds instead of a loop.
+    NaN values are left out.
+    """
+    values = values.reshape(len(values), -1)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    shape = (group_count, values.shape[1])
+    counts = np.zeros(shape)
+    sums = np.zeros(shape)
+    squares = np.zeros(shape)
+    passes = np.zeros(shape)
+    np.add.at(counts, codes, valid)
+    np.add.at(sums, codes, filled)
+    np.add.at(squares, codes, filled ** 2)
+    np.add.at(passes, codes, valid & (filled > 0))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        variances = (squares - counts * means ** 2) / (counts - 1)
+        ci95 = Z_95 * np.sqrt(np.clip(variances, 0, None) / counts)
+        pass_rates = passes / counts
+    return counts, means, ci95, pass_rates
+
+def rounded(value):
+    """JSON-friendly float (NaN becomes None)."""
+    return None if np.isnan(value) else round(float(value), 4)
+
+def summarize_grades(grades):
+    """Overall, per-skill and per-unit statistics plus the total score distribution for one question type."""
+    summary = {"responses": len(grades)}
+    if not len(grades):
+        return summary
+
+    everyone = np.zeros(len(grades), dtype=np.intp)
+    counts, means, ci95, pass_rates = group_stats(everyone, grades.totals, 1)
+    # Distinct totals as they are (decimal or negative ones included), keyed like '2' or '2.5'
+    totals, distribution = np.unique(grades.totals[~np.isnan(grades.totals)], return_counts=True)
+    summary["total"] = {
+        "mean": rounded(means[0, 0]),
+        "ci95": rounded(ci95[0, 0]),
+        "distribution": {f"{score:g}": int(count) for score, count in zip(totals, distribution)}
+    }
+
+    counts, means, ci95, pass_rates = group_stats(everyone, grades.scores, 1)
+    summary["skills"] = {
+        skill: {"mean": rounded(means[0, i]), "ci95": rounded(ci95[0, i]), "pass_rate": rounded(pass_rates[0, i])}
+        for i, skill in enumerate(grades.skills)
+    }
+
+    unit_count = len(grades.unit_names)
+    total_counts, total_means, total_ci95, _ = group_stats(grades.unit_codes, grades.totals, unit_count)
+    _, skill_means, _, skill_pass_rates = group_stats(grades.unit_codes, grades.scores, unit_count)
+    summary["by_unit"] = {
+        str(unit): {
+            "responses": int(total_counts[u, 0]),
+            "total_mean": rounded(total_means[u, 0]),
+            "total_ci95": rounded(total_ci95[u, 0]),
+            "skill_means": {skill: rounded(skill_means[u, i]) for i, skill in enumerate(grades.skills)},
+            "skill_pass_rates": {skill: rounded(skill_pass_rates[u, i]) for i, skill in enumerate(grades.skills)}
+        }
+        for u, unit in enumerate(grades.unit_names)
+    }
+    return summary
+
+def fact_usage_matrix(frq_output_path):
+    """
+    Parse the Facts Referenced column of an FRQ output CSV into a units x facts count matrix.
+    Returns (unit_names, fact_ids, counts) where counts[u, f] is how many responses for unit u cited fact f.
+    """
+    unit_column = []
+    fact_column = []
+    with open(frq_output_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for fact_id in helper_functions.parse_facts_referenced(row["Facts Referenced"]):
+                unit_column.append(str(row["Unit"]))
+                fact_column.append(fact_id)
+
+    unit_names, unit_codes = np.unique(np.asarray(unit_column, dtype=str), return_inverse=True)
+    fact_ids, fact_codes = np.unique(np.asarray(fact_column, dtype=str), return_inverse=True)
+    counts = np.zeros((len(unit_names), len(fact_ids)), dtype=np.int64)
+    np.add.at(counts, (unit_codes, fact_codes), 1)
+    return unit_names, fact_ids, counts
+
+def write_fact_usage(frq_output_path, report_path):
+    """Write the fact usage matrix as CSV (one row per fact, one count column per unit) and return the top facts."""
+    unit_names, fact_ids, counts = fact_usage_matrix(frq_output_path)
+    totals = counts.sum(axis=0)
+    order = np.argsort(-totals, kind="stable")
+
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Fact ID", "Total Uses"] + [f"Unit {unit}" for unit in unit_names])
+        for index in order:
+            writer.writerow([fact_ids[index], int(totals[index])] + counts[:, index].tolist())
+    return [[str(fact_ids[index]), int(totals[index])] for index in order[:25]]
+
+def build_report(output_files, frq_output_path=None):
+    """
+    Score statistics for every question type in output_files ({question type: (path, headers)}),
+    plus the most-cited facts if the FRQ output is given. Also writes the full fact usage matrix
+    next to the FRQ output.
+    """
+    report = {}
+    for question_type, (path, _) in output_files.items():
+        if not os.path.exists(path):
+            logging.warning(f"No graded output for {question_type} at {path}")
+            continue
+        grades = load_grades(path, question_type)
+        report[question_type] = summarize_grades(grades)
+        logging.info(f"Summarized {len(grades)} graded {question_type}")
+
+    if frq_output_path and os.path.exists(frq_output_path):
+        stem = os.path.splitext(os.path.basename(frq_output_path))[0]
+        usage_path = os.path.join(os.path.dirname(frq_output_path), f"{stem}.fact_usage.csv")
+        report["most_cited_facts"] = write_fact_usage(frq_output_path, usage_path)
+        logging.info(f"Fact usage matrix written to {usage_path}")
+    return report
+
+if __name__ == "__main__":
+    # Usage: python score_analytics.py [FRQ output CSV] -- defaults to the configured output file
+    frq_output_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("outputs", configs.event["output_file"])
+    output_files = {
+        question_type: (layout["file"], grade_writer.get_projector(question_type).headers)
+        for question_type, layout in configs.grading_outputs.items()
+    }
+    report = build_report(output_files, frq_output_path)
+
+    stem = os.path.splitext(os.path.basename(frq_output_path))[0]
+    report_path = os.path.join("outputs", f"{stem}.score_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Score report written to {report_path}")
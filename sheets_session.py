@@ -0,0 +1,80 @@
+import logging
+import threading
+import gspread
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+class SheetsSession:
+    """
+    One authorized gspread client per service account, with cached Spreadsheet and Worksheet handles.
+    The client's AuthorizedSession is a requests.Session, so every call reuses the same
+    keep-alive connection pool and OAuth token instead of re-authorizing per operation.
+    """
+    def __init__(self, credentials_file, pool_size=16):
+        self.credentials_file = credentials_file
+        creds = Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+        self.client = gspread.authorize(creds)
+        # Allow concurrent writers (background sync, worker threads) to keep their connections alive
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.client.session.mount("https://", adapter)
+        self.spreadsheets = {}
+        self.worksheets = {}
+        self.lock = threading.Lock()
+        logging.info(f"Authorized Google Sheets session for {credentials_file}")
+
+    def spreadsheet(self, spreadsheet_id):
+        """Return the cached Spreadsheet handle, opening it on first use."""
+        with self.lock:
+            if spreadsheet_id not in self.spreadsheets:
+                self.spreadsheets[spreadsheet_id] = self.client.open_by_key(spreadsheet_id)
+            return self.spreadsheets[spreadsheet_id]
+
+    def worksheet(self, spreadsheet_id, sheet_name):
+        """Return the cached Worksheet handle; raises gspread.exceptions.WorksheetNotFound like gspread does."""
+        spreadsheet = self.spreadsheet(spreadsheet_id)
+        key = (spreadsheet_id, sheet_name)
+        with self.lock:
+            if key not in self.worksheets:
+                self.worksheets[key] = spreadsheet.worksheet(sheet_name)
+            return self.worksheets[key]
+
+    def add_worksheet(self, spreadsheet_id, title, rows, cols):
+        """Create a worksheet and cache its handle."""
+        spreadsheet = self.spreadsheet(spreadsheet_id)
+        worksheet = spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+        with self.lock:
+            self.worksheets[(spreadsheet_id, title)] = worksheet
+        return worksheet
+
+    def invalidate(self, spreadsheet_id, sheet_name=None):
+        """Drop cached handles, e.g. after a worksheet was deleted or renamed outside this process."""
+        with self.lock:
+            if sheet_name is None:
+                self.spreadsheets.pop(spreadsheet_id, None)
+                for key in [key for key in self.worksheets if key[0] == spreadsheet_id]:
+                    del self.worksheets[key]
+            else:
+                self.worksheets.pop((spreadsheet_id, sheet_name), None)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(credentials_file):
+    """Return the process-wide SheetsSession for a service account file."""
+    with _sessions_lock:
+        if credentials_file not in _sessions:
+            _sessions[credentials_file] = SheetsSession(credentials_file)
+        return _sessions[credentials_file]
+
+def register_session(credentials_file, session):
+    """
+    Use `session` for a service account file instead of authorizing a real one, e.g. an
+    in-memory mock_sheets.InMemorySheetsSession in benchmarks.
+    """
+    with _sessions_lock:
+        _sessions[credentials_file] = session
@@ -0,0 +1,79 @@
+import time
+import threading
+import configs
+import sheets_session
+
+class SheetAppendWriter:
+    """
+    Buffered, append-only writer for a worksheet.
+    Rows are collected in memory and sent with chunked values.append calls (worksheet.append_rows),
+    flushing when the buffer reaches chunk_rows or flush_interval seconds have passed since the last
+    flush. The server appends after the last row of the table, so the cost of a write does not depend
+    on how much history the sheet holds and concurrent writers cannot overwrite each other's rows.
+    """
+    def __init__(self, worksheet, headers=None, chunk_rows=500, flush_interval=10.0):
+        self.worksheet = worksheet
+        self.headers = headers
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.rows_written = 0
+        self.lock = threading.Lock()
+        if headers:
+            self.ensure_headers()
+
+    def ensure_headers(self):
+        """Write the header row if the sheet is empty (reads only row 1)."""
+        if not self.worksheet.row_values(1):
+            self.worksheet.update("A1", [self.headers])
+
+    def append(self, row):
+        """Queue a single row."""
+        self.append_rows([row])
+
+    def append_rows(self, rows):
+        """Queue rows, flushing if the size or time trigger fires."""
+        with self.lock:
+            self.buffer.extend(rows)
+            due = len(self.buffer) >= self.chunk_rows or time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush_if_due(self):
+        """Flush if flush_interval has passed since the last flush (for callers with idle periods)."""
+        with self.lock:
+            due = self.buffer and time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Send every buffered row in chunks of chunk_rows."""
+        with self.lock:
+            while self.buffer:
+                chunk = self.buffer[:self.chunk_rows]
+                self.worksheet.append_rows(
+                    chunk,
+                    value_input_option="RAW",
+                    insert_data_option="INSERT_ROWS",
+                    table_range="A1"
+                )
+                # Only drop rows once they are on the sheet, so a failed flush can be retried
+                del self.buffer[:len(chunk)]
+                self.rows_written += len(chunk)
+            self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+def open_writer(sheet_name, headers=None, **kwargs):
+    """Return a SheetAppendWriter for a worksheet of the configured spreadsheet."""
+    google_sheet_info = configs.event["google_sheet"]
+    worksheet = sheets_session.get_session(google_sheet_info["credentials_file"]).worksheet(
+        google_sheet_info["spreadsheet_id"],
+        sheet_name
+    )
+    return SheetAppendWriter(worksheet, headers, **kwargs)